@@ -6,16 +6,32 @@ from states.params import Params
 
 from states.interfaces import AgentI, RouterI
 from contracts.types import BuyerWallet, Tokens
+from contracts.wallet_store import WalletStore
+from states.errors import BurnWrongTokenError, NegativeCirculatingSupplyError
 
 from agents.oracle import Oracle
+from utils import abm
 
 
 class BuyerAgent(mesa.Agent, AgentI):
-    def __init__(self, unique_id: int, name: str, router: RouterI, model):
+    def __init__(
+        self,
+        unique_id: int,
+        name: str,
+        router: RouterI,
+        model,
+        denom: str = "ETH",
+        wallet_store: WalletStore = None,
+    ):
+        """
+        :param denom: VA denom the buyer pays with
+        :param wallet_store: table holding the wallet, shared with the model's other agents
+        """
         super().__init__(unique_id, model)
 
         self._name = name
-        self._wallet = BuyerWallet(name)
+        self._denom = denom
+        self._wallet = BuyerWallet(name, wallet_store)
         self._type = "Buyer"
         self._router = router
 
@@ -23,6 +39,7 @@ class BuyerAgent(mesa.Agent, AgentI):
         self.staked_usd = Decimal("nan")
         self.redeemed_usd = Decimal("nan")
         self.apy = Decimal("nan")
+        self.accrued_fees = Decimal("nan")
 
         # Used in model
         self._bought = False
@@ -30,6 +47,11 @@ class BuyerAgent(mesa.Agent, AgentI):
         self.spent_eth_usd = Decimal(0)
         self.redeemed_eth_usd = Decimal(0)
         self.remaining_vouchers = Decimal(0)
+        # USD the vouchers held would redeem now; quoted by the model when it collects
+        self.redeemable_usd = Decimal(0)
+
+        # price of the current step; prices only change between steps
+        self._price = Oracle.get_price_of(denom)
 
     def initiate_with(self, denom):
         self._wallet.initiate_with(denom)
@@ -52,35 +74,93 @@ class BuyerAgent(mesa.Agent, AgentI):
     def receives(self, tokens):
         if tokens.denom[0] == "<":
             self.remaining_vouchers += tokens.amount
-        if tokens.denom == "ETH":
-            self.redeemed_eth_usd += tokens.amount * Oracle.get_price_of("ETH")
+            # a parked buyer may get vouchers back (e.g. from a reverted redemption) that it could redeem
+            if isinstance(self.model.schedule, abm.SampledActivation):
+                self.model.schedule.activate(self)
+        if tokens.denom == self._denom:
+            self.redeemed_eth_usd += tokens.amount * Oracle.get_price_of(self._denom)
         self._wallet.receives(tokens)
 
     def sends(self, tokens):
         if tokens.denom[0] == "<":
             self.remaining_vouchers -= tokens.amount
-        if tokens.denom == "ETH":
-            self.spent_eth_usd += tokens.amount * Oracle.get_price_of("ETH")
+        if tokens.denom == self._denom:
+            self.spent_eth_usd += tokens.amount * self._price
         self._wallet.sends(tokens)
 
     # Agent is activated with 50% chance
     def step(self):
-        price = Oracle.get_price_of("ETH")
+        price = self._price = Oracle.get_price_of(self._denom)
 
         # With 50% chance (and if applicable), Buyer redeems instead of buying
         if self._bought:
             if random.choice([True, False]):
-                redeemable = self._wallet.redeemable_balance(price)
-                if redeemable:
-                    # redeem some portion of VC tokens
-                    redeem_vc = redeemable.times(Decimal(random.random()))
-                    self.sends(redeem_vc)
-                    self._router.process_buyer_redeem_request(self, redeem_vc)
+                self._redeem(price)
         if random.choice([True, False]) or self.reached_buying_cap():
             return
+        self._buy(price)
+
+    def redeem(self):
+        """Redeem a random portion of a voucher lot that is in the money, if any"""
+        self._redeem(self._update_price())
+
+    def buy(self):
+        """Buy a random amount, up to the buy cap, unless the buying cap was reached"""
+        if not self.reached_buying_cap():
+            self._buy(self._update_price())
+
+    def coins(self) -> int:
+        """Coins step() flips that can lead to a request: redeem once bought, buy until capped"""
+        return int(self._bought) + int(not self.reached_buying_cap())
+
+    def act(self, heads):
+        """step(), with the outcome of the coins counted by coins(), in the same order"""
+        price = self._update_price()
+        heads = iter(heads)
+        if self._bought and next(heads):
+            self._redeem(price)
+        if not self.reached_buying_cap() and next(heads):
+            self._buy(price)
+
+    def dormant_until(self):
+        """
+        A capped buyer can only redeem, so it cannot act until the price reaches its cheapest voucher.
+
+        :return: ("price", denom) trigger and that voucher price, or None while the buyer can act
+        """
+        if not self.reached_buying_cap():
+            return
+        price = Oracle.get_price_of(self._denom)
+        if self._wallet.redeemable_balance(price):
+            return
+        cheapest = self._wallet.cheapest_voucher_price()
+        # without vouchers, it never acts again
+        return ("price", self._denom), cheapest if cheapest is not None else Decimal("infinity")
+
+    def _update_price(self) -> Decimal:
+        self._price = Oracle.get_price_of(self._denom)
+        return self._price
+
+    def _redeem(self, price: Decimal):
+        redeemable = self._wallet.redeemable_balance(price)
+        if redeemable:
+            # redeem some portion of VC tokens
+            redeem_vc = redeemable.times(Decimal(random.random()))
+            self.sends(redeem_vc)
+            try:
+                self._router.process_buyer_redeem_request(self, redeem_vc)
+            except (NegativeCirculatingSupplyError, BurnWrongTokenError):
+                # rejected before the router changed any state: the vouchers come back
+                self.receives(redeem_vc)
+                raise
+
+    def _buy(self, price: Decimal):
         self._bought = True
         buy_amount = Decimal(random.uniform(0, float(Params.buy_cap())))
-        buy_va = Tokens(buy_amount, "ETH")
-        # send ETH to pool
+        if self._denom != "ETH":
+            # buy cap is denominated in ETH
+            buy_amount = buy_amount * Oracle.get_price_of("ETH") / price
+        buy_va = Tokens(buy_amount, self._denom)
+        # send VA to pool
         self.sends(buy_va)
         self._router.process_buyer_buy_request(self, buy_va)
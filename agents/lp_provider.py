@@ -6,13 +6,24 @@ from states.params import Params
 from states.interfaces import WalletI, RouterI, AgentI
 
 from contracts.types import Wallet, Tokens
+from contracts.wallet_store import WalletStore
 
 
 class ProviderAgent(mesa.Agent, AgentI):
-    def __init__(self, unique_id: int, name: str, router: RouterI, model):
+    def __init__(
+        self,
+        unique_id: int,
+        name: str,
+        router: RouterI,
+        model,
+        wallet_store: WalletStore = None,
+    ):
+        """
+        :param wallet_store: table holding the wallet, shared with the model's other agents
+        """
         super().__init__(unique_id, model)
         self._name = name
-        self._wallet = Wallet(name)
+        self._wallet = Wallet(name, wallet_store)
         self._type = "Provider"
         self._router = router
 
@@ -20,10 +31,10 @@ class ProviderAgent(mesa.Agent, AgentI):
         self.spent_eth_usd = Decimal("nan")
         self.redeemed_eth_usd = Decimal("nan")
         self.remaining_vouchers = Decimal("nan")
+        self.redeemable_usd = Decimal("nan")
 
         # Used in model
         self._staked = False
-        self.staked_usd = Decimal(0)
         self.redeemed_usd = Decimal(0)
 
     def initiate_with(self, denom):
@@ -41,10 +52,20 @@ class ProviderAgent(mesa.Agent, AgentI):
     def wallet(self):
         return self._wallet
 
+    @property
+    def staked_usd(self):
+        """Everything sent from the provider's unlimited USDC"""
+        return self._wallet.outflow("USDC")
+
+    @property
+    def accrued_fees(self):
+        """Fees earned by the provider's LP tokens and not yet redeemed"""
+        return self._router.accrued_fees(self)
+
     @property
     def apy(self):
         redeemable = self._router.dry_run_redeem_lp(
-            Tokens(self._wallet.balance_of("LP"), "LP")
+            Tokens(self._wallet.balance_of("LP"), "LP"), self
         )
         if self.staked_usd.is_zero():
             return Decimal(0)
@@ -57,8 +78,6 @@ class ProviderAgent(mesa.Agent, AgentI):
         self._wallet.receives(tokens)
 
     def sends(self, tokens):
-        if tokens.denom == "USDC":
-            self.staked_usd += tokens.amount
         self._wallet.sends(tokens)
 
     # Agent instance is activated with 50% chance
@@ -66,17 +85,59 @@ class ProviderAgent(mesa.Agent, AgentI):
         # With 50% chance, Provider redeems instead of providing
         if self._staked:
             if random.choice([True, False]):
-                redeemable = self._wallet.balance_of("LP")
-                if not redeemable.is_zero():
-                    redeem = Tokens(redeemable, "LP")
-                    # redeem some portion of LP tokens
-                    redeem_lp = redeem.times(Decimal(random.random()))
-                    self.sends(redeem_lp)
-                    self._router.process_lp_provider_redeem_request(self, redeem_lp)
+                self._redeem()
         if not self._router.is_accepting_liquidity:
             return
         if random.choice([True, False]):
             return
+        self._stake()
+
+    def redeem(self):
+        """Redeem a random portion of the provider's LP tokens, if any"""
+        self._redeem()
+
+    def provide(self):
+        """Stake a random amount, up to the stake cap, if the router accepts liquidity"""
+        if self._router.is_accepting_liquidity:
+            self._stake()
+
+    def coins(self) -> int:
+        """
+        Coins step() flips that can lead to a request: redeem once staked, and stake.
+        Staking is counted while liquidity is not accepted too if the provider has staked,
+        as its own redemption may reopen it before the stake coin is flipped.
+        """
+        return int(self._staked) + int(self._staked or self._router.is_accepting_liquidity)
+
+    def act(self, heads):
+        """step(), with the outcome of the coins counted by coins(), in the same order"""
+        heads = iter(heads)
+        if self._staked and next(heads):
+            self._redeem()
+        if next(heads, False) and self._router.is_accepting_liquidity:
+            self._stake()
+
+    def dormant_until(self):
+        """
+        A provider that never staked can only stake, so it cannot act until the router accepts liquidity again.
+        The model checks that trigger at the start of every step.
+
+        :return: ("liquidity", 0) trigger, or None while the provider can act
+        """
+        if self._staked or self._router.is_accepting_liquidity:
+            return
+        return "liquidity", 0
+
+    def _redeem(self):
+        redeemable = self._wallet.balance_of("LP")
+        if not redeemable.is_zero():
+            redeem = Tokens(redeemable, "LP")
+            # redeem some portion of LP tokens
+            redeem_lp = redeem.times(Decimal(random.random()))
+            self.sends(redeem_lp)
+            self._router.process_lp_provider_redeem_request(self, redeem_lp)
+
+    def _stake(self):
         self._staked = True
         stake_amount = Decimal(random.uniform(0, float(Params.stake_cap())))
         stake_sa = Tokens(stake_amount, "USDC")
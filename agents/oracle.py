@@ -1,7 +1,11 @@
 import mesa
 from decimal import Decimal
+from typing import Sequence
+
+import numpy as np
 
 from utils import processlogger
+from utils.gas_meter import GasMeter
 from states.events import Events
 from states.interfaces import TokenI
 from contracts.types import Tokens
@@ -12,8 +16,15 @@ logger = processlogger.ProcessLogger()
 
 
 class Oracle(mesa.Agent):
-    _initial_prices = {"ETH": dec(1337), "USDC": dec(1)}
-    _prices = {"ETH": dec(1337), "USDC": dec(1)}
+    _initial_prices = {
+        "ETH": dec(1337),
+        "USDC": dec(1),
+        "BTC": dec(20000),
+        "SOL": dec(40),
+    }
+    _prices = dict(_initial_prices)
+    # bumped by every price change, so readers can tell when values derived from prices are stale
+    _version = 0
 
     def __init__(self, model):
         super().__init__(-1, model)
@@ -22,16 +33,31 @@ class Oracle(mesa.Agent):
         """
         TODO: price modifying logic goes here
         """
-        Oracle._prices = Oracle._initial_prices
+        Oracle._prices = dict(Oracle._initial_prices)
+        Oracle._version += 1
+
+    @staticmethod
+    def set_price(val, denom: str = "ETH"):
+        # an unchanged price keeps the version, so derived values survive a path that holds still
+        if Oracle._prices.get(denom) != val:
+            Oracle._prices[denom] = val
+            Oracle._version += 1
 
     @staticmethod
-    def set_price(val):
-        Oracle._prices["ETH"] = val
+    def version() -> int:
+        return Oracle._version
 
     @staticmethod
     def get_price_of(denom: str) -> Decimal:
+        GasMeter.charge("sload")
         return Oracle._prices[denom]
 
+    @staticmethod
+    def get_prices_of(denoms: Sequence[str]) -> np.ndarray:
+        """Price vector for several denoms, so values across assets are a single element-wise product"""
+        GasMeter.charge("sload", len(denoms))
+        return np.array([Oracle._prices[d] for d in denoms], dtype=object)
+
     @staticmethod
     def exchange(src_token: TokenI, target_denom: str) -> TokenI:
         src_amount, src_denom = src_token.decompose()
@@ -42,7 +68,9 @@ class Oracle(mesa.Agent):
 
     @staticmethod
     def reset() -> None:
-        Oracle._prices = Oracle._initial_prices
+        # copy, so later price changes never leak into the initial prices
+        Oracle._prices = dict(Oracle._initial_prices)
+        Oracle._version += 1
 
     """
     Test Methods
@@ -54,3 +82,4 @@ class Oracle(mesa.Agent):
             Events.Test.ChangePrice.fmt(denom, Oracle.get_price_of(denom), price)
         )
         Oracle._prices[denom] = price
+        Oracle._version += 1
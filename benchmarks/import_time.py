@@ -0,0 +1,60 @@
+"""
+Startup cost of the simulation core, as paid by every short-lived sweep worker.
+Each module is imported in a fresh interpreter; exits non-zero if a dependency it must not
+need gets loaded or the median import time exceeds the budget.
+
+    python -m benchmarks.import_time [repeats] [budget_ms]
+"""
+import statistics
+import subprocess
+import sys
+
+# only the notebook displays or plots, so no core module may load these
+DISPLAY = ("IPython", "matplotlib")
+# mesa's package import loads pandas and networkx; everything from the agents up needs mesa,
+# the parameter store does not
+CORE = {
+    "states.params": DISPLAY + ("mesa", "pandas", "networkx"),
+    "contracts.router_factory": DISPLAY,
+    "agents.buyer": DISPLAY,
+    "model": DISPLAY,
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(",".join(m for m in {forbidden!r} if m in sys.modules))
+"""
+
+
+def measure(module: str, forbidden):
+    """:return: (import time in ms, forbidden modules that got loaded)"""
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, forbidden=forbidden)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split("\n")
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.0
+
+    failed = False
+    for module, forbidden in CORE.items():
+        runs = [measure(module, forbidden) for _ in range(repeats)]
+        median = statistics.median(ms for ms, _ in runs)
+        leaked = sorted(set(m for _, loaded in runs for m in loaded))
+        ok = median <= budget_ms and not leaked
+        failed |= not ok
+        print(
+            "{:<26} {:>8.1f} ms  {}".format(
+                module, median, "ok" if ok else "FAIL " + ", ".join(leaked)
+            )
+        )
+    sys.exit(1 if failed else 0)
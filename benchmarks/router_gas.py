@@ -0,0 +1,57 @@
+"""
+Estimated on-chain cost of router designs, ranked by gas per step.
+
+Every design is run on the same seed and price path with the gas meter on; see utils.gas_meter for what is
+counted and DEFAULT_COSTS for the cost table.
+
+    python -m benchmarks.router_gas [n] [steps]
+"""
+import sys
+from typing import Dict
+
+import numpy as np
+
+from contracts.voucher_buckets import TickBuckets
+from model import LifelyPayModel
+from utils.gas_meter import GasMeter
+
+DESIGNS: Dict[str, Dict] = {
+    "baseline": {},
+    "voucher buckets (tick 50)": {"voucher_bucketing": TickBuckets(50)},
+    "netted liquidations": {"net_liquidations": True},
+    "blocks of 20": {"block_size": 20},
+    "ETH + BTC": {"va_denoms": ("ETH", "BTC")},
+}
+
+
+def measure(n: int, steps: int, price_path, costs: Dict[str, int] = None, **design) -> Dict:
+    model = LifelyPayModel(n, seed=0, price_path=price_path, stopping_rules=[], meter_gas=True, **design)
+    while model.running and model.schedule.steps < steps:
+        model.step()
+    return {
+        "steps": model.schedule.steps,
+        "gas_per_step": GasMeter.total(costs) / max(model.schedule.steps, 1),
+        "operations": GasMeter.by_operation(costs),
+    }
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = np.random.default_rng(0)
+    walk = list(1337 * np.exp(np.cumsum(rng.normal(0.002, 0.02, steps))))
+
+    results = {name: measure(n, steps, walk, **design) for name, design in DESIGNS.items()}
+    GasMeter.disable()
+    base = results["baseline"]["gas_per_step"]
+    print("{} agents, {} steps, random walk".format(2 * n, steps))
+    for name, result in sorted(results.items(), key=lambda item: item[1]["gas_per_step"]):
+        per_call = ", ".join(
+            "{} {:,.0f}".format(op, stats["gas_per_call"])
+            for op, stats in sorted(result["operations"].items())
+        )
+        print(
+            "{:<26} {:>13,.0f} gas/step  {:>6.1%}  ({})".format(
+                name, result["gas_per_step"], result["gas_per_step"] / base, per_call
+            )
+        )
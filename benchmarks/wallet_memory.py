@@ -0,0 +1,72 @@
+"""
+Memory held by buyer wallets: the previous per-wallet dicts vs the shared WalletStore.
+
+    python -m benchmarks.wallet_memory [n_buyers] [lots_per_buyer]
+"""
+import random
+import sys
+import tracemalloc
+from collections import defaultdict
+from decimal import Decimal
+
+from contracts.types import BuyerWallet, Tokens
+from contracts.wallet_store import WalletStore
+
+
+class DictWallet:
+    """The previous Wallet layout: three defaultdicts per wallet, keyed by denom strings"""
+
+    def __init__(self, owner: str):
+        self._owner = owner
+        self._funds = defaultdict(Decimal)
+        self._total_spent = defaultdict(Decimal)
+        self._total_redeemed = defaultdict(Decimal)
+
+    def initiate_with(self, denom):
+        self._funds[denom] = Decimal("infinity")
+
+    def receives(self, tokens):
+        amount, denom = tokens.decompose()
+        self._funds[denom] += amount
+
+
+def fill(make_wallet, n_buyers: int, lots: int, prices):
+    wallets = []
+    rng = random.Random(0)
+    for i in range(n_buyers):
+        wallet = make_wallet("DIMWIT-" + str(i))
+        wallet.initiate_with("ETH")
+        for price in rng.sample(prices, lots):
+            # voucher denoms are formatted anew on every mint, as serialize_vouchers does
+            wallet.receives(Tokens(Decimal(rng.random()), "<price-{}>".format(price)))
+        wallets.append(wallet)
+    return wallets
+
+
+def measure(make_wallet, n_buyers: int, lots: int, prices) -> int:
+    tracemalloc.start()
+    wallets = fill(make_wallet, n_buyers, lots, prices)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del wallets
+    return current
+
+
+if __name__ == "__main__":
+    n_buyers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    lots = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    prices = ["{:.2f}".format(1000 + i * 0.37) for i in range(max(lots * 4, 1000))]
+
+    store = WalletStore()
+    results = {
+        "dict wallets": measure(DictWallet, n_buyers, lots, prices),
+        "WalletStore": measure(lambda owner: BuyerWallet(owner, store), n_buyers, lots, prices),
+    }
+    base = results["dict wallets"]
+    print("{} buyers x {} voucher lots".format(n_buyers, lots))
+    for name, size in results.items():
+        print(
+            "{:<14} {:>10.1f} MiB  {:>6.1f} bytes/lot  {:>5.1%}".format(
+                name, size / 2 ** 20, size / (n_buyers * lots), size / base
+            )
+        )
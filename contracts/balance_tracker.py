@@ -2,23 +2,51 @@ from typing import List, Tuple
 from decimal import Decimal
 from math import isclose
 
+import numpy as np
+
 from contracts.types import Tokens
-from states.params import Params
+from states.errors import IncrementalStateMismatchError
+from states.params import ParamsSubscriber
 from states.events import Events
-from states.interfaces import BalanceTrackerI, PoolI, VolatilePoolI, StablePoolI, TokenI
+from states.interfaces import (
+    BalanceTrackerI,
+    PoolI,
+    PoolObserverI,
+    VolatilePoolI,
+    StablePoolI,
+    TokenI,
+)
 from utils import processlogger
+from utils.gas_meter import GasMeter
 from utils.safe_decimals import leq
 from agents.oracle import Oracle
 
 logger = processlogger.ProcessLogger()
 
 
-class BalanceTracker(BalanceTrackerI):
+class BalanceTracker(BalanceTrackerI, PoolObserverI, ParamsSubscriber):
+    """
+    The VA pool value and the target VA value are cached, and recomputed only after the pools notify a change
+    (or, for the VA value, after the Oracle price changed). Between changes they are O(1) reads.
+    """
+
+    # debug mode: cross-check every cached read against a full recomputation from the pools
+    verify = False
+
     def __init__(self, va_pool: VolatilePoolI, sa_pool: StablePoolI, fee_pool: PoolI):
+        self._bind_params()
+
         self._va_pool = va_pool
         self._sa_pool = sa_pool
         self._fee_pool = fee_pool
 
+        # None until computed, and again after a change invalidated it
+        self._va_value_usd = None
+        self._va_value_version = None  # Oracle version the VA value was priced at
+        self._target_va_value_usd = None
+        for pool in (va_pool, sa_pool, fee_pool):
+            pool.add_observer(self)
+
         self._warning = False
         self._count = 200
 
@@ -30,30 +58,74 @@ class BalanceTracker(BalanceTrackerI):
     def warning(self):
         return self._warning
 
+    def on_balance_change(
+        self, pool: PoolI, delta_balance: Decimal, delta_principal: Decimal
+    ) -> None:
+        if pool is self._sa_pool or pool is self._fee_pool:
+            self._target_va_value_usd = None
+        else:
+            self._va_value_usd = None
+
     def va_pool_value_usd(self) -> Decimal:
-        price = Oracle.get_price_of(self._va_pool.denom)
-        return self._va_pool.balance * price
+        GasMeter.charge("sload")
+        if self._va_value_usd is None or self._va_value_version != Oracle.version():
+            # VA balance
+            GasMeter.charge("sload")
+            self._va_value_version = Oracle.version()
+            self._va_value_usd = self._va_pool.balance * Oracle.get_price_of(self._va_pool.denom)
+        elif self.verify:
+            self._check(
+                "VA value",
+                self._va_value_usd,
+                self._va_pool.balance * Oracle.get_price_of(self._va_pool.denom),
+            )
+        return self._va_value_usd
 
     def target_va_pool_value_usd(self) -> Decimal:
         """
         The MINIMUM USD value of the VA Pool for the protocol's total asset value to be exactly at threshold,
         where threshold == principal * theta for some predefined parameter theta (init 1.15)
         """
+        GasMeter.charge("sload")
+        if self._target_va_value_usd is None:
+            # principal, SA and Fee balances
+            GasMeter.charge("sload", 3)
+            self._target_va_value_usd = self._compute_target_va_value_usd()
+        elif self.verify:
+            self._check("target VA value", self._target_va_value_usd, self._compute_target_va_value_usd())
+        return self._target_va_value_usd
+
+    def _compute_target_va_value_usd(self) -> Decimal:
         return max(
             self._sa_pool.principal - self._sa_pool.balance - self._fee_pool.balance,
             Decimal(0),
         )
 
+    def total_asset_value_usd(self) -> Decimal:
+        GasMeter.charge("sload", 2)
+        return self.va_pool_value_usd() + self._sa_pool.balance + self._fee_pool.balance
+
+    @staticmethod
+    def _check(name: str, cached: Decimal, recomputed: Decimal) -> None:
+        if cached != recomputed:
+            raise IncrementalStateMismatchError(name, cached, recomputed)
+
+    def for_asset(self, denom: str) -> BalanceTrackerI:
+        return self
+
     def get_withdraw_amount_per_range(
         self, withdraw_sa: TokenI
     ) -> Tuple[List[TokenI], TokenI]:
-        n_floors = int(Params.n_floors())
+        n_floors = int(self._params.n_floors)
         remaining = withdraw_sa.amount
+        # SA balance and principal, kept in memory for the loop
+        GasMeter.charge("sload", 2)
 
         ceiling = self._sa_pool.balance
         steps = []
 
         for i in range(n_floors - 1, 0, -1):
+            GasMeter.charge("loop")
             # Ensure that length is the same for all withdraw steps
             if leq(remaining, 0):
                 steps.append(Tokens(Decimal(0), self._sa_pool.denom))
@@ -89,6 +161,8 @@ class BalanceTracker(BalanceTrackerI):
         For the model, the rebalance method is called at the end of every e2e router transaction.
         In practice, polling would have to occur much more frequently (and probably done off-chain)
         """
+        # warning state, countdown and VA balance
+        GasMeter.charge("sload", 3)
         target_va_price_usd = (
             self.target_va_pool_value_usd() / self._va_pool.balance
             if not self._va_pool.balance.is_zero()
@@ -97,8 +171,8 @@ class BalanceTracker(BalanceTrackerI):
 
         actual_va_price_usd = Oracle.get_price_of(self._va_pool.denom)
 
-        tolerant_level = self._sa_pool.principal * Params.tolerance()
-        content_level = self._sa_pool.principal * Params.content()
+        tolerant_level = self._sa_pool.principal * self._params.tolerance
+        content_level = self._sa_pool.principal * self._params.content
         threshold = Decimal("1.1111111")
 
         # Case 1 (EMERGENCY): Convert all remaining VA to SA =>
@@ -112,6 +186,7 @@ class BalanceTracker(BalanceTrackerI):
             actual_va_price_usd, target_va_price_usd * threshold
         ):
             self.num_triggered += 1
+            GasMeter.charge("sstore", 2)
             self._warning = True
             self._count = 200
             logger.warning(
@@ -137,15 +212,15 @@ class BalanceTracker(BalanceTrackerI):
                 )
             )
 
-            can_liquidate_va = Tokens(self._va_pool.balance, "ETH")
-            can_liquidate_sa = Oracle.exchange(can_liquidate_va, "USDC")
+            can_liquidate_va = Tokens(self._va_pool.balance, self._va_pool.denom)
+            can_liquidate_sa = Oracle.exchange(can_liquidate_va, self._sa_pool.denom)
 
             to_refill_sa = Tokens(
                 min(can_liquidate_sa.amount, content_level - self._sa_pool.balance),
-                "USDC",
+                self._sa_pool.denom,
             )
 
-            to_refill_va = Oracle.exchange(to_refill_sa, "ETH")
+            to_refill_va = Oracle.exchange(to_refill_sa, self._va_pool.denom)
 
             self._va_pool.liquidate(to_refill_va)
             self._sa_pool.deposit(to_refill_sa, protocol_injected=True)
@@ -157,7 +232,9 @@ class BalanceTracker(BalanceTrackerI):
         #   but protocol balances are stabilized (negation of trigger condition),
         #   then turn off warning iff mandatory count since trigger has been reached
         elif self._warning and actual_va_price_usd > target_va_price_usd * threshold:
+            GasMeter.charge("sstore")
             self._warning = self._count > 0
+        GasMeter.charge("sstore")
         self._count -= 1
 
     def _total_assets_list_usd(self) -> List[Decimal]:
@@ -171,10 +248,173 @@ class BalanceTracker(BalanceTrackerI):
         liq_va = Tokens(self._va_pool.balance, self._va_pool.denom)
         self._va_pool.liquidate(liq_va)
         # sell assets at a discount as incentive
-        deposit_va = liq_va.times(1 - Params.liquidation_spread())
+        deposit_va = liq_va.times(1 - self._params.liquidation_spread)
         deposit_sa = Oracle.exchange(deposit_va, self._sa_pool.denom)
         self._sa_pool.deposit(deposit_sa, protocol_injected=True)
 
         # total_fees = Tokens(self._fee_pool.balance, "USDC")
         # self._fee_pool.withdraw(total_fees)
         # self._sa_pool.deposit(total_fees, protocol_injected=True)
+
+
+class MultiAssetBalanceTracker(BalanceTracker):
+    """
+    Combined balance check for several VA pools backed by a single SA pool and Fee pool.
+    VA values are one element-wise product of the pool balance vector and the Oracle's price vector,
+    so cost grows linearly with the number of assets. The vector is cached like the single VA value.
+    """
+
+    def __init__(
+        self, va_pools: List[VolatilePoolI], sa_pool: StablePoolI, fee_pool: PoolI
+    ):
+        super().__init__(va_pools[0], sa_pool, fee_pool)
+        self._va_pools = va_pools
+        self._va_denoms = [pool.denom for pool in va_pools]
+        self._views = {
+            pool.denom: AssetBalanceView(self, i) for i, pool in enumerate(va_pools)
+        }
+
+        self._va_values_usd = None
+        self._va_values_version = None
+        self._va_ids = {id(pool) for pool in va_pools}
+        # the first VA pool is already observed by BalanceTracker
+        for pool in va_pools[1:]:
+            pool.add_observer(self)
+
+    def on_balance_change(
+        self, pool: PoolI, delta_balance: Decimal, delta_principal: Decimal
+    ) -> None:
+        if id(pool) in self._va_ids:
+            self._va_values_usd = None
+        else:
+            super().on_balance_change(pool, delta_balance, delta_principal)
+
+    def va_pool_values_usd(self) -> np.ndarray:
+        GasMeter.charge("sload", len(self._va_pools))
+        if self._va_values_usd is None or self._va_values_version != Oracle.version():
+            # VA balances
+            GasMeter.charge("loop", len(self._va_pools))
+            GasMeter.charge("sload", len(self._va_pools))
+            self._va_values_version = Oracle.version()
+            self._va_values_usd = self._compute_va_values_usd()
+        elif self.verify:
+            for i, (cached, recomputed) in enumerate(zip(self._va_values_usd, self._compute_va_values_usd())):
+                self._check(self._va_denoms[i] + " value", cached, recomputed)
+        return self._va_values_usd
+
+    def _compute_va_values_usd(self) -> np.ndarray:
+        balances = np.array([pool.balance for pool in self._va_pools], dtype=object)
+        return balances * Oracle.get_prices_of(self._va_denoms)
+
+    def va_pool_value_usd(self) -> Decimal:
+        return self.va_pool_values_usd().sum()
+
+    def for_asset(self, denom: str) -> BalanceTrackerI:
+        return self._views[denom]
+
+    def rebalance(self) -> None:
+        """
+        Same three cases as BalanceTracker.rebalance, evaluated on the combined VA value instead of a single price:
+        actual price <= target price * threshold is equivalent to VA value <= target value * threshold.
+        Refills liquidate every VA pool pro rata to its USD value.
+        """
+        # warning state and countdown
+        GasMeter.charge("sload", 2)
+        values = self.va_pool_values_usd()
+        va_value_usd = values.sum()
+        target_va_value_usd = self.target_va_pool_value_usd()
+
+        tolerant_level = self._sa_pool.principal * self._params.tolerance
+        content_level = self._sa_pool.principal * self._params.content
+        threshold = Decimal("1.1111111")
+
+        # an empty VA pool has a target price of 0, which never triggers (as in the single-asset case)
+        below_threshold = not va_value_usd.is_zero() and leq(
+            va_value_usd, target_va_value_usd * threshold
+        )
+
+        if not self._warning and below_threshold:
+            self.num_triggered += 1
+            GasMeter.charge("sstore", 2)
+            self._warning = True
+            self._count = 200
+            logger.warning(
+                Events.Balancer.TriggerEmergencyProtocol.fmt(
+                    self._total_assets_list_usd(),
+                    self._sa_pool.principal,
+                    va_value_usd,
+                    target_va_value_usd,
+                )
+            )
+            return self._trigger_danger_protocol()
+
+        elif leq(self._sa_pool.balance, tolerant_level):
+            self.num_rebalanced += 1
+            logger.warning(
+                Events.Balancer.Rebalacing.fmt(
+                    self._sa_pool.balance, tolerant_level, content_level
+                )
+            )
+            if va_value_usd.is_zero():
+                return
+            to_refill_usd = min(va_value_usd, content_level - self._sa_pool.balance)
+            for pool in self._va_pools:
+                if pool.balance.is_zero():
+                    continue
+                pool.liquidate(
+                    Tokens(pool.balance * to_refill_usd / va_value_usd, pool.denom)
+                )
+            self._sa_pool.deposit(
+                Tokens(to_refill_usd, self._sa_pool.denom), protocol_injected=True
+            )
+            return
+
+        elif self._warning and not below_threshold:
+            GasMeter.charge("sstore")
+            self._warning = self._count > 0
+        GasMeter.charge("sstore")
+        self._count -= 1
+
+    def _trigger_danger_protocol(self) -> None:
+        """Liquidates EVERY VA pool to the SA Pool, at the liquidation spread"""
+        for pool in self._va_pools:
+            liq_va = Tokens(pool.balance, pool.denom)
+            pool.liquidate(liq_va)
+            deposit_va = liq_va.times(1 - self._params.liquidation_spread)
+            deposit_sa = Oracle.exchange(deposit_va, self._sa_pool.denom)
+            self._sa_pool.deposit(deposit_sa, protocol_injected=True)
+
+
+class AssetBalanceView(BalanceTrackerI):
+    """
+    One asset's share of a MultiAssetBalanceTracker, handed to that asset's InflationTracker.
+    The combined target is split across assets in proportion to their USD value,
+    so each asset's surplus is its pro rata share of the combined surplus.
+    """
+
+    def __init__(self, bt: MultiAssetBalanceTracker, index: int):
+        self._bt = bt
+        self._index = index
+
+    @property
+    def warning(self):
+        return self._bt.warning
+
+    def rebalance(self) -> None:
+        self._bt.rebalance()
+
+    def va_pool_value_usd(self) -> Decimal:
+        return self._bt.va_pool_values_usd()[self._index]
+
+    def target_va_pool_value_usd(self) -> Decimal:
+        values = self._bt.va_pool_values_usd()
+        va_value_usd = values.sum()
+        if va_value_usd.is_zero():
+            return self._bt.target_va_pool_value_usd()
+        return self._bt.target_va_pool_value_usd() * values[self._index] / va_value_usd
+
+    def total_asset_value_usd(self) -> Decimal:
+        return self._bt.total_asset_value_usd()
+
+    def for_asset(self, denom: str) -> BalanceTrackerI:
+        return self._bt.for_asset(denom)
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from states.interfaces import PoolI, PoolObserverI, TokenContractI
+from utils.gas_meter import GasMeter
+
+ZERO = Decimal(0)
+
+
+class FeeAccumulator(PoolObserverI):
+    """
+    MasterChef-style fee accounting for LP shares.
+
+    Every fee deposited to the Fee pool raises fee_per_share by fee / LP supply.
+    A holder's debt is shares * fee_per_share as of its last deposit or withdrawal, so what it has accrued since is
+    shares * fee_per_share - debt: O(1) per holder, however many fees were collected in between.
+    Fees accrue to every LP holder, the protocol's initial liquidity included.
+    """
+
+    def __init__(self, fee_pool: PoolI, lp_tc: TokenContractI):
+        self._lp_tc = lp_tc
+        self.fee_per_share = ZERO
+        self._shares: Dict[str, Decimal] = defaultdict(Decimal)
+        self._debt: Dict[str, Decimal] = defaultdict(Decimal)
+        # accrued before the last deposit / withdrawal, not yet paid
+        self._settled: Dict[str, Decimal] = defaultdict(Decimal)
+        self._paid: Dict[str, Decimal] = defaultdict(Decimal)
+        # per holder, (fee_per_share, fees paid) at every withdrawal
+        self._history: Dict[str, List[Tuple[Decimal, Decimal]]] = defaultdict(list)
+        fee_pool.add_observer(self)
+
+    def on_balance_change(
+        self, pool: PoolI, delta_balance: Decimal, delta_principal: Decimal
+    ) -> None:
+        # payouts are already accounted for in the holders' debt
+        if delta_balance <= 0:
+            return
+        supply = self._lp_tc.get_token_issued("LP")
+        # LP supply and fee_per_share
+        GasMeter.charge("sload", 2)
+        if not supply.is_zero():
+            GasMeter.charge("sstore")
+            self.fee_per_share += delta_balance / supply
+
+    def _settle(self, holder: str) -> None:
+        # fee_per_share, and the holder's shares, debt and settled fees
+        GasMeter.charge("sload", 4)
+        GasMeter.charge("sstore")
+        self._settled[holder] += self._shares[holder] * self.fee_per_share - self._debt[holder]
+
+    def deposit(self, holder: str, shares: Decimal) -> None:
+        """Called when LP tokens are minted to holder"""
+        self._settle(holder)
+        GasMeter.charge("sstore", 2)
+        self._shares[holder] += shares
+        self._debt[holder] = self._shares[holder] * self.fee_per_share
+
+    def withdraw(self, holder: str, shares: Decimal) -> Decimal:
+        """
+        Called when holder redeems LP tokens. Harvests everything accrued, as MasterChef does on withdrawal.
+
+        :return: fees to pay out
+        """
+        self._settle(holder)
+        # settled, paid, shares and debt
+        GasMeter.charge("sstore", 4)
+        fees = self._settled[holder]
+        self._settled[holder] = ZERO
+        self._paid[holder] += fees
+        self._history[holder].append((self.fee_per_share, fees))
+        self._shares[holder] -= shares
+        self._debt[holder] = self._shares[holder] * self.fee_per_share
+        return fees
+
+    def accrued(self, holder: str) -> Decimal:
+        """Fees earned and not yet paid"""
+        return (
+            self._settled[holder]
+            + self._shares[holder] * self.fee_per_share
+            - self._debt[holder]
+        )
+
+    def paid(self, holder: str) -> Decimal:
+        return self._paid[holder]
+
+    def history(self, holder: str) -> List[Tuple[Decimal, Decimal]]:
+        return self._history[holder]
@@ -0,0 +1,97 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import Mock
+
+from contracts import pool_factory, token_contract
+from contracts.fee_accumulator import FeeAccumulator
+from contracts.types import Tokens
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestFeeAccumulator(unittest.TestCase):
+    def setUp(self):
+        self.fee_pool = pool_factory.FeePool("USDC")
+        self.lp_tc = token_contract.LPTokenContract()
+        self.fees = FeeAccumulator(self.fee_pool, self.lp_tc)
+
+    def stake(self, holder: str, shares) -> None:
+        """Mint LP to holder and register the shares, as the Router does when a provider stakes"""
+        self.lp_tc.mint_to(Mock(), Tokens(Decimal(shares), "LP"))
+        self.fees.deposit(holder, Decimal(shares))
+
+    def unstake(self, holder: str, shares) -> Decimal:
+        """Harvest and burn, as the Router does when a provider redeems LP"""
+        paid = self.fees.withdraw(holder, Decimal(shares))
+        self.lp_tc.burn(Tokens(Decimal(shares), "LP"))
+        return paid
+
+    def collect(self, amount) -> None:
+        self.fee_pool.deposit(Tokens(Decimal(amount), "USDC"))
+
+    def test_fees_accrue_pro_rata(self):
+        self.stake("alice", 100)
+        self.stake("bob", 300)
+        self.collect(40)
+        self.assertEqual(self.fees.fee_per_share, Decimal("0.1"))
+        self.assertEqual(self.fees.accrued("alice"), 10)
+        self.assertEqual(self.fees.accrued("bob"), 30)
+        logger.test("#test_fees_accrue_pro_rata()")
+
+    def test_late_stake_only_earns_later_fees(self):
+        self.stake("alice", 100)
+        self.collect(10)
+        self.stake("bob", 100)
+        self.collect(20)
+        self.assertEqual(self.fees.accrued("alice"), 20)
+        self.assertEqual(self.fees.accrued("bob"), 10)
+        logger.test("#test_late_stake_only_earns_later_fees()")
+
+    def test_restake_keeps_accrued_fees(self):
+        self.stake("alice", 100)
+        self.collect(10)
+        self.stake("alice", 100)
+        self.collect(20)
+        self.assertEqual(self.fees.accrued("alice"), 30)
+        logger.test("#test_restake_keeps_accrued_fees()")
+
+    def test_withdraw_harvests_everything_accrued(self):
+        self.stake("alice", 100)
+        self.stake("bob", 100)
+        self.collect(20)
+
+        # a partial withdrawal still pays what every share accrued
+        paid = self.unstake("alice", 50)
+        self.assertEqual(paid, 10)
+        self.assertEqual(self.fees.accrued("alice"), 0)
+        self.assertEqual(self.fees.paid("alice"), 10)
+        self.assertEqual(self.fees.history("alice"), [(Decimal("0.1"), Decimal(10))])
+
+        # the remaining shares keep earning, at the reduced supply
+        self.collect(15)
+        self.assertEqual(self.fees.accrued("alice"), 5)
+        self.assertEqual(self.fees.accrued("bob"), 20)
+        self.assertEqual(self.unstake("alice", 50), 5)
+        self.assertEqual(self.fees.paid("alice"), 15)
+        self.assertEqual(len(self.fees.history("alice")), 2)
+        logger.test("#test_withdraw_harvests_everything_accrued()")
+
+    def test_payouts_do_not_accrue(self):
+        self.stake("alice", 100)
+        self.collect(10)
+        self.fee_pool.try_withdraw(Tokens(self.unstake("alice", 50), "USDC"))
+        self.assertEqual(self.fees.fee_per_share, Decimal("0.1"))
+        self.assertEqual(self.fees.accrued("alice"), 0)
+        logger.test("#test_payouts_do_not_accrue()")
+
+    def test_fees_without_supply_are_not_accrued(self):
+        self.collect(10)
+        self.assertEqual(self.fees.fee_per_share, 0)
+        self.stake("alice", 100)
+        self.assertEqual(self.fees.accrued("alice"), 0)
+        logger.test("#test_fees_without_supply_are_not_accrued()")
+
+
+if __name__ == "__main__":
+    unittest.main()
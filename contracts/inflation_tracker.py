@@ -1,28 +1,64 @@
 from decimal import Decimal
+from typing import Dict
+
+import numpy as np
 
 from utils import processlogger
+from utils.gas_meter import GasMeter
 from utils.safe_decimals import leq, geq
 from agents.oracle import Oracle
-from states.params import Params
+from states.errors import IncrementalStateMismatchError
+from states.params import ParamsSubscriber
 from states.interfaces import BalanceTrackerI, ERCTokenContractI
 
 logger = processlogger.ProcessLogger()
 
 
-class InflationTracker:
-    def __init__(self, erc_tc: ERCTokenContractI, bt: BalanceTrackerI):
+class InflationTracker(ParamsSubscriber):
+    """
+    Total inflation returns are memoized per voucher denom, along with their running total.
+    A price change recomputes every denom; between price changes, only the denoms minted or burned since the
+    last call are recomputed, and the total is adjusted by their change, so consecutive redemptions within a step
+    cost one term each instead of a full pass.
+    """
+
+    # debug mode: cross-check every memoized total against a full recomputation
+    verify = False
+    # relative tolerance of that check; adjusting the total by differences rounds differently than a full sum
+    VERIFY_TOLERANCE = Decimal("1e-18")
+
+    def __init__(self, erc_tc: ERCTokenContractI, bt: BalanceTrackerI, va_denom="ETH"):
+        """
+        :param bt: balance tracker (or per-asset view of one) for the VA pool backing these vouchers
+        :param va_denom: asset whose price inflation is measured
+        """
+        self._bind_params()
         self._erc_tc = erc_tc
         self._bt = bt
+        self._va_denom = va_denom
+
+        # Oracle and token contract versions the memoized returns were computed at
+        self._price_version = None
+        self._erc_version = None
+        self._returns_per_denom: Dict[str, Decimal] = {}
+        self._returns_usd = Decimal(0)
 
-    @staticmethod
-    def calculate_inflation(og_price: Decimal) -> Decimal:
+    def calculate_inflation(self, og_price: Decimal) -> Decimal:
         """
         Rate of inflation for asset, given original price
 
         :param og_price: original price of the asset
         :return: inflation rate
         """
-        return max((Oracle.get_price_of("ETH") / og_price) - Decimal(1), Decimal(0))
+        return max(
+            (Oracle.get_price_of(self._va_denom) / og_price) - Decimal(1), Decimal(0)
+        )
+
+    def calculate_inflations(self, og_prices: np.ndarray) -> np.ndarray:
+        """calculate_inflation for an array of original prices at once"""
+        return np.maximum(
+            Oracle.get_price_of(self._va_denom) / og_prices - Decimal(1), Decimal(0)
+        )
 
     def calculate_max_redeem_rate(self) -> Decimal:
         """
@@ -38,7 +74,7 @@ class InflationTracker:
         if leq(surplus_balance_usd, 0) or leq(inflation_pool_returns, 0):
             return Decimal(0)
 
-        return min(surplus_balance_usd / inflation_pool_returns, Params.redeem_cap())
+        return min(surplus_balance_usd / inflation_pool_returns, self._params.redeem_cap)
 
     def _get_total_pool_returns_from_inflation_usd(self) -> Decimal:
         """
@@ -47,11 +83,44 @@ class InflationTracker:
 
         :return: inflation returns
         """
-        returns_usd = Decimal(0)
-        for denom in self._erc_tc.tokens_issued:
-            quantity_issued = self._erc_tc.get_token_issued(denom)
-            og_price = self._erc_tc.deserialize_vouchers(denom)
-            returns_usd += self.calculate_inflation(og_price) * (
-                og_price * quantity_issued
+        issued = self._erc_tc.tokens_issued
+        price = Oracle.get_price_of(self._va_denom)
+        # running total
+        GasMeter.charge("sload")
+
+        price_version = Oracle.version()
+        changed = None
+        if price_version == self._price_version:
+            changed = self._erc_tc.changed_since(self._erc_version)
+        if changed is None:
+            # full pass, summed in issue order
+            self._returns_per_denom.clear()
+            self._returns_usd = Decimal(0)
+            changed = issued
+        if changed:
+            GasMeter.charge("loop", len(changed))
+            GasMeter.charge("sload", len(changed))
+            returns_per_denom = self._returns_per_denom
+            returns_usd = self._returns_usd
+            for denom in changed:
+                og_price = self._erc_tc.original_price(denom)
+                returns = max(price / og_price - 1, Decimal(0)) * (og_price * issued[denom])
+                returns_usd += returns - returns_per_denom.get(denom, Decimal(0))
+                returns_per_denom[denom] = returns
+            self._returns_usd = returns_usd
+        self._price_version = price_version
+        self._erc_version = self._erc_tc.version
+
+        if self.verify:
+            self._check()
+        return self._returns_usd
+
+    def _check(self) -> None:
+        recomputed = Decimal(0)
+        for denom, quantity_issued in self._erc_tc.tokens_issued.items():
+            og_price = self._erc_tc.original_price(denom)
+            recomputed += self.calculate_inflation(og_price) * (og_price * quantity_issued)
+        if abs(recomputed - self._returns_usd) > self.VERIFY_TOLERANCE * max(abs(recomputed), Decimal(1)):
+            raise IncrementalStateMismatchError(
+                "inflation returns", self._returns_usd, recomputed
             )
-        return returns_usd
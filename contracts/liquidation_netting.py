@@ -0,0 +1,135 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict
+
+from utils import processlogger
+from utils.gas_meter import GasMeter, metered
+from utils.safe_decimals import lt
+
+from contracts.types import Tokens
+from states.errors import CannotLiquidateEnoughError
+from states.events import Events
+from states.interfaces import PoolI, PoolObserverI, StablePoolI, TokenI, VolatilePoolI
+from states.params import ParamsSubscriber
+
+from agents.oracle import Oracle
+
+logger = processlogger.ProcessLogger()
+
+ZERO = Decimal(0)
+
+
+class LiquidationNetting(PoolObserverI, ParamsSubscriber):
+    """
+    Nets the Router's liquidations over a batch of requests (a model step, or a block).
+
+    While enabled, automated conversions and SA shortfalls do not sell VA as they happen.
+    The VA they need is reserved, i.e. taken out of the VA pool just as a liquidation would,
+    and shortfalls are advanced to the SA Pool right away, so every request completes as before.
+    settle() then repays what it can of the advances from SA deposited later in the batch (e.g. a stake that came
+    after a redemption), returning the matching VA to its pool, and sells the rest in one liquidation per VA pool.
+    The result is what the batch would have done had the SA inflows come first.
+
+    Routine liquidations are valued at the Oracle price by the model, so the spread they would pay is not charged;
+    it is reported instead, at the liquidation spread parameter, on the volume netting avoided.
+    """
+
+    def __init__(self, va_pools: Dict[str, VolatilePoolI], sa_pool: StablePoolI):
+        self._bind_params()
+        self._va_pools = va_pools
+        self._sa_pool = sa_pool
+        self.enabled = False
+
+        # current batch, per VA denom: VA reserved for sale, and SA advanced against it
+        self._reserved: Dict[str, Decimal] = defaultdict(Decimal)
+        self._advanced: Dict[str, Decimal] = defaultdict(Decimal)
+        self._sa_in = ZERO
+        self._legs = 0
+
+        # totals over every settled batch
+        self.num_gross = 0  # liquidations the requests would have made one by one
+        self.num_net = 0  # liquidations executed at settlement
+        self.gross_usd = ZERO
+        self.net_usd = ZERO
+
+        sa_pool.add_observer(self)
+
+    def on_balance_change(
+        self, pool: PoolI, delta_balance: Decimal, delta_principal: Decimal
+    ) -> None:
+        if self.enabled and delta_balance > 0:
+            self._sa_in += delta_balance
+
+    def convert(self, tokens_va: TokenI) -> None:
+        """Defer an automated conversion"""
+        if tokens_va.amount <= 0:
+            return
+        self._reserve(tokens_va)
+
+    def advance(self, va_denom: str, deficit_sa: TokenI) -> None:
+        """Cover an SA shortfall now, to be liquidated from va_denom's pool at settlement"""
+        self._reserve(Oracle.exchange(deficit_sa, va_denom))
+        self._sa_pool.deposit(deficit_sa)
+        # the advance itself is not an SA inflow
+        self._sa_in -= deficit_sa.amount
+        GasMeter.charge("sload")
+        GasMeter.charge("sstore")
+        self._advanced[va_denom] += deficit_sa.amount
+
+    @metered("settle")
+    def settle(self) -> None:
+        """Execute the batch's net liquidations, and start a new batch"""
+        sa_denom = self._sa_pool.denom
+        sa_in = min(self._sa_in, self._sa_pool.balance)
+        executed = 0
+        for denom, pool in self._va_pools.items():
+            GasMeter.charge("loop")
+            GasMeter.charge("sload", 2)
+            reserved = Tokens(self._reserved[denom], denom)
+            if reserved.amount.is_zero():
+                continue
+            repaid = Tokens(min(self._advanced[denom], sa_in), sa_denom)
+            sa_in -= repaid.amount
+            if not repaid.amount.is_zero():
+                self._sa_pool.try_withdraw(repaid)
+                pool.deposit(Oracle.exchange(repaid, denom))
+
+            gross_usd = Oracle.exchange(reserved, sa_denom).amount
+            self.gross_usd += gross_usd
+            self.net_usd += gross_usd - repaid.amount
+            if lt(repaid.amount, gross_usd):
+                # sold to an exchange
+                GasMeter.charge("transfer")
+                executed += 1
+
+        if self._legs:
+            logger.info(Events.Router.NettedLiquidations.fmt(self._legs, executed))
+        self.num_gross += self._legs
+        self.num_net += executed
+        self._reserved.clear()
+        self._advanced.clear()
+        self._sa_in = ZERO
+        self._legs = 0
+
+    def _reserve(self, tokens_va: TokenI) -> None:
+        pool = self._va_pools[tokens_va.denom]
+        # fail as the liquidation would have
+        if lt(pool.balance, tokens_va.amount):
+            raise CannotLiquidateEnoughError(tokens_va.amount, pool.balance, pool.denom)
+        pool.try_withdraw(tokens_va)
+        GasMeter.charge("sload")
+        GasMeter.charge("sstore")
+        self._reserved[tokens_va.denom] += tokens_va.amount
+        self._legs += 1
+
+    @property
+    def num_saved(self) -> int:
+        return self.num_gross - self.num_net
+
+    @property
+    def volume_saved_usd(self) -> Decimal:
+        return self.gross_usd - self.net_usd
+
+    @property
+    def spread_saved_usd(self) -> Decimal:
+        return self.volume_saved_usd * self._params.liquidation_spread
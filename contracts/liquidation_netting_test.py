@@ -0,0 +1,108 @@
+import unittest
+from decimal import Decimal
+
+from agents.oracle import Oracle
+from contracts import pool_factory
+from contracts.liquidation_netting import LiquidationNetting
+from contracts.types import Tokens
+from model import LifelyPayModel
+from states.errors import CannotLiquidateEnoughError
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestLiquidationNetting(unittest.TestCase):
+    def setUp(self):
+        Params.hard_reset()
+        Oracle._force_change_price_to(Decimal(1000), "ETH")
+        self.va_pool = pool_factory.VolatilePool("ETH")
+        self.va_pool.deposit(Tokens(Decimal(10), "ETH"))
+        self.sa_pool = pool_factory.StablePool("USDC")
+        self.sa_pool.deposit(Tokens(Decimal(1000), "USDC"), protocol_injected=True)
+        self.netting = LiquidationNetting({"ETH": self.va_pool}, self.sa_pool)
+        self.netting.enabled = True
+
+    def tearDown(self) -> None:
+        Oracle.reset()
+
+    def test_conversion_is_sold_at_settlement(self):
+        self.netting.convert(Tokens(Decimal(2), "ETH"))
+        # reserved right away, as the liquidation would have taken it
+        self.assertEqual(self.va_pool.balance, 8)
+        self.assertEqual(self.netting.num_net, 0)
+
+        self.netting.settle()
+        self.assertEqual(self.va_pool.balance, 8)
+        self.assertEqual(self.netting.num_gross, 1)
+        self.assertEqual(self.netting.num_net, 1)
+        self.assertEqual(self.netting.gross_usd, 2000)
+        self.assertEqual(self.netting.volume_saved_usd, 0)
+        logger.test("#test_conversion_is_sold_at_settlement()")
+
+    def test_advance_is_repaid_by_later_inflow(self):
+        self.netting.advance("ETH", Tokens(Decimal(500), "USDC"))
+        self.assertEqual(self.sa_pool.balance, 1500)
+        self.assertEqual(self.va_pool.balance, Decimal("9.5"))
+
+        # a stake later in the batch covers the whole shortfall
+        self.sa_pool.deposit(Tokens(Decimal(500), "USDC"))
+        self.netting.settle()
+        self.assertEqual(self.sa_pool.balance, 1500)
+        self.assertEqual(self.va_pool.balance, 10)
+        self.assertEqual(self.netting.num_net, 0)
+        self.assertEqual(self.netting.num_saved, 1)
+        self.assertEqual(self.netting.volume_saved_usd, 500)
+        self.assertEqual(
+            self.netting.spread_saved_usd, 500 * Params.snapshot().liquidation_spread
+        )
+        logger.test("#test_advance_is_repaid_by_later_inflow()")
+
+    def test_partial_repay_sells_the_rest(self):
+        self.netting.advance("ETH", Tokens(Decimal(500), "USDC"))
+        self.sa_pool.deposit(Tokens(Decimal(200), "USDC"))
+        self.netting.settle()
+        self.assertEqual(self.sa_pool.balance, 1500)
+        self.assertEqual(self.va_pool.balance, Decimal("9.7"))
+        self.assertEqual(self.netting.num_net, 1)
+        self.assertEqual(self.netting.net_usd, 300)
+        self.assertEqual(self.netting.volume_saved_usd, 200)
+        logger.test("#test_partial_repay_sells_the_rest()")
+
+    def test_inflow_anywhere_in_the_batch_repays(self):
+        # settled as if the batch's SA inflows came first
+        self.sa_pool.deposit(Tokens(Decimal(200), "USDC"))
+        self.netting.advance("ETH", Tokens(Decimal(500), "USDC"))
+        self.netting.settle()
+        self.assertEqual(self.netting.volume_saved_usd, 200)
+
+        # a new batch starts empty
+        self.netting.settle()
+        self.assertEqual(self.netting.num_gross, 1)
+        self.assertEqual(self.netting.volume_saved_usd, 200)
+        logger.test("#test_inflow_anywhere_in_the_batch_repays()")
+
+    def test_reserve_beyond_pool_fails_like_liquidation(self):
+        with self.assertRaises(CannotLiquidateEnoughError):
+            self.netting.convert(Tokens(Decimal(11), "ETH"))
+        self.assertEqual(self.va_pool.balance, 10)
+        self.netting.settle()
+        self.assertEqual(self.netting.num_gross, 0)
+        logger.test("#test_reserve_beyond_pool_fails_like_liquidation()")
+
+
+class TestNettedModel(unittest.TestCase):
+    def tearDown(self) -> None:
+        Oracle.reset()
+
+    def test_only_sales_are_deferred(self):
+        model = LifelyPayModel(2, seed=0, stopping_rules=[], net_liquidations=True)
+        self.assertTrue(model.router.liquidation_netting.enabled)
+        # emergency and refill checks still follow every request
+        self.assertTrue(model.router.auto_rebalance)
+        logger.test("#test_only_sales_are_deferred()")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,282 @@
+import random
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Sequence
+
+from utils import processlogger
+
+from states.errors import BurnWrongTokenError, NegativeCirculatingSupplyError
+from states.events import Events
+from states.interfaces import AgentI, RouterI, TokenI
+
+from agents.oracle import Oracle
+
+logger = processlogger.ProcessLogger()
+
+BUY, REDEEM, PROVIDE, LP_REDEEM = "buy", "redeem", "provide", "lp_redeem"
+
+
+@dataclass
+class Request:
+    seq: int
+    kind: str
+    agent: AgentI
+    tokens: TokenI
+    # fee bid; protocol fees are proportional to value, so this is the request's USD value
+    fee: Decimal
+    submitted_block: int
+    included_block: Optional[int] = field(default=None)
+
+
+def fifo(pending: List[Request]) -> List[Request]:
+    return sorted(pending, key=lambda r: r.seq)
+
+
+def fee_priority(pending: List[Request]) -> List[Request]:
+    return sorted(pending, key=lambda r: (-r.fee, r.seq))
+
+
+def random_order(pending: List[Request]) -> List[Request]:
+    # global random, like the agents, so seeded runs stay reproducible
+    ordered = list(pending)
+    random.shuffle(ordered)
+    return ordered
+
+
+ORDERINGS: Dict[str, Callable[[List[Request]], List[Request]]] = {
+    "fifo": fifo,
+    "fee": fee_priority,
+    "random": random_order,
+}
+
+
+def jain_index(values: List[Decimal]) -> Decimal:
+    """(sum x)^2 / (n * sum x^2): 1 when every value is equal, down to 1/n when one takes everything"""
+    squares = sum(v * v for v in values)
+    if not values or squares.is_zero():
+        return Decimal(1)
+    return sum(values) ** 2 / (len(values) * squares)
+
+
+class BlockRouter(RouterI):
+    """
+    Mempool in front of a Router.
+    Agents' requests are queued instead of executed, and included in blocks of at most block_size requests,
+    in the order given by the ordering policy. The router only rebalances at block boundaries.
+    """
+
+    def __init__(
+        self,
+        router: RouterI,
+        block_size: int,
+        ordering: str = "fifo",
+        blocks_per_step: Optional[int] = None,
+    ):
+        """
+        :param router: router that executes the requests
+        :param ordering: "fifo", "fee" (highest fee bid first) or "random"
+        :param blocks_per_step: blocks produced per model step; None includes every pending request each step
+        """
+        if ordering not in ORDERINGS:
+            raise ValueError(
+                "Unknown ordering {}, expected one of {}".format(ordering, list(ORDERINGS))
+            )
+        self._router = router
+        self._router.auto_rebalance = False
+        self._block_size = block_size
+        self._order = ORDERINGS[ordering]
+        self._blocks_per_step = blocks_per_step
+
+        self._pending: List[Request] = []
+        self._seq = 0
+        self.block_number = 0
+        self.num_reverted = 0
+
+        # fairness metrics
+        self.inclusion_delays: List[int] = []
+        # per block, the rate (redeemed USD / voucher face value) of every redemption included
+        self.redeem_rates: List[List[Decimal]] = []
+
+    @property
+    def num_triggered(self):
+        return self._router.num_triggered
+
+    @property
+    def num_rebalanced(self):
+        return self._router.num_rebalanced
+
+    @property
+    def is_accepting_liquidity(self):
+        return self._router.is_accepting_liquidity
+
+    @property
+    def warning(self):
+        return self._router.warning
+
+    @property
+    def liquidation_netting(self):
+        return self._router.liquidation_netting
+
+    @property
+    def principal(self):
+        return self._router.principal
+
+    @property
+    def va_denom(self):
+        return self._router.va_denom
+
+    @property
+    def sa_denom(self):
+        return self._router.sa_denom
+
+    @property
+    def num_pending(self):
+        return len(self._pending)
+
+    def process_buyer_buy_request(self, buyer: AgentI, tokens_va: TokenI):
+        fee = tokens_va.amount * Oracle.get_price_of(tokens_va.denom)
+        self._submit(BUY, buyer, tokens_va, fee)
+
+    def process_buyer_redeem_request(self, buyer: AgentI, vc_tokens: TokenI):
+        fee = vc_tokens.amount * self._router.original_price(vc_tokens.denom)
+        self._submit(REDEEM, buyer, vc_tokens, fee)
+
+    def original_price(self, vc_denom: str):
+        return self._router.original_price(vc_denom)
+
+    def process_lp_provider_request(self, provider: AgentI, tokens_sa: TokenI):
+        self._submit(PROVIDE, provider, tokens_sa, tokens_sa.amount)
+
+    def process_lp_provider_redeem_request(self, provider: AgentI, tokens_lp: TokenI):
+        fee = self._router.dry_run_redeem_lp(tokens_lp, provider)
+        self._submit(LP_REDEEM, provider, tokens_lp, fee)
+
+    def dry_run_redeem_lp(self, tokens_lp: TokenI, provider: AgentI = None):
+        return self._router.dry_run_redeem_lp(tokens_lp, provider)
+
+    def accrued_fees(self, provider: AgentI):
+        return self._router.accrued_fees(provider)
+
+    def fee_history(self, provider: AgentI):
+        return self._router.fee_history(provider)
+
+    def va_pool_value_usd(self):
+        return self._router.va_pool_value_usd()
+
+    def total_asset_value_usd(self):
+        return self._router.total_asset_value_usd()
+
+    def bridge_liquidity(self, amount_sa: Decimal):
+        self._router.bridge_liquidity(amount_sa)
+
+    def rebalance(self):
+        self._router.rebalance()
+
+    def settle_liquidations(self):
+        self._router.settle_liquidations()
+
+    def pool_balances(self):
+        return self._router.pool_balances()
+
+    def quote_redeem_all(self, buyers: Sequence[AgentI] = ()):
+        """Vouchers in pending redemptions still count in the per-denom values, but no longer in their buyers'"""
+        return self._router.quote_redeem_all(buyers)
+
+    def _submit(self, kind: str, agent: AgentI, tokens: TokenI, fee: Decimal):
+        self._pending.append(
+            Request(self._seq, kind, agent, tokens, fee, self.block_number)
+        )
+        self._seq += 1
+
+    def produce_block(self) -> List[Request]:
+        """Include up to block_size pending requests, then settle netted liquidations and rebalance once"""
+        ordered = self._order(self._pending)
+        included, self._pending = (
+            ordered[: self._block_size],
+            ordered[self._block_size :],
+        )
+        rates = []
+        for request in included:
+            request.included_block = self.block_number
+            self.inclusion_delays.append(self.block_number - request.submitted_block)
+            rate = self._execute(request)
+            if rate is not None:
+                rates.append(rate)
+        self._router.settle_liquidations()
+        self._router.rebalance()
+        self.redeem_rates.append(rates)
+
+        logger.info(
+            Events.Router.BlockProduced.fmt(
+                self.block_number, len(included), len(self._pending)
+            )
+        )
+        self.block_number += 1
+        return included
+
+    def produce_blocks(self) -> int:
+        """
+        Called once per model step.
+
+        :return: number of blocks produced
+        """
+        produced = 0
+        while self._pending and (
+            self._blocks_per_step is None or produced < self._blocks_per_step
+        ):
+            self.produce_block()
+            produced += 1
+        return produced
+
+    def _execute(self, request: Request) -> Optional[Decimal]:
+        """
+        Requests that the token contract rejects (e.g. burning more vouchers than are still circulating,
+        beyond the dust it tolerates) are reverted like a failed transaction: the agent gets its tokens back.
+        Those errors are raised before the router changes any state.
+        So are stakes included once the router no longer accepts liquidity: every stake queued in the meantime
+        passed the provider's check, since none had raised the principal yet.
+
+        :return: for redemptions, the redeemed USD per USD of voucher face value
+        """
+        try:
+            return self._dispatch(request)
+        except (NegativeCirculatingSupplyError, BurnWrongTokenError):
+            self.num_reverted += 1
+            request.agent.receives(request.tokens)
+
+    def _dispatch(self, request: Request) -> Optional[Decimal]:
+        if request.kind == BUY:
+            self._router.process_buyer_buy_request(request.agent, request.tokens)
+        elif request.kind == PROVIDE:
+            if not self._router.is_accepting_liquidity:
+                # the stake never left the provider's wallet, so it is not counted as redeemed either
+                self.num_reverted += 1
+                request.agent.wallet.refund(request.tokens)
+                return
+            self._router.process_lp_provider_request(request.agent, request.tokens)
+        elif request.kind == LP_REDEEM:
+            self._router.process_lp_provider_redeem_request(
+                request.agent, request.tokens
+            )
+        else:
+            before = request.agent.redeemed_eth_usd
+            self._router.process_buyer_redeem_request(request.agent, request.tokens)
+            if request.fee.is_zero():
+                return
+            return (request.agent.redeemed_eth_usd - before) / request.fee
+
+    def mean_inclusion_delay(self) -> Decimal:
+        """Blocks a request waits in the mempool, on average"""
+        if not self.inclusion_delays:
+            return Decimal(0)
+        return Decimal(sum(self.inclusion_delays)) / len(self.inclusion_delays)
+
+    def redemption_fairness(self) -> Decimal:
+        """
+        Jain's index of redemption rates within a block, averaged over blocks with more than one redemption.
+        Requests in the same block see the same prices, so a low index means the ordering decided who got paid.
+        """
+        indices = [jain_index(rates) for rates in self.redeem_rates if len(rates) > 1]
+        if not indices:
+            return Decimal(1)
+        return sum(indices) / len(indices)
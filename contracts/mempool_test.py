@@ -0,0 +1,69 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import Mock
+
+from contracts.mempool import BlockRouter
+from contracts.types import Tokens
+from states.errors import BurnWrongTokenError, NegativeCirculatingSupplyError
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestBlockRouterRefunds(unittest.TestCase):
+    def setUp(self):
+        self.router = Mock()
+        self.router.original_price.return_value = Decimal(1337)
+        self.router.is_accepting_liquidity = True
+        self.mempool = BlockRouter(self.router, block_size=10)
+        self.buyer = Mock()
+        self.buyer.redeemed_eth_usd = Decimal(0)
+        self.provider = Mock()
+
+    def test_router_only_rebalances_per_block(self):
+        self.assertFalse(self.router.auto_rebalance)
+        self.mempool.process_buyer_redeem_request(self.buyer, Tokens(Decimal(1), "<price-1337>"))
+        self.router.process_buyer_redeem_request.assert_not_called()
+        self.assertEqual(self.mempool.produce_blocks(), 1)
+        self.router.process_buyer_redeem_request.assert_called_once()
+        self.router.rebalance.assert_called_once()
+        logger.test("#test_router_only_rebalances_per_block()")
+
+    def test_rejected_redemption_returns_vouchers(self):
+        vouchers = Tokens(Decimal(1), "<price-1337>")
+        for error in (
+            BurnWrongTokenError("<price-1337>"),
+            NegativeCirculatingSupplyError(Decimal(0), Decimal(1), "<price-1337>"),
+        ):
+            self.router.process_buyer_redeem_request.side_effect = error
+            self.mempool.process_buyer_redeem_request(self.buyer, vouchers)
+            self.mempool.produce_blocks()
+        self.assertEqual(self.mempool.num_reverted, 2)
+        self.assertEqual(self.buyer.receives.call_count, 2)
+        self.buyer.receives.assert_called_with(vouchers)
+        logger.test("#test_rejected_redemption_returns_vouchers()")
+
+    def test_stake_after_liquidity_closed_is_refunded(self):
+        stake = Tokens(Decimal(1000), "USDC")
+        self.mempool.process_lp_provider_request(self.provider, stake)
+        self.router.is_accepting_liquidity = False
+        self.mempool.produce_blocks()
+        self.router.process_lp_provider_request.assert_not_called()
+        self.provider.wallet.refund.assert_called_once_with(stake)
+        self.provider.receives.assert_not_called()
+        self.assertEqual(self.mempool.num_reverted, 1)
+        logger.test("#test_stake_after_liquidity_closed_is_refunded()")
+
+    def test_blocks_per_step_leaves_requests_pending(self):
+        mempool = BlockRouter(self.router, block_size=2, blocks_per_step=1)
+        for _ in range(3):
+            mempool.process_buyer_redeem_request(self.buyer, Tokens(Decimal(1), "<price-1337>"))
+        self.assertEqual(mempool.produce_blocks(), 1)
+        self.assertEqual(mempool.num_pending, 1)
+        mempool.produce_blocks()
+        self.assertEqual(mempool.inclusion_delays, [0, 0, 1])
+        logger.test("#test_blocks_per_step_leaves_requests_pending()")
+
+
+if __name__ == "__main__":
+    unittest.main()
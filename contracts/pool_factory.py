@@ -7,19 +7,30 @@ from states.errors import (
     CannotLiquidateEnoughError,
 )
 from states.events import Events
-from states.interfaces import PoolI, StablePoolI, VolatilePoolI, TokenI, AgentI
+from states.interfaces import (
+    PoolI,
+    StablePoolI,
+    VolatilePoolI,
+    TokenI,
+    AgentI,
+    PoolObserverI,
+)
 from contracts.types import Tokens
 from utils import processlogger
+from utils.gas_meter import GasMeter
 from utils.safe_decimals import gt, lt
 
 logger = processlogger.ProcessLogger()
 
+ZERO = Decimal(0)
+
 
 class Pool(PoolI):
     def __init__(self, denom: str):
         self._type = denom
         self._denom = denom
         self._balance = Decimal(0)
+        self._observers = []
 
     @property
     def denom(self):
@@ -43,10 +54,33 @@ class Pool(PoolI):
         """
         amount, denom = tokens.decompose()
         self._enforce_denom(denom)
+        GasMeter.charge("sload")
+        GasMeter.charge("sstore")
         self._balance += amount
+        self._notify(amount)
         logger.debug(Events.Pool.DepositSuccess.fmt(self, tokens))
         return tokens
 
+    def try_withdraw(self, tokens: TokenI) -> Decimal:
+        """
+        Withdraw tokens from pool, if the balance covers them.
+        A shortfall is routine for the SA Pool (the Router liquidates VA to cover it), so it is reported as a number:
+        no error is constructed and the pool is left unchanged.
+
+        :param tokens: tokens to withdraw, w/ same denom as pool
+        :return: shortfall, zero when withdrawn
+        """
+        amount, denom = tokens.decompose()
+        self._enforce_denom(denom)
+        GasMeter.charge("sload")
+        if lt(self._balance, amount):
+            return amount - self._balance
+        GasMeter.charge("sstore")
+        self._balance -= amount
+        self._notify(-amount)
+        logger.debug(Events.Pool.WithdrawSuccess.fmt(self, tokens))
+        return ZERO
+
     def withdraw(self, tokens: TokenI):
         """
         Withdraw tokens from pool.
@@ -57,17 +91,28 @@ class Pool(PoolI):
         :param tokens: tokens to withdraw, w/ same denom as pool
         :return: tokens withdrawn, or deficit along with error.
         """
-        amount, denom = tokens.decompose()
-        self._enforce_denom(denom)
-        if lt(self._balance, amount):
-            deficit = Tokens(amount - self._balance, denom)
+        shortfall = self.try_withdraw(tokens)
+        if not shortfall.is_zero():
+            deficit = Tokens(shortfall, self._denom)
             return deficit, PoolNotEnoughBalanceError(
-                self._balance, amount, self._denom
+                self._balance, tokens.amount, self._denom
             )
-        self._balance -= amount
-        logger.debug(Events.Pool.WithdrawSuccess.fmt(self, tokens))
         return tokens, None
 
+    def try_redeem_to(self, recipient: AgentI, tokens_to_redeem: TokenI) -> Decimal:
+        """
+        Redeem to individual, if the balance covers it.
+
+        :return: shortfall, zero when redeemed
+        """
+        shortfall = self.try_withdraw(tokens_to_redeem)
+        if not shortfall.is_zero():
+            return shortfall
+        GasMeter.charge("transfer")
+        recipient.receives(tokens_to_redeem)
+        logger.debug(Events.Pool.SuccessRedeem.fmt(self, recipient, tokens_to_redeem))
+        return ZERO
+
     def redeem_to(self, recipient: AgentI, tokens_to_redeem: TokenI):
         """
         Redeem to individual.
@@ -77,14 +122,21 @@ class Pool(PoolI):
         :param tokens_to_redeem: tokens to redeem to recipient
         :return: tokens redeemed, or deficit along with error
         """
-        redeem_amount, denom = tokens_to_redeem.decompose()
-        self._enforce_denom(denom)
-        transferred, e = self._transfer_to(recipient, tokens_to_redeem)
-        if e:
-            deficit = transferred
-            return deficit, e
-        logger.debug(Events.Pool.SuccessRedeem.fmt(self, recipient, transferred))
-        return transferred, None
+        shortfall = self.try_redeem_to(recipient, tokens_to_redeem)
+        if not shortfall.is_zero():
+            deficit = Tokens(shortfall, self._denom)
+            return deficit, PoolNotEnoughBalanceError(
+                self._balance, tokens_to_redeem.amount, self._denom
+            )
+        return tokens_to_redeem, None
+
+    def add_observer(self, observer: PoolObserverI):
+        """Observers are told about every change to the balance (and principal), as it happens"""
+        self._observers.append(observer)
+
+    def _notify(self, delta_balance: Decimal, delta_principal: Decimal = Decimal(0)):
+        for observer in self._observers:
+            observer.on_balance_change(self, delta_balance, delta_principal)
 
     def _enforce_denom(self, denom: str):
         """Enforce that received tokens have same denomination as pool"""
@@ -92,15 +144,6 @@ class Pool(PoolI):
             raise UnrecognizedDenomError(denom, self._denom)
         return
 
-    def _transfer_to(self, recipient: AgentI, tokens: TokenI):
-        """Transfer to recipient that w/ wallet that satisfies WalletI with receives method."""
-        withdrew, e = self.withdraw(tokens)
-        if e:
-            deficit = withdrew
-            return deficit, e
-        recipient.receives(withdrew)
-        return withdrew, None
-
 
 class StablePool(Pool, StablePoolI):
     def __init__(self, denom: str):
@@ -137,26 +180,29 @@ class StablePool(Pool, StablePoolI):
             logger.info(Events.Pool.Initialized.fmt(self, tokens))
             self._initiated = True
         # protocol injected liquidity is not included as principal (i.e. low priority redeem)
-        self._principal += tokens.amount if not protocol_injected else 0
+        if not protocol_injected:
+            GasMeter.charge("sload")
+            GasMeter.charge("sstore")
+            self._principal += tokens.amount
+            self._notify(Decimal(0), tokens.amount)
         return tokens
 
-    def withdraw(self, tokens: TokenI):
+    def try_withdraw(self, tokens: TokenI) -> Decimal:
         if not self._initiated:
             raise PoolNotInitializedError(self.type)
-        return super().withdraw(tokens)
+        return super().try_withdraw(tokens)
 
-    def redeem_to(self, recipient: AgentI, tokens_to_redeem: TokenI):
+    def try_redeem_to(self, recipient: AgentI, tokens_to_redeem: TokenI) -> Decimal:
         """
-        Propagate error along with difference, so Router can handle error and retry again after liquidation
+        Report the shortfall, so Router can liquidate exactly that much and retry
         """
-        if not self._initiated:
-            raise PoolNotInitializedError(self.type)
-        redeemed, e = super().redeem_to(recipient, tokens_to_redeem)
-        if e:
-            deficit = redeemed
-            return deficit, e
-        self._principal -= redeemed.amount
-        return redeemed, None
+        shortfall = super().try_redeem_to(recipient, tokens_to_redeem)
+        if shortfall.is_zero():
+            GasMeter.charge("sload")
+            GasMeter.charge("sstore")
+            self._principal -= tokens_to_redeem.amount
+            self._notify(Decimal(0), -tokens_to_redeem.amount)
+        return shortfall
 
     def calculate_lp_token_amount(self, tokens_sa: TokenI):
         """
@@ -165,6 +211,7 @@ class StablePool(Pool, StablePoolI):
         :param tokens_sa: tokens deposited
         :return: amount of LP tokens to issue
         """
+        GasMeter.charge("sload")
         return (
             tokens_sa.amount / self._initial_liquidity
             if not self._initial_liquidity.is_zero()
@@ -176,14 +223,14 @@ class VolatilePool(Pool, VolatilePoolI):
     def __init__(self, denom: str):
         super().__init__(denom)
 
-    def withdraw(self, tokens: TokenI):
+    def try_withdraw(self, tokens: TokenI) -> Decimal:
         """
         Raise error immediately, as VA Pool **should not** have any issue withdrawing.
         """
-        withdrew, e = super().withdraw(tokens)
-        if e:
-            raise e
-        return withdrew, None
+        shortfall = super().try_withdraw(tokens)
+        if not shortfall.is_zero():
+            raise PoolNotEnoughBalanceError(self._balance, tokens.amount, self._denom)
+        return shortfall
 
     def liquidate(self, tokens: TokenI):
         """
@@ -199,9 +246,11 @@ class VolatilePool(Pool, VolatilePoolI):
 
         if lt(self._balance, liq_amount):
             raise CannotLiquidateEnoughError(liq_amount, self._balance, self._denom)
-        withdrew, _ = self.withdraw(tokens)  # error should be raised in withdraw
+        self.try_withdraw(tokens)  # error should be raised in try_withdraw
+        # sold to an exchange
+        GasMeter.charge("transfer")
         logger.info(Events.Pool.SuccessLiquidation.fmt(self, tokens))
-        return withdrew
+        return tokens
 
 
 class FeePool(Pool):
@@ -209,14 +258,14 @@ class FeePool(Pool):
         super().__init__(denom)
         self._type = "Fee"
 
-    def withdraw(self, tokens: TokenI):
+    def try_withdraw(self, tokens: TokenI) -> Decimal:
         """
         Raise error immediately, as Fee Pool **should not** have any issue withdrawing.
         """
-        withdrew, e = super().withdraw(tokens)
-        if e:
-            raise e
-        return withdrew, None
+        shortfall = super().try_withdraw(tokens)
+        if not shortfall.is_zero():
+            raise PoolNotEnoughBalanceError(self._balance, tokens.amount, self._denom)
+        return shortfall
 
 
 if __name__ == "__main__":
@@ -1,41 +1,112 @@
 from decimal import Decimal
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 from utils import processlogger
+from utils.gas_meter import GasMeter, metered
 from utils.safe_decimals import geq, leq
 
 from contracts import pool_factory, token_contract, balance_tracker, inflation_tracker
+from contracts.fee_accumulator import FeeAccumulator
+from contracts.liquidation_netting import LiquidationNetting
 from contracts.types import Tokens
 
 # from states import errors
 from states.errors import PoolNotEnoughBalanceError
-from states.params import Params
+from states.params import ParamsSubscriber
 from states.events import Events
-from states.interfaces import RouterI, AgentI, TokenI
+from states.interfaces import RouterI, AgentI, TokenI, VoucherBucketingI
 
 from agents.oracle import Oracle
 
 logger = processlogger.ProcessLogger()
 
 
-class Router(RouterI):
-    def __init__(self, va_denom: str, sa_denom: str):
+def _holdings_usd(per_voucher: Dict[str, Decimal], buyers: Sequence[AgentI]) -> np.ndarray:
+    """
+    USD value of each buyer's voucher lots, at per_voucher USD per voucher of each denom.
+    The buyers' wallets are rows of one WalletStore, valued together.
+    """
+    if not buyers:
+        return np.array([], dtype=object)
+    store = buyers[0].wallet.store
+    return store.value_lots([buyer.wallet.row for buyer in buyers], per_voucher)
+
+
+class SharedLiquidity:
+    """SA side of the protocol, shared by one Router per VA denom (see MultiAssetRouter)"""
+
+    def __init__(self, va_denoms: List[str], sa_denom: str):
+        self.va_pools = {d: pool_factory.VolatilePool(d) for d in va_denoms}
+        self.sa_pool = pool_factory.StablePool(sa_denom)
+        self.fee_pool = pool_factory.FeePool(sa_denom)
+        self.lp_tc = token_contract.LPTokenContract()
+        self.bt = balance_tracker.MultiAssetBalanceTracker(
+            list(self.va_pools.values()), self.sa_pool, self.fee_pool
+        )
+        self.fees = FeeAccumulator(self.fee_pool, self.lp_tc)
+        self.netting = LiquidationNetting(self.va_pools, self.sa_pool)
+
+
+class Router(RouterI, ParamsSubscriber):
+    def __init__(
+        self,
+        va_denom: str,
+        sa_denom: str,
+        shared: SharedLiquidity = None,
+        voucher_bucketing: VoucherBucketingI = None,
+    ):
+        """
+        :param shared: SA pool, Fee pool, LP tokens and balance tracker shared with routers for other VA denoms.
+            By default the router owns all of them.
+        :param voucher_bucketing: price buckets vouchers are merged into (see contracts.voucher_buckets);
+            None issues one voucher denom per exact price
+        """
+        self._bind_params()
+
         self._va_denom = va_denom  # 'ETH'
         self._sa_denom = sa_denom  # 'USDC'
 
-        # Initiate Pools
-        self._va_pool = pool_factory.VolatilePool(self._va_denom)
-        self._sa_pool = pool_factory.StablePool(self._sa_denom)
-        self._fee_pool = pool_factory.FeePool(self._sa_denom)
+        if shared is None:
+            # Initiate Pools
+            self._va_pool = pool_factory.VolatilePool(self._va_denom)
+            self._sa_pool = pool_factory.StablePool(self._sa_denom)
+            self._fee_pool = pool_factory.FeePool(self._sa_denom)
+
+            # Initiate Token Contracts
+            self._lp_tc = token_contract.LPTokenContract()
+            self._erc_tc = token_contract.ERC1155TokenContract(
+                bucketing=voucher_bucketing
+            )
 
-        # Initiate Token Contracts
-        self._lp_tc = token_contract.LPTokenContract()
-        self._erc_tc = token_contract.ERC1155TokenContract()
+            # Initiate Trackers
+            self._bt = balance_tracker.BalanceTracker(
+                self._va_pool, self._sa_pool, self._fee_pool
+            )
+            self._fees = FeeAccumulator(self._fee_pool, self._lp_tc)
+            self._netting = LiquidationNetting(
+                {self._va_denom: self._va_pool}, self._sa_pool
+            )
+        else:
+            self._va_pool = shared.va_pools[va_denom]
+            self._sa_pool = shared.sa_pool
+            self._fee_pool = shared.fee_pool
+            self._lp_tc = shared.lp_tc
+            # vouchers carry their asset, as buyers of different assets may share wallets
+            self._erc_tc = token_contract.ERC1155TokenContract(
+                asset=va_denom, bucketing=voucher_bucketing
+            )
+            self._bt = shared.bt
+            self._fees = shared.fees
+            self._netting = shared.netting
 
-        # Initiate Trackers
-        self._bt = balance_tracker.BalanceTracker(
-            self._va_pool, self._sa_pool, self._fee_pool
+        self._it = inflation_tracker.InflationTracker(
+            self._erc_tc, self._bt.for_asset(va_denom), va_denom
         )
-        self._it = inflation_tracker.InflationTracker(self._erc_tc, self._bt)
+
+        # rebalance after every request; turned off when requests are batched into blocks
+        self.auto_rebalance = True
 
     @property
     def num_triggered(self):
@@ -50,7 +121,20 @@ class Router(RouterI):
         """
         Liquidity Providing is capped at 2M, and Initial Liquidity is 1M.
         """
-        return self._sa_pool.principal <= (Params.stake_cap() * 2)
+        return self._sa_pool.principal <= (self._params.stake_cap * 2)
+
+    @property
+    def warning(self):
+        return self._bt.warning
+
+    @property
+    def liquidation_netting(self):
+        """Set liquidation_netting.enabled to defer liquidations until settle_liquidations"""
+        return self._netting
+
+    @property
+    def principal(self):
+        return self._sa_pool.principal
 
     @property
     def va_denom(self):
@@ -60,6 +144,7 @@ class Router(RouterI):
     def sa_denom(self):
         return self._sa_denom
 
+    @metered("buy")
     def process_buyer_buy_request(self, buyer: AgentI, tokens_va: TokenI):
         """
         Buyer Scenario - BUY
@@ -73,6 +158,7 @@ class Router(RouterI):
         """
         cur_price = Oracle.get_price_of(self._va_denom)
         logger.info(Events.Buyer.AttemptingBuy.fmt(buyer, tokens_va))
+        GasMeter.charge("transfer")
         self._va_pool.deposit(tokens_va)
 
         cost_sa = Oracle.exchange(tokens_va, self._sa_denom)
@@ -91,7 +177,7 @@ class Router(RouterI):
 
             for tokens_sa in withdraw_steps_sa:
                 if geq(tokens_sa.amount, 0):
-                    self._handle(self._sa_pool.withdraw, tokens_sa)
+                    self._handle(self._sa_pool.try_withdraw, tokens_sa)
 
             vc_amount = self._erc_tc.balance_adjusted_voucher_quantity(
                 withdraw_steps_va
@@ -105,15 +191,16 @@ class Router(RouterI):
             self._automated_conversion(Oracle.exchange(auto_convert, self._va_denom))
 
         if voucher_tokens:
-            self._erc_tc.mint_to(buyer, voucher_tokens)
+            self._erc_tc.mint_to(buyer, voucher_tokens, og_price=cur_price)
 
-        fee_sa = cost_sa.times(Params.tx_fee_rate())
+        fee_sa = cost_sa.times(self._params.tx_fee_rate)
         # self._sa_pool.deposit(fee_sa, protocol_injected=True)
         self._fee_pool.deposit(fee_sa)
         logger.info(Events.Buyer.SuccessBuy.fmt(buyer, tokens_va, cost_sa.amount))
 
-        self._bt.rebalance()
+        self._after_request()
 
+    @metered("redeem")
     def process_buyer_redeem_request(self, buyer: AgentI, vc_tokens: TokenI):
         """
         Buyer Scenario - REDEEM
@@ -132,16 +219,17 @@ class Router(RouterI):
         # nothing to redeem, re-mint voucher tokens to buyer
         if leq(redeem_usd, 0):
             self._erc_tc.mint_to(buyer, vc_tokens)
-            return self._bt.rebalance()
+            return self._after_request()
 
         self._erc_tc.burn(vc_tokens)
+        op_premium = self._params.op_premium
         redeem_va = Oracle.exchange(Tokens(redeem_usd, self._sa_denom), self._va_denom)
-        redeem_va_minus_fees = redeem_va.times(1 - Params.op_premium())
+        redeem_va_minus_fees = redeem_va.times(1 - op_premium)
 
         # redeem to buyer after extracting redemption fees
         self._va_pool.redeem_to(buyer, redeem_va_minus_fees)
 
-        fee_va = redeem_va.times(Params.op_premium())
+        fee_va = redeem_va.times(op_premium)
         # withdraw from VA pool and deposit to Fee pool
         self._va_pool.withdraw(fee_va)
         fee_sa = Oracle.exchange(fee_va, self._sa_denom)
@@ -150,12 +238,13 @@ class Router(RouterI):
 
         logger.info(
             Events.Buyer.SuccessRedeem.fmt(
-                buyer, redeem_va_minus_fees, redeem_usd * (1 - Params.op_premium())
+                buyer, redeem_va_minus_fees, redeem_usd * (1 - op_premium)
             )
         )
 
-        self._bt.rebalance()
+        self._after_request()
 
+    @metered("provide")
     def process_lp_provider_request(self, provider: AgentI, tokens_sa: TokenI):
         """
         LP Provider Scenario - PROVIDE
@@ -168,15 +257,18 @@ class Router(RouterI):
 
         # mint LP tokens pro rata. Initial liquidity is reference point, with that amount as 1 LP
         # Initial liquidity MUST be provided by protocol
+        GasMeter.charge("transfer")
         self._sa_pool.deposit(tokens_sa, protocol_injected=provider.type == "Protocol")
         amount_lp = self._sa_pool.calculate_lp_token_amount(tokens_sa)
         tokens_lp = Tokens(amount_lp, "LP")
         self._lp_tc.mint_to(provider, tokens_lp)
+        self._fees.deposit(provider.name, amount_lp)
 
         logger.info(Events.Provider.SuccessProvide.fmt(provider, tokens_sa))
 
         # self._bt.rebalance()
 
+    @metered("lp_redeem")
     def process_lp_provider_redeem_request(self, provider: AgentI, tokens_lp: TokenI):
         """
         LP Provider Scenario - REDEEM
@@ -186,6 +278,9 @@ class Router(RouterI):
             2. Calculate amount of SA (SA Pool + Fee) that should be redeemed to buyer
             3. Burn LP tokens (* this should be done AFTER Step 2 *)
             4. Redeem from SA Pool and Fee Pool to provider
+
+        Principal is redeemed pro rata to the LP tokens sent; fees are every fee accrued to the provider's LP tokens
+        since its last provide / redeem (see FeeAccumulator).
         """
         logger.info(Events.Provider.AttemptingRedeem.fmt(provider, tokens_lp))
 
@@ -194,16 +289,17 @@ class Router(RouterI):
 
         # NOTE: assuming that initial liquidity is provided by the protocol
         # Otherwise, we will double count principal and initial liquidity
+        GasMeter.charge("sload", 2)
         redeem_principal_amount = (
             self._sa_pool.principal + self._sa_pool.initial_liquidity
         ) * lp_portion
         redeem_sa = Tokens(redeem_principal_amount, self._sa_denom)
 
-        redeem_fee_usd = self._fee_pool.balance * lp_portion
+        redeem_fee_usd = self._fees.withdraw(provider.name, tokens_lp.amount)
         redeem_fee = Tokens(redeem_fee_usd, self._sa_denom)
 
         # Liquidate VA Pool if necessary, and redeem to provider
-        self._handle(self._sa_pool.redeem_to, provider, redeem_sa)
+        self._handle(self._sa_pool.try_redeem_to, provider, redeem_sa)
         # Redeeming from fee pool should not trigger any liquidation
         self._fee_pool.redeem_to(provider, redeem_fee)
 
@@ -211,35 +307,115 @@ class Router(RouterI):
             Events.Provider.SuccessRedeem.fmt(provider, redeem_sa.plus(redeem_fee))
         )
 
-        self._bt.rebalance()
+        self._after_request()
 
-    def dry_run_redeem_lp(self, tokens_lp: TokenI):
+    def dry_run_redeem_lp(self, tokens_lp: TokenI, provider: AgentI = None):
         """
         TODO: Not completely accurate; does not take into account balance of VA Pool
+
+        :param provider: holder of the LP tokens, whose accrued fees would be paid;
+            without one, fees are estimated as the LP tokens' share of the Fee pool
         """
         lp_portion = self._lp_tc.calculate_lp_portion(tokens_lp)
         redeem_principal_amount = (
             self._sa_pool.principal + self._sa_pool.initial_liquidity
         ) * lp_portion
-        redeem_fee_usd = self._fee_pool.balance * lp_portion
+        if provider is not None:
+            redeem_fee_usd = self._fees.accrued(provider.name)
+        else:
+            redeem_fee_usd = self._fee_pool.balance * lp_portion
         return redeem_principal_amount + redeem_fee_usd
 
+    def accrued_fees(self, provider: AgentI):
+        return self._fees.accrued(provider.name)
+
+    def fee_history(self, provider: AgentI):
+        """(fees per LP share, fees paid) at every LP redemption of the provider"""
+        return self._fees.history(provider.name)
+
+    def va_pool_value_usd(self):
+        return self._bt.va_pool_value_usd()
+
+    def total_asset_value_usd(self):
+        return self._bt.total_asset_value_usd()
+
+    @metered("bridge")
+    def bridge_liquidity(self, amount_sa: Decimal):
+        """
+        SA transfer to/from another deployment: positive amounts are received, negative amounts are sent.
+        Handled like protocol-injected liquidity, so principal is unaffected.
+        """
+        if amount_sa > 0:
+            self._sa_pool.deposit(Tokens(amount_sa, self._sa_denom), protocol_injected=True)
+        elif amount_sa < 0:
+            self._handle(self._sa_pool.try_withdraw, Tokens(-amount_sa, self._sa_denom))
+
+    def pool_balances(self):
+        """Raw (VA, SA, Fee) pool balances, used to detect when the protocol has stopped changing"""
+        return self._va_pool.balance, self._sa_pool.balance, self._fee_pool.balance
+
+    def quote_redeem_all(self, buyers: Sequence[AgentI] = ()):
+        """
+        USD that redeeming outstanding vouchers would pay at the current price, as _calculate_amount_to_redeem_buyer_usd
+        prices one redemption, without changing or logging anything.
+        Inflation is computed for every original price at once, and the max redeem rate once.
+
+        :param buyers: agents whose voucher holdings to value
+        :return: voucher denoms, USD per denom for its whole circulating quantity, and USD per buyer
+        """
+        denoms, per_lot, per_voucher = self._quote_lots()
+        return denoms, per_lot, _holdings_usd(dict(zip(denoms, per_voucher)), buyers)
+
+    def original_price(self, vc_denom: str) -> Decimal:
+        """Price a voucher denom was bought at, as the token contract values it (the average price for a bucket)"""
+        return self._erc_tc.original_price(vc_denom)
+
+    def _quote_lots(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """:return: voucher denoms, USD per denom for its circulating quantity, and USD per voucher"""
+        issued = self._erc_tc.tokens_issued
+        denoms = list(issued)
+        quantities = np.array([issued[denom] for denom in denoms], dtype=object)
+        og_prices = np.array(
+            [self._erc_tc.original_price(denom) for denom in denoms], dtype=object
+        )
+        r_m = self._it.calculate_max_redeem_rate()
+        per_voucher = og_prices * self._it.calculate_inflations(og_prices) * r_m
+        return denoms, per_voucher * quantities, per_voucher
+
+    @metered("rebalance")
+    def rebalance(self):
+        self._bt.rebalance()
+
+    def settle_liquidations(self):
+        if self._netting.enabled:
+            self._netting.settle()
+
+    def _after_request(self):
+        if self.auto_rebalance:
+            self._bt.rebalance()
+
     def _handle(self, func, *args):
         """
         Handler for withdrawals from SA Pool.
-        If there are not enough funds initially, this will attempt to liquidate VA Pool, then retry once.
+        A shortfall is routine: liquidate exactly that much from VA Pool into SA Pool, then complete the withdrawal.
+        Errors are left for what cannot be recovered (VA Pool depleted, or still short after liquidating).
+
+        :param func: SA Pool try_withdraw / try_redeem_to, returning the shortfall
         """
-        result, e = func(*args)
-        if isinstance(e, PoolNotEnoughBalanceError):
-            deficit = result
-            liq_amount = Oracle.exchange(deficit, self._va_denom)
-            self._va_pool.liquidate(liq_amount)
+        shortfall = func(*args)
+        if shortfall.is_zero():
+            return
+        deficit = Tokens(shortfall, self._sa_denom)
+        if self._netting.enabled:
+            self._netting.advance(self._va_denom, deficit)
+        else:
+            self._va_pool.liquidate(Oracle.exchange(deficit, self._va_denom))
             self._sa_pool.deposit(deficit)
-            result, e = func(*args)
-            if e:
-                raise e
-        elif e:  # catch other errors
-            raise e
+        if not func(*args).is_zero():
+            tokens_sa = args[-1]
+            raise PoolNotEnoughBalanceError(
+                self._sa_pool.balance, tokens_sa.amount, self._sa_denom
+            )
         return
         # result, e = func(*args)
         # if isinstance(e, PoolNotEnoughBalanceError):
@@ -266,7 +442,7 @@ class Router(RouterI):
         r_m = self._it.calculate_max_redeem_rate()
 
         vc_amount, vc_denom = vc_tokens.decompose()
-        og_price = self._erc_tc.deserialize_vouchers(vc_denom)
+        og_price = self._erc_tc.original_price(vc_denom)
 
         # get inflation rate for the received voucher tokens
         inflation_rate = self._it.calculate_inflation(og_price)
@@ -287,4 +463,140 @@ class Router(RouterI):
 
     def _automated_conversion(self, tokens: TokenI):
         logger.info(Events.Router.AttemptingAutomatedConversion.fmt(tokens))
+        if self._netting.enabled:
+            self._netting.convert(tokens)
+            return
         self._va_pool.liquidate(tokens)
+
+
+class MultiAssetRouter(RouterI):
+    """
+    One Router per VA denom, all backed by a single SA pool, Fee pool and LP token contract,
+    with a combined balance check and one inflation tracker per asset.
+    Buys are routed by the denom paid, buyer redemptions by the asset encoded in the voucher denom,
+    and liquidity providing goes through the first asset's router (the SA side is shared anyway).
+    """
+
+    def __init__(
+        self,
+        va_denoms: List[str],
+        sa_denom: str,
+        voucher_bucketing: VoucherBucketingI = None,
+    ):
+        self._shared = SharedLiquidity(va_denoms, sa_denom)
+        self._routers = {
+            d: Router(d, sa_denom, shared=self._shared, voucher_bucketing=voucher_bucketing)
+            for d in va_denoms
+        }
+        self._primary = self._routers[va_denoms[0]]
+        self._va_denoms = list(va_denoms)
+        self._sa_denom = sa_denom
+
+    @property
+    def num_triggered(self):
+        return self._shared.bt.num_triggered
+
+    @property
+    def num_rebalanced(self):
+        return self._shared.bt.num_rebalanced
+
+    @property
+    def is_accepting_liquidity(self):
+        return self._primary.is_accepting_liquidity
+
+    @property
+    def warning(self):
+        return self._shared.bt.warning
+
+    @property
+    def liquidation_netting(self):
+        return self._shared.netting
+
+    @property
+    def principal(self):
+        return self._shared.sa_pool.principal
+
+    @property
+    def va_denom(self):
+        return self._va_denoms[0]
+
+    @property
+    def va_denoms(self):
+        return self._va_denoms
+
+    @property
+    def auto_rebalance(self):
+        return self._primary.auto_rebalance
+
+    @auto_rebalance.setter
+    def auto_rebalance(self, value: bool):
+        for router in self._routers.values():
+            router.auto_rebalance = value
+
+    @property
+    def sa_denom(self):
+        return self._sa_denom
+
+    def process_buyer_buy_request(self, buyer: AgentI, tokens_va: TokenI):
+        self._routers[tokens_va.denom].process_buyer_buy_request(buyer, tokens_va)
+
+    def process_buyer_redeem_request(self, buyer: AgentI, vc_tokens: TokenI):
+        asset = token_contract.ERC1155TokenContract.voucher_asset(vc_tokens.denom)
+        self._routers[asset].process_buyer_redeem_request(buyer, vc_tokens)
+
+    def original_price(self, vc_denom: str) -> Decimal:
+        asset = token_contract.ERC1155TokenContract.voucher_asset(vc_denom)
+        return self._routers[asset].original_price(vc_denom)
+
+    def process_lp_provider_request(self, provider: AgentI, tokens_sa: TokenI):
+        self._primary.process_lp_provider_request(provider, tokens_sa)
+
+    def process_lp_provider_redeem_request(self, provider: AgentI, tokens_lp: TokenI):
+        self._primary.process_lp_provider_redeem_request(provider, tokens_lp)
+
+    def dry_run_redeem_lp(self, tokens_lp: TokenI, provider: AgentI = None):
+        return self._primary.dry_run_redeem_lp(tokens_lp, provider)
+
+    def accrued_fees(self, provider: AgentI):
+        return self._primary.accrued_fees(provider)
+
+    def fee_history(self, provider: AgentI):
+        return self._primary.fee_history(provider)
+
+    def va_pool_value_usd(self):
+        return self._shared.bt.va_pool_value_usd()
+
+    def total_asset_value_usd(self):
+        return self._shared.bt.total_asset_value_usd()
+
+    def bridge_liquidity(self, amount_sa: Decimal):
+        self._primary.bridge_liquidity(amount_sa)
+
+    @metered("rebalance")
+    def rebalance(self):
+        self._shared.bt.rebalance()
+
+    def settle_liquidations(self):
+        self._primary.settle_liquidations()
+
+    def pool_balances(self):
+        return (
+            tuple(pool.balance for pool in self._shared.va_pools.values()),
+            self._shared.sa_pool.balance,
+            self._shared.fee_pool.balance,
+        )
+
+    def quote_redeem_all(self, buyers: Sequence[AgentI] = ()):
+        """Router.quote_redeem_all over the vouchers of every asset"""
+        denoms, per_lot, per_voucher = [], [], []
+        for router in self._routers.values():
+            router_denoms, router_per_lot, router_per_voucher = router._quote_lots()
+            denoms += router_denoms
+            per_lot.append(router_per_lot)
+            per_voucher.append(router_per_voucher)
+        per_voucher = np.concatenate(per_voucher)
+        return (
+            denoms,
+            np.concatenate(per_lot),
+            _holdings_usd(dict(zip(denoms, per_voucher)), buyers),
+        )
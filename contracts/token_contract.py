@@ -1,22 +1,43 @@
-from typing import List
+from typing import List, Optional, Set, Union
 from decimal import Decimal
 
+import numpy as np
+
 from utils import processlogger
+from utils.gas_meter import GasMeter
 from utils.safe_decimals import dec, lt, gt
 from states import errors
 from states.errors import NegativeCirculatingSupplyError, BurnWrongTokenError
 from states.events import Events
-from states.params import Params
-from states.interfaces import TokenI, TokenContractI, AgentI, ERCTokenContractI
-from collections import defaultdict
+from states.params import ParamsSubscriber, ParamsSnapshot
+from states.interfaces import (
+    TokenI,
+    TokenContractI,
+    AgentI,
+    ERCTokenContractI,
+    VoucherBucketingI,
+)
+from collections import defaultdict, deque
 
 logger = processlogger.ProcessLogger()
 
+# mints and burns remembered for changed_since(); readers further behind recompute from scratch
+CHANGE_LOG_SIZE = 64
+# vouchers a holder may burn beyond what is still issued: holders' balances and the issued total are rounded
+# separately, so the last holder of a denom can own a few units of dust more than the contract counts
+VOUCHER_DUST = Decimal("1e-18")
+
 
 class TokenContract(TokenContractI):
+    # how far a burn may overdraw the issued amount before it is refused; the supply then bottoms out at zero
+    burn_tolerance = Decimal(0)
+
     def __init__(self):
         self._tokens_issued = defaultdict(Decimal)
         self._denoms = set()
+        # bumped by every mint and burn; the denom each version changed is kept for the latest ones
+        self._version = 0
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
 
     @property
     def tokens_issued(self):
@@ -26,23 +47,49 @@ class TokenContract(TokenContractI):
     def denoms(self):
         return self._denoms
 
+    @property
+    def version(self):
+        return self._version
+
     def get_token_issued(self, denom):
         return self._tokens_issued[denom]
 
+    def changed_since(self, version: int) -> Optional[Set[str]]:
+        """
+        :return: denoms minted or burned after version, or None if that is too far back to tell
+        """
+        if version < self._version - len(self._changes):
+            return None
+        changed = set()
+        for changed_at, denom in reversed(self._changes):
+            if changed_at <= version:
+                break
+            changed.add(denom)
+        return changed
+
+    def _changed(self, denom: str) -> None:
+        self._version += 1
+        self._changes.append((self._version, denom))
+
     def burn(self, tokens: TokenI):
         amount, denom = tokens.decompose()
         amount_issued = self.get_token_issued(denom)
         if denom not in self._denoms:
             raise BurnWrongTokenError(denom)
-        if lt(amount_issued - amount, 0):
+        remaining = amount_issued - amount
+        if lt(remaining, 0) and remaining < -self.burn_tolerance:
             raise NegativeCirculatingSupplyError(amount_issued, amount, denom)
-        self._tokens_issued[denom] -= amount
+        GasMeter.charge("burn")
+        self._tokens_issued[denom] = max(remaining, Decimal(0))
+        self._changed(denom)
         logger.info(Events.TokenContract.Burned.fmt(tokens))
         return tokens
 
     def mint_to(self, recipient: AgentI, tokens: TokenI):
         amount, denom = tokens.decompose()
+        GasMeter.charge("mint")
         self._tokens_issued[denom] += amount
+        self._changed(denom)
         recipient.receives(tokens)
         logger.info(Events.TokenContract.Minted.fmt(tokens, recipient))
         return tokens
@@ -54,33 +101,118 @@ class LPTokenContract(TokenContract):
         self._denoms.add("LP")
 
     def calculate_lp_portion(self, tokens_lp: TokenI):
+        GasMeter.charge("sload")
         return tokens_lp.amount / self.get_token_issued("LP")
 
 
-class ERC1155TokenContract(TokenContract, ERCTokenContractI):
-    def __init__(self):
-        super().__init__()
-
-    @staticmethod
-    def balance_adjusted_voucher_quantity(steps_va: List[TokenI]) -> Decimal:
-        q = Decimal(0)
-        withdraw_amounts = [t.amount for t in steps_va]
-        premium = Params.safety_premium()
-        step = Params.n_floors()
-        for wa in withdraw_amounts:
-            q += wa * premium
-            premium -= 1 / step
-        return q
+class ERC1155TokenContract(TokenContract, ERCTokenContractI, ParamsSubscriber):
+    burn_tolerance = VOUCHER_DUST
 
-    @staticmethod
-    def serialize_vouchers(price: Decimal) -> str:
+    def __init__(self, asset: str = None, bucketing: VoucherBucketingI = None):
+        """
+        :param asset: VA denom the vouchers are issued for, appended to voucher denoms when several assets
+            share one wallet (e.g. <price-1337-ETH>). Single-asset routers leave it out (<price-1337>).
+        :param bucketing: merges purchase prices into buckets, one denom each, to bound the number of denoms.
+            A bucket's original price is the quantity-weighted average of the prices minted into it.
+            None keeps one denom per exact price.
+        """
+        super().__init__()
+        self._asset = asset
+        self._bucketing = bucketing
+        # per bucketed denom: original price * quantity, summed over circulating vouchers
+        self._face_value = defaultdict(Decimal)
+        self._premiums = None
+        self._bind_params()
+
+    def premium_schedule(self, n_tiers: int) -> np.ndarray:
+        """
+        Premium for each withdrawal tier, starting at the safety premium and decreasing by 1 / n_floors per tier.
+        Computed once per parameter set, and dropped whenever a parameter changes.
+        """
+        if self._premiums is None or len(self._premiums) < n_tiers:
+            premiums = []
+            premium = self._params.safety_premium
+            step = self._params.n_floors
+            for _ in range(n_tiers):
+                premiums.append(premium)
+                premium -= 1 / step
+            self._premiums = np.array(premiums, dtype=object)
+        return self._premiums[:n_tiers]
+
+    def balance_adjusted_voucher_quantity(
+        self, steps_va: Union[List[TokenI], np.ndarray]
+    ) -> Union[Decimal, np.ndarray]:
+        """
+        Voucher quantity is the dot product of the amount withdrawn at each tier and the premium schedule.
+
+        :param steps_va: VA tokens withdrawn per tier, or an array of per-tier amounts with one row per buy
+        :return: voucher quantity, or one quantity per row for batched buys
+        """
+        if isinstance(steps_va, np.ndarray):
+            amounts = steps_va
+        else:
+            amounts = np.array([t.amount for t in steps_va], dtype=object)
+        if amounts.shape[-1] == 0:
+            return np.zeros(amounts.shape[:-1]) if amounts.ndim > 1 else Decimal(0)
+
+        premiums = self.premium_schedule(amounts.shape[-1])
+        if amounts.dtype != object:
+            premiums = premiums.astype(float)
+        return amounts.dot(premiums)
+
+    def _on_params_update(self, snapshot: ParamsSnapshot):
+        super()._on_params_update(snapshot)
+        self._premiums = None
+
+    def serialize_vouchers(self, price: Decimal) -> str:
+        if self._bucketing is not None:
+            price = self._bucketing.bucket(price)
+        if self._asset:
+            return "<price-{}-{}>".format(price, self._asset)
         return "<price-{}>".format(price)
 
     @staticmethod
     def deserialize_vouchers(denom: str) -> Decimal:
         return dec(denom[1:-1].split("-")[1])
 
-    def mint_to(self, recipient: AgentI, tokens: TokenI):
-        _, denom = tokens.decompose()
+    @staticmethod
+    def voucher_asset(denom: str) -> Optional[str]:
+        """VA denom a voucher was issued for, or None for single-asset vouchers"""
+        parts = denom[1:-1].split("-")
+        return parts[2] if len(parts) > 2 else None
+
+    def original_price(self, denom: str) -> Decimal:
+        """Price the vouchers were bought at; for a bucket, the quantity-weighted average of its circulating lots"""
+        if self._bucketing is None:
+            return self.deserialize_vouchers(denom)
+        GasMeter.charge("sload", 2)
+        issued = self._tokens_issued[denom]
+        if issued.is_zero():
+            return self.deserialize_vouchers(denom)
+        return self._face_value[denom] / issued
+
+    def mint_to(self, recipient: AgentI, tokens: TokenI, og_price: Decimal = None):
+        """
+        :param og_price: price the vouchers were bought at; None for vouchers returned to their holder,
+            which keep their denom's original price
+        """
+        amount, denom = tokens.decompose()
+        if self._bucketing is not None:
+            price = og_price if og_price is not None else self.original_price(denom)
+            GasMeter.charge("sstore")
+            self._face_value[denom] += price * amount
         super().mint_to(recipient, tokens)
         self._denoms.add(denom)
+
+    def burn(self, tokens: TokenI):
+        amount, denom = tokens.decompose()
+        # burning at the average keeps the average of what remains
+        price = self.original_price(denom) if self._bucketing is not None else None
+        super().burn(tokens)
+        if price is not None:
+            GasMeter.charge("sstore")
+            if self._tokens_issued[denom].is_zero():
+                self._face_value[denom] = Decimal(0)
+            else:
+                self._face_value[denom] -= price * amount
+        return tokens
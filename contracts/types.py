@@ -1,9 +1,9 @@
-from typing import Dict
-from collections import defaultdict
+from typing import Dict, Optional
 from decimal import Decimal
 
+from contracts.wallet_store import WalletStore
 from states.interfaces import TokenI, WalletI, BuyerWalletI, AgentI
-from utils.safe_decimals import gt, lt, leq
+from utils.safe_decimals import leq
 
 
 class DummyProtocolAgent(AgentI):
@@ -63,23 +63,34 @@ class Tokens(TokenI):
 
 
 class Wallet(WalletI):
-    def __init__(self, owner: str):
-        self._owner = owner
-        self._funds = defaultdict(Decimal)
+    """View of one row of a WalletStore"""
 
-        self._total_spent = defaultdict(Decimal)
-        self._total_redeemed = defaultdict(Decimal)
+    def __init__(self, owner: str, store: WalletStore = None):
+        """
+        :param store: table shared by every wallet of a model; by default the wallet gets a store of its own
+        """
+        self._store = store if store is not None else WalletStore()
+        self._row = self._store.add_wallet(owner)
 
     @property
     def owner(self) -> str:
-        return self._owner
+        return self._store.owner(self._row)
+
+    @property
+    def store(self) -> WalletStore:
+        return self._store
+
+    @property
+    def row(self) -> int:
+        return self._row
 
     @property
     def funds(self) -> Dict[str, Decimal]:
-        return self._funds
+        return self._store.funds(self._row)
 
     def initiate_with(self, denom) -> None:
-        self._funds[denom] = Decimal("infinity")
+        """Make the wallet an unlimited source of denom; what it sends is tracked by outflow(denom)"""
+        self._store.set_unlimited(self._row, denom)
 
     def receives(self, tokens: TokenI):
         """
@@ -87,26 +98,41 @@ class Wallet(WalletI):
         Except for voucher tokens; however, we track them in a separate logic.
         """
         amount, denom = tokens.decompose()
-        self._funds[denom] += amount
+        self._store.deposit(self._row, denom, amount)
 
     def sends(self, tokens: TokenI):
         to_send, denom = tokens.decompose()
-        if lt(self._funds[denom], to_send):
+        if not self._store.withdraw(self._row, denom, to_send):
             raise Exception
-        self._funds[denom] -= to_send
+
+    def refund(self, tokens: TokenI):
+        """Tokens sent by a request that was reverted come back, as if never sent"""
+        amount, denom = tokens.decompose()
+        self._store.refund(self._row, denom, amount)
+
+    def outflow(self, denom: str) -> Decimal:
+        return self._store.outflow(self._row, denom)
 
     def balance_of(self, denom: str) -> Decimal:
-        return self._funds[denom]
+        return self._store.balance(self._row, denom)
 
 
 class BuyerWallet(Wallet, BuyerWalletI):
-    def __init__(self, owner: str):
-        super().__init__(owner)
+    def __init__(self, owner: str, store: WalletStore = None):
+        super().__init__(owner, store)
 
     def redeemable_balance(self, cur_price: Decimal):
-        for denom in self._funds:
-            if denom[0] == "<":
-                og_price = Decimal(denom[1:-1].split("-")[1])
-                if leq(og_price, cur_price) and self._funds[denom] != 0:
-                    return Tokens(self._funds[denom], denom)
+        tokens = self._store.tokens
+        for token_id, amount in self._store.lots(self._row):
+            og_price = tokens.voucher_price(token_id)
+            if leq(og_price, cur_price) and amount != 0:
+                return Tokens(amount, tokens.denoms[token_id])
         return
+
+    def cheapest_voucher_price(self) -> Optional[Decimal]:
+        """Lowest price among the vouchers held, None without any"""
+        tokens = self._store.tokens
+        return min(
+            (tokens.voucher_price(token_id) for token_id, amount in self._store.lots(self._row) if amount != 0),
+            default=None,
+        )
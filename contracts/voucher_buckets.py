@@ -0,0 +1,35 @@
+from decimal import ROUND_FLOOR, Decimal
+
+from states.interfaces import VoucherBucketingI
+
+LABEL_EXP = Decimal("0.000001")
+
+
+class TickBuckets(VoucherBucketingI):
+    """Buckets of constant width: [k * tick, (k + 1) * tick)"""
+
+    def __init__(self, tick):
+        self._tick = Decimal(tick)
+
+    def bucket(self, price: Decimal) -> Decimal:
+        return (price / self._tick).to_integral_value(ROUND_FLOOR) * self._tick
+
+    def __repr__(self):
+        return "TickBuckets({})".format(self._tick)
+
+
+class LogBuckets(VoucherBucketingI):
+    """Buckets of constant relative width: [ratio ** k, ratio ** (k + 1))"""
+
+    def __init__(self, ratio):
+        self._ratio = Decimal(ratio)
+        if self._ratio <= 1:
+            raise ValueError("Bucket ratio must be greater than 1, got {}".format(ratio))
+        self._ln_ratio = self._ratio.ln()
+
+    def bucket(self, price: Decimal) -> Decimal:
+        k = int((price.ln() / self._ln_ratio).to_integral_value(ROUND_FLOOR))
+        return (self._ratio ** k).quantize(LABEL_EXP)
+
+    def __repr__(self):
+        return "LogBuckets({})".format(self._ratio)
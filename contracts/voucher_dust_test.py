@@ -0,0 +1,51 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import Mock
+
+from contracts import token_contract
+from contracts.types import Tokens
+from contracts.voucher_buckets import TickBuckets
+from states.errors import NegativeCirculatingSupplyError
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestVoucherDust(unittest.TestCase):
+    def setUp(self):
+        self.erc_tc = token_contract.ERC1155TokenContract()
+        self.denom = self.erc_tc.serialize_vouchers(Decimal(1337))
+        self.erc_tc.mint_to(Mock(), Tokens(Decimal("8.9E-25"), self.denom))
+
+    def test_dust_overdraft_clears_supply(self):
+        self.erc_tc.burn(Tokens(Decimal("8.99E-25"), self.denom))
+        self.assertEqual(self.erc_tc.get_token_issued(self.denom), 0)
+        logger.test("#test_dust_overdraft_clears_supply()")
+
+    def test_overdraft_beyond_dust_is_refused(self):
+        with self.assertRaises(NegativeCirculatingSupplyError):
+            self.erc_tc.burn(Tokens(token_contract.VOUCHER_DUST * 2, self.denom))
+        self.assertEqual(self.erc_tc.get_token_issued(self.denom), Decimal("8.9E-25"))
+        logger.test("#test_overdraft_beyond_dust_is_refused()")
+
+    def test_lp_tokens_have_no_dust_tolerance(self):
+        lp_tc = token_contract.LPTokenContract()
+        lp_tc.mint_to(Mock(), Tokens(Decimal(1), "LP"))
+        with self.assertRaises(NegativeCirculatingSupplyError):
+            lp_tc.burn(Tokens(Decimal(1) + Decimal("1E-27"), "LP"))
+        logger.test("#test_lp_tokens_have_no_dust_tolerance()")
+
+    def test_emptied_bucket_forgets_its_face_value(self):
+        erc_tc = token_contract.ERC1155TokenContract(bucketing=TickBuckets(10))
+        denom = erc_tc.serialize_vouchers(Decimal(1337))
+        erc_tc.mint_to(Mock(), Tokens(Decimal(1), denom), og_price=Decimal(1337))
+        erc_tc.burn(Tokens(Decimal(1) + Decimal("1E-27"), denom))
+        self.assertEqual(erc_tc.get_token_issued(denom), 0)
+        # the next lot minted into the bucket sets its average alone
+        erc_tc.mint_to(Mock(), Tokens(Decimal(2), denom), og_price=Decimal(1335))
+        self.assertEqual(erc_tc.original_price(denom), 1335)
+        logger.test("#test_emptied_bucket_forgets_its_face_value()")
+
+
+if __name__ == "__main__":
+    unittest.main()
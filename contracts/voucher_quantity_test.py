@@ -0,0 +1,83 @@
+import random
+import unittest
+from decimal import Decimal
+
+import numpy as np
+
+from contracts import token_contract
+from contracts.types import Tokens
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+def loop_quantity(steps_va) -> Decimal:
+    """Voucher quantity as it was computed before the premium schedule, one tier at a time"""
+    q = Decimal(0)
+    withdraw_amounts = [t.amount for t in steps_va]
+    premium = Params.safety_premium()
+    step = Params.n_floors()
+    for wa in withdraw_amounts:
+        q += wa * premium
+        premium -= 1 / step
+    return q
+
+
+class TestBalanceAdjustedVoucherQuantity(unittest.TestCase):
+    def setUp(self):
+        Params.hard_reset()
+        self.erc_tc = token_contract.ERC1155TokenContract()
+        self.rng = random.Random(0)
+
+    def tearDown(self) -> None:
+        Params.hard_reset()
+
+    def steps(self, n_tiers: int):
+        return [
+            Tokens(Decimal(str(round(self.rng.uniform(0, 5), 8))), "ETH")
+            for _ in range(n_tiers)
+        ]
+
+    def test_dot_product_matches_loop(self):
+        for n_tiers in range(1, 8):
+            steps_va = self.steps(n_tiers)
+            self.assertEqual(
+                self.erc_tc.balance_adjusted_voucher_quantity(steps_va),
+                loop_quantity(steps_va),
+            )
+        logger.test("#test_dot_product_matches_loop()")
+
+    def test_schedule_follows_parameter_changes(self):
+        steps_va = self.steps(3)
+        self.erc_tc.balance_adjusted_voucher_quantity(steps_va)
+        Params.update(safety_premium=Decimal("1.2"), n_floors=Decimal(6))
+        self.assertEqual(
+            self.erc_tc.balance_adjusted_voucher_quantity(steps_va),
+            loop_quantity(steps_va),
+        )
+        logger.test("#test_schedule_follows_parameter_changes()")
+
+    def test_batched_rows_match_loop(self):
+        batch = [self.steps(4) for _ in range(5)]
+        amounts = np.array([[t.amount for t in steps_va] for steps_va in batch], dtype=object)
+        quantities = self.erc_tc.balance_adjusted_voucher_quantity(amounts)
+        self.assertEqual(list(quantities), [loop_quantity(steps_va) for steps_va in batch])
+
+        # float rows are accepted too
+        quantities = self.erc_tc.balance_adjusted_voucher_quantity(amounts.astype(float))
+        np.testing.assert_allclose(
+            quantities, [float(loop_quantity(steps_va)) for steps_va in batch]
+        )
+        logger.test("#test_batched_rows_match_loop()")
+
+    def test_no_tiers(self):
+        self.assertEqual(self.erc_tc.balance_adjusted_voucher_quantity([]), 0)
+        self.assertEqual(
+            self.erc_tc.balance_adjusted_voucher_quantity(np.zeros((3, 0))).shape, (3,)
+        )
+        logger.test("#test_no_tiers()")
+
+
+if __name__ == "__main__":
+    unittest.main()
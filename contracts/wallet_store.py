@@ -0,0 +1,247 @@
+from array import array
+from decimal import Decimal
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.safe_decimals import lt
+
+ZERO = Decimal(0)
+INFINITY = Decimal("infinity")
+
+
+class TokenRegistry:
+    """Interns token denoms as small integer ids; voucher denoms also get the price in their label parsed once"""
+
+    def __init__(self, original_price: Callable[[str], Decimal] = None):
+        """
+        :param original_price: original price of a voucher denom, as its token contract keeps it.
+            Needed when the label is not the original price (a bucket's original price is the average of its lots);
+            None prices vouchers by their label.
+        """
+        self._ids: Dict[str, int] = {}
+        self.denoms: List[str] = []
+        # price in the label of each voucher token, None for fungible tokens
+        self.label_prices: List[Optional[Decimal]] = []
+        self._original_price = original_price
+
+    def __len__(self):
+        return len(self.denoms)
+
+    def intern(self, denom: str) -> int:
+        token_id = self._ids.get(denom)
+        if token_id is None:
+            token_id = len(self.denoms)
+            self._ids[denom] = token_id
+            self.denoms.append(denom)
+            self.label_prices.append(
+                Decimal(denom[1:-1].split("-")[1]) if self.is_voucher(denom) else None
+            )
+        return token_id
+
+    def voucher_price(self, token_id: int) -> Decimal:
+        """Original price of a voucher token"""
+        if self._original_price is None:
+            return self.label_prices[token_id]
+        return self._original_price(self.denoms[token_id])
+
+    def lookup(self, denom: str) -> Optional[int]:
+        return self._ids.get(denom)
+
+    @staticmethod
+    def is_voucher(denom: str) -> bool:
+        return denom[0] == "<"
+
+
+class WalletStore:
+    """
+    Balances of every wallet in a model, as one struct-of-arrays table.
+
+    Rows are wallets, token ids come from a shared TokenRegistry.
+    Fungible tokens (VA, SA, LP) are few and held by most wallets, so each gets one dense column over all rows.
+    Voucher lots are many and each held by few wallets, so they are stored sparsely:
+    per row, the ids of the lots it holds (in order of receipt) and a parallel list of amounts,
+    plus a map from token id to its slot in those lists. Lots that reach zero are removed;
+    a lot received again after that counts as a new receipt.
+
+    A wallet can be an unlimited source of a fungible token (agents get unlimited VA / SA to spend).
+    Sending from an unlimited source skips the balance check and only adds to the row's outflow counter.
+    """
+
+    def __init__(self, original_price: Callable[[str], Decimal] = None):
+        """:param original_price: see TokenRegistry"""
+        self.tokens = TokenRegistry(original_price)
+        self._owners: List[str] = []
+        self._columns: Dict[int, List[Decimal]] = {}
+        self._lot_ids: List[array] = []
+        self._lot_amounts: List[List[Decimal]] = []
+        self._lot_slots: List[Dict[int, int]] = []
+        # per fungible token: unlimited flag and total sent, for every row
+        self._unlimited: Dict[int, bytearray] = {}
+        self._outflows: Dict[int, List[Decimal]] = {}
+
+    def __len__(self):
+        return len(self._owners)
+
+    def add_wallet(self, owner: str) -> int:
+        row = len(self._owners)
+        self._owners.append(owner)
+        for column in self._columns.values():
+            column.append(ZERO)
+        for column in self._outflows.values():
+            column.append(ZERO)
+        for flags in self._unlimited.values():
+            flags.append(0)
+        self._lot_ids.append(array("l"))
+        self._lot_amounts.append([])
+        self._lot_slots.append({})
+        return row
+
+    def owner(self, row: int) -> str:
+        return self._owners[row]
+
+    def set_unlimited(self, row: int, denom: str) -> None:
+        token_id = self.tokens.intern(denom)
+        if self.tokens.label_prices[token_id] is not None:
+            raise ValueError("Voucher tokens cannot be an unlimited source")
+        if token_id not in self._unlimited:
+            self._unlimited[token_id] = bytearray(len(self._owners))
+            self._outflows[token_id] = [ZERO] * len(self._owners)
+        self._unlimited[token_id][row] = 1
+
+    def is_unlimited(self, row: int, denom: str) -> bool:
+        flags = self._unlimited.get(self.tokens.lookup(denom))
+        return flags is not None and flags[row] == 1
+
+    def outflow(self, row: int, denom: str) -> Decimal:
+        """Total sent from an unlimited source"""
+        outflows = self._outflows.get(self.tokens.lookup(denom))
+        return outflows[row] if outflows is not None else ZERO
+
+    def deposit(self, row: int, denom: str, amount: Decimal) -> None:
+        flags = self._unlimited.get(self.tokens.lookup(denom))
+        if flags is not None and flags[row]:
+            return
+        self.add(row, denom, amount)
+
+    def refund(self, row: int, denom: str, amount: Decimal) -> None:
+        """Undo a withdraw, e.g. of a reverted request; an unlimited source takes it off its outflow"""
+        token_id = self.tokens.lookup(denom)
+        flags = self._unlimited.get(token_id)
+        if flags is not None and flags[row]:
+            self._outflows[token_id][row] -= amount
+            return
+        self.add(row, denom, amount)
+
+    def withdraw(self, row: int, denom: str, amount: Decimal) -> bool:
+        """
+        :return: False, without changing anything, if the balance is insufficient
+        """
+        token_id = self.tokens.lookup(denom)
+        flags = self._unlimited.get(token_id)
+        if flags is not None and flags[row]:
+            self._outflows[token_id][row] += amount
+            return True
+        balance = self.balance(row, denom)
+        if lt(balance, amount):
+            return False
+        self.set_balance(row, denom, balance - amount)
+        return True
+
+    def balance(self, row: int, denom: str) -> Decimal:
+        token_id = self.tokens.lookup(denom)
+        if token_id is None:
+            return ZERO
+        if self.tokens.label_prices[token_id] is None:
+            flags = self._unlimited.get(token_id)
+            if flags is not None and flags[row]:
+                return INFINITY
+            column = self._columns.get(token_id)
+            return column[row] if column is not None else ZERO
+        slot = self._lot_slots[row].get(token_id)
+        return self._lot_amounts[row][slot] if slot is not None else ZERO
+
+    def set_balance(self, row: int, denom: str, amount: Decimal) -> None:
+        token_id = self.tokens.intern(denom)
+        if self.tokens.label_prices[token_id] is None:
+            self._column(token_id)[row] = amount
+            return
+        self._set_lot(row, token_id, amount, self._lot_slots[row].get(token_id))
+
+    def add(self, row: int, denom: str, amount: Decimal) -> None:
+        token_id = self.tokens.intern(denom)
+        if self.tokens.label_prices[token_id] is None:
+            self._column(token_id)[row] += amount
+            return
+        slot = self._lot_slots[row].get(token_id)
+        held = self._lot_amounts[row][slot] if slot is not None else ZERO
+        self._set_lot(row, token_id, held + amount, slot)
+
+    def _column(self, token_id: int) -> List[Decimal]:
+        column = self._columns.get(token_id)
+        if column is None:
+            column = self._columns[token_id] = [ZERO] * len(self._owners)
+        return column
+
+    def _set_lot(self, row: int, token_id: int, amount: Decimal, slot: Optional[int]) -> None:
+        """:param slot: the lot's slot in the row, None if the row holds no such lot"""
+        slots = self._lot_slots[row]
+        if slot is None:
+            if not amount.is_zero():
+                slots[token_id] = len(self._lot_ids[row])
+                self._lot_ids[row].append(token_id)
+                self._lot_amounts[row].append(amount)
+        elif amount.is_zero():
+            ids = self._lot_ids[row]
+            del ids[slot]
+            del self._lot_amounts[row][slot]
+            del slots[token_id]
+            for later in ids[slot:]:
+                slots[later] -= 1
+        else:
+            self._lot_amounts[row][slot] = amount
+
+    def lots(self, row: int) -> Iterator[Tuple[int, Decimal]]:
+        """(voucher token id, amount) of every lot the wallet holds, in order of receipt"""
+        return zip(self._lot_ids[row], self._lot_amounts[row])
+
+    def value_lots(self, rows: Sequence[int], prices: Dict[str, Decimal]) -> np.ndarray:
+        """
+        Value of every lot held by each of rows, summed per row, in one pass over the sparse lot table:
+        lots are flattened to (row, token id, amount) triplets, priced by token id and added up per row.
+
+        :param prices: value of one voucher per denom; lots of other denoms are worth nothing
+        :return: one value per row
+        """
+        price_of = np.full(len(self.tokens), ZERO, dtype=object)
+        for denom, price in prices.items():
+            token_id = self.tokens.lookup(denom)
+            if token_id is not None:
+                price_of[token_id] = price
+        counts = np.array([len(self._lot_ids[row]) for row in rows], dtype=np.intp)
+        owners = np.repeat(np.arange(len(rows)), counts)
+        token_ids = np.fromiter(
+            chain.from_iterable(self._lot_ids[row] for row in rows), dtype=np.intp, count=counts.sum()
+        )
+        amounts = np.empty(len(token_ids), dtype=object)
+        amounts[:] = list(chain.from_iterable(self._lot_amounts[row] for row in rows))
+        values = np.full(len(rows), ZERO, dtype=object)
+        np.add.at(values, owners, price_of[token_ids] * amounts)
+        return values
+
+    def funds(self, row: int) -> Dict[str, Decimal]:
+        """Materialized {denom: amount} of one wallet, for inspection"""
+        denoms = self.tokens.denoms
+        funds = {
+            denoms[token_id]: column[row]
+            for token_id, column in self._columns.items()
+            if not column[row].is_zero()
+        }
+        funds.update(
+            (denoms[token_id], INFINITY)
+            for token_id, flags in self._unlimited.items()
+            if flags[row]
+        )
+        funds.update((denoms[token_id], amount) for token_id, amount in self.lots(row))
+        return funds
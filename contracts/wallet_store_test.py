@@ -0,0 +1,114 @@
+import unittest
+from decimal import Decimal
+
+from contracts.wallet_store import INFINITY, WalletStore
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestWalletStore(unittest.TestCase):
+    def setUp(self):
+        self.store = WalletStore()
+        self.alice = self.store.add_wallet("alice")
+        self.bob = self.store.add_wallet("bob")
+
+    def lot_denoms(self, row: int):
+        return [self.store.tokens.denoms[token_id] for token_id, _ in self.store.lots(row)]
+
+    def test_fungible_deposit_and_withdraw(self):
+        self.store.deposit(self.alice, "USDC", Decimal(100))
+        self.assertTrue(self.store.withdraw(self.alice, "USDC", Decimal(30)))
+        self.assertEqual(self.store.balance(self.alice, "USDC"), 70)
+        self.assertEqual(self.store.balance(self.bob, "USDC"), 0)
+
+        # an insufficient balance changes nothing
+        self.assertFalse(self.store.withdraw(self.alice, "USDC", Decimal(71)))
+        self.assertEqual(self.store.balance(self.alice, "USDC"), 70)
+        logger.test("#test_fungible_deposit_and_withdraw()")
+
+    def test_unlimited_source_counts_outflow(self):
+        self.store.set_unlimited(self.alice, "ETH")
+        self.assertEqual(self.store.balance(self.alice, "ETH"), INFINITY)
+        self.assertTrue(self.store.withdraw(self.alice, "ETH", Decimal(5)))
+        self.store.deposit(self.alice, "ETH", Decimal(100))
+        self.assertEqual(self.store.outflow(self.alice, "ETH"), 5)
+
+        # a reverted request takes the amount off the outflow
+        self.store.refund(self.alice, "ETH", Decimal(2))
+        self.assertEqual(self.store.outflow(self.alice, "ETH"), 3)
+        self.assertFalse(self.store.is_unlimited(self.bob, "ETH"))
+        with self.assertRaises(ValueError):
+            self.store.set_unlimited(self.alice, "<price-1337>")
+        logger.test("#test_unlimited_source_counts_outflow()")
+
+    def test_lots_in_order_of_first_receipt(self):
+        self.store.deposit(self.alice, "<price-1500>", Decimal(2))
+        self.store.deposit(self.alice, "<price-1337>", Decimal(1))
+        self.store.deposit(self.alice, "<price-1500>", Decimal(3))
+        tokens = self.store.tokens
+        self.assertEqual(
+            [(tokens.denoms[token_id], amount) for token_id, amount in self.store.lots(self.alice)],
+            [("<price-1500>", 5), ("<price-1337>", 1)],
+        )
+        self.assertEqual(self.store.balance(self.alice, "<price-1337>"), 1)
+        self.assertEqual(list(self.store.lots(self.bob)), [])
+        self.assertEqual(self.store.balance(self.bob, "<price-1500>"), 0)
+        logger.test("#test_lots_in_order_of_first_receipt()")
+
+    def test_lot_withdraw(self):
+        self.store.deposit(self.alice, "<price-1337>", Decimal(4))
+        self.assertFalse(self.store.withdraw(self.alice, "<price-1337>", Decimal(5)))
+        self.assertTrue(self.store.withdraw(self.alice, "<price-1337>", Decimal(3)))
+        self.assertEqual(self.store.balance(self.alice, "<price-1337>"), 1)
+        self.assertFalse(self.store.withdraw(self.bob, "<price-1337>", Decimal(1)))
+        logger.test("#test_lot_withdraw()")
+
+    def test_emptied_lots_are_removed(self):
+        for price in (1300, 1337, 1400, 1500):
+            self.store.deposit(self.alice, "<price-{}>".format(price), Decimal(1))
+        self.assertTrue(self.store.withdraw(self.alice, "<price-1337>", Decimal(1)))
+        self.store.set_balance(self.alice, "<price-1300>", Decimal(0))
+        self.assertEqual(self.lot_denoms(self.alice), ["<price-1400>", "<price-1500>"])
+
+        # the lots after a removed one are still found, and a lot received again comes last
+        self.store.add(self.alice, "<price-1500>", Decimal(2))
+        self.store.deposit(self.alice, "<price-1337>", Decimal(5))
+        self.assertEqual(self.store.balance(self.alice, "<price-1500>"), 3)
+        self.assertEqual(self.store.balance(self.alice, "<price-1300>"), 0)
+        self.assertEqual(
+            self.lot_denoms(self.alice), ["<price-1400>", "<price-1500>", "<price-1337>"]
+        )
+        self.assertEqual(self.store.funds(self.alice)["<price-1337>"], 5)
+
+        # zero is never stored as a lot
+        self.store.add(self.bob, "<price-1337>", Decimal(0))
+        self.assertEqual(list(self.store.lots(self.bob)), [])
+        logger.test("#test_emptied_lots_are_removed()")
+
+    def test_value_lots_per_row(self):
+        self.store.deposit(self.alice, "<price-1337>", Decimal(2))
+        self.store.deposit(self.alice, "<price-1500>", Decimal(1))
+        self.store.deposit(self.bob, "<price-1500>", Decimal(4))
+        charlie = self.store.add_wallet("charlie")
+        values = self.store.value_lots(
+            [self.alice, self.bob, charlie], {"<price-1337>": Decimal(10), "<price-2000>": Decimal(1)}
+        )
+        # unpriced lots are worth nothing
+        self.assertEqual(list(values), [20, 0, 0])
+        logger.test("#test_value_lots_per_row()")
+
+    def test_funds(self):
+        self.store.set_unlimited(self.alice, "ETH")
+        self.store.deposit(self.alice, "LP", Decimal(1))
+        self.store.deposit(self.alice, "<price-1337>", Decimal(2))
+        self.assertEqual(
+            self.store.funds(self.alice),
+            {"ETH": INFINITY, "LP": 1, "<price-1337>": 2},
+        )
+        self.assertEqual(self.store.funds(self.bob), {})
+        logger.test("#test_funds()")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,36 +1,43 @@
+import copy
+import random
 import mesa
+from utils import abm
+from utils.gas_meter import GasMeter
 from decimal import *
-import pandas as pd
-from IPython.display import display
 
 from contracts import router_factory
+from contracts.mempool import BlockRouter
 from agents.buyer import BuyerAgent
 from agents.oracle import Oracle
 from agents.lp_provider import ProviderAgent
 from states.params import Params
+from utils.safe_decimals import leq
 from contracts.types import DummyProtocolAgent, Tokens
+from contracts.wallet_store import WalletStore
+from states.errors import CannotLiquidateEnoughError
+from simulation.stopping_rules import default_stopping_rules
 
 """Model Data Collector Methods"""
 
 
+def eth_prices(model):
+    return Oracle.get_price_of("ETH")
+
+
 def sa_balance(model):
-    return model.router._sa_pool.balance
+    return model.router.pool_balances()[1]
 
 
 def fee_balance(model):
-    return model.router._fee_pool.balance
+    return model.router.pool_balances()[2]
 
 
 def va_balance(model):
-    return model.router._va_pool.balance * Oracle.get_price_of("ETH")
+    return model.router.va_pool_value_usd()
 
 
 def total(model):
-    return (
-        model.router._sa_pool.balance
-        + model.router._fee_pool.balance
-        + model.router._va_pool.balance * Oracle.get_price_of("ETH")
-    )
+    return model.router.total_asset_value_usd()
 
 
 def num_triggered(model):
@@ -41,67 +48,256 @@ def num_rebalanced(model):
     return model.router.num_rebalanced
 
 
+def stop_reason(model):
+    return model.stop_reason
+
+
+def pending_requests(model):
+    return model.router.num_pending
+
+
+def mean_inclusion_delay(model):
+    return model.router.mean_inclusion_delay()
+
+
+def redemption_fairness(model):
+    return model.router.redemption_fairness()
+
+
+def gas_used(model):
+    # the step just taken
+    return GasMeter.step_gas(model.schedule.steps - 1)
+
+
+def redeemable_vouchers_usd(model):
+    return model.redeemable_usd
+
+
+def liquidations_saved(model):
+    return model.router.liquidation_netting.num_saved
+
+
+def liquidation_spread_saved(model):
+    return model.router.liquidation_netting.spread_saved_usd
+
+
 class LifelyPayModel(mesa.Model):
-    def __init__(self, n):
+    def __init__(
+        self,
+        n,
+        stopping_rules=None,
+        seed=None,
+        price_path=None,
+        initial_liquidity=Decimal(1000000),
+        va_denoms=("ETH",),
+        block_size=None,
+        block_ordering="fifo",
+        blocks_per_step=None,
+        voucher_bucketing=None,
+        net_liquidations=False,
+        meter_gas=False,
+        activation="random",
+        n_providers=None,
+    ):
+        """
+        :param n: number of buyers (and of providers, unless n_providers is given)
+        :param stopping_rules: rules checked after every step; defaults to default_stopping_rules(),
+            pass an empty list to always run until max_steps
+        :param seed: seeds both the scheduler and the agents (which draw from the global random module)
+        :param price_path: ETH price to set at the start of each step; price stays put once exhausted
+        :param initial_liquidity: protocol-injected USDC liquidity
+        :param va_denoms: VA denoms accepted for payment; buyers are assigned one each, round robin
+        :param block_size: if given, agents' requests go through a mempool and are executed in blocks of this size
+        :param block_ordering: order of inclusion in blocks, "fifo", "fee" or "random"
+        :param blocks_per_step: blocks produced per step; None includes every pending request each step
+        :param voucher_bucketing: price buckets vouchers are merged into, e.g. voucher_buckets.TickBuckets(10);
+            None issues one voucher denom per exact price
+        :param net_liquidations: defer the router's liquidations and execute them net, once per block
+            (or per step without a mempool); see contracts.liquidation_netting. Only the sales are deferred:
+            emergency and refill checks still run after every request (after every block with a mempool)
+        :param meter_gas: estimate the on-chain cost of every router operation, see utils.gas_meter;
+            the protocol's initial liquidity is not metered
+        :param activation: "random" steps every agent every step; "sampled" only steps the agents whose coins
+            say they act, and parks agents that cannot act until a price or liquidity trigger wakes them
+            (see abm.SampledActivation). Same dynamics in distribution, not the same random draws.
+        :param n_providers: number of providers; defaults to n, 0 leaves the protocol's liquidity on its own
+        """
         super().__init__()
-        self.router = router_factory.Router("ETH", "USDC")
+        if seed is not None:
+            random.seed(seed)
+        Oracle.reset()
+        self.price_path = price_path
+        if len(va_denoms) > 1:
+            self.router = router_factory.MultiAssetRouter(
+                list(va_denoms), "USDC", voucher_bucketing
+            )
+        else:
+            self.router = router_factory.Router(
+                va_denoms[0], "USDC", voucher_bucketing=voucher_bucketing
+            )
 
         # Initiate w/ $1M Protocol-injected Liquidity
         self.router.process_lp_provider_request(
-            DummyProtocolAgent(), Tokens(Decimal(1000000), "USDC")
+            DummyProtocolAgent(), Tokens(Decimal(initial_liquidity), "USDC")
         )
+        if meter_gas:
+            GasMeter.enable()
+        else:
+            GasMeter.disable()
+        if net_liquidations:
+            self.router.liquidation_netting.enabled = True
+        self.net_liquidations = net_liquidations
+        if block_size is not None:
+            self.router = BlockRouter(
+                self.router, block_size, block_ordering, blocks_per_step
+            )
 
-        self.schedule = mesa.time.RandomActivation(self)
+        if activation == "sampled":
+            self.schedule = abm.SampledActivation(self)
+        elif activation == "random":
+            self.schedule = mesa.time.RandomActivation(self)
+        else:
+            raise ValueError(
+                "Unknown activation {}, expected random or sampled".format(activation)
+            )
+        self.va_denoms = list(va_denoms)
+        # every agent's wallet is a row of this table; without bucketing a voucher's label is its original price
+        self.wallets = WalletStore(
+            self.router.original_price if voucher_bucketing is not None else None
+        )
+        self.buyers = []
         for i in range(n):
-            ba = BuyerAgent(i, "DIMWIT-" + str(i), self.router, self)
-            # buyer gets infinite ETH to spend
+            denom = va_denoms[i % len(va_denoms)]
+            ba = BuyerAgent(
+                i, "DIMWIT-" + str(i), self.router, self, denom, self.wallets
+            )
+            # buyer gets infinite VA to spend
             # amount paid and amount redeemed is tracked separately
-            ba.initiate_with("ETH")
+            ba.initiate_with(denom)
             self.schedule.add(ba)
+            self.buyers.append(ba)
 
-        for i in range(n, 2 * n):
-            pa = ProviderAgent(i, "DIPSHIT-" + str(i), self.router, self)
+        self.providers = []
+        if n_providers is None:
+            n_providers = n
+        for i in range(n, n + n_providers):
+            pa = ProviderAgent(
+                i, "DIPSHIT-" + str(i), self.router, self, self.wallets
+            )
             # provider gets infinite USDC to stake
             # amount staked and amount redeemed is tracked separately
             pa.initiate_with("USDC")
             self.schedule.add(pa)
+            self.providers.append(pa)
+
+        # rules are stateful, so never share instances between runs
+        self.stopping_rules = copy.deepcopy(
+            default_stopping_rules() if stopping_rules is None else stopping_rules
+        )
+        self.stop_reason = None
+        # quoted by every step before collecting, for the model and agent reporters
+        self.redeemable_usd = Decimal(0)
+
+        model_reporters = {
+            "ETH Prices": eth_prices,
+            "USDC Pool Balance USD": sa_balance,
+            "ETH Pool Balance USD": va_balance,
+            "Fee Pool Balance USDC": fee_balance,
+            "Total Asset Value USD": total,
+            "# Emergency Triggers": num_triggered,
+            "# Pool Rebalancing": num_rebalanced,
+            "Redeemable Vouchers USD": redeemable_vouchers_usd,
+            "Stop Reason": stop_reason,
+        }
+        if block_size is not None:
+            model_reporters.update(
+                {
+                    "Pending Requests": pending_requests,
+                    "Mean Inclusion Delay": mean_inclusion_delay,
+                    "Redemption Fairness": redemption_fairness,
+                }
+            )
+        if meter_gas:
+            model_reporters["Gas Used"] = gas_used
+        if net_liquidations:
+            model_reporters.update(
+                {
+                    "# Liquidations Saved": liquidations_saved,
+                    "Liquidation Spread Saved USD": liquidation_spread_saved,
+                }
+            )
 
         self.running = True
         self.datacollector = mesa.DataCollector(
-            model_reporters={
-                "USDC Pool Balance USD": sa_balance,
-                "ETH Pool Balance USD": va_balance,
-                "Fee Pool Balance USDC": fee_balance,
-                "Total Asset Value USD": total,
-                "# Emergency Triggers": num_triggered,
-                "# Pool Rebalancing": num_rebalanced,
-            },
+            model_reporters=model_reporters,
             agent_reporters={
                 "buyer_spent_eth_usd": "spent_eth_usd",
                 "buyer_redeemed_eth_usd": "redeemed_eth_usd",
                 "buyer_remaining_vouchers": "remaining_vouchers",
+                "buyer_redeemable_usd": "redeemable_usd",
                 "staker_staked_usd": "staked_usd",
                 "staker_redeemed_usd": "redeemed_usd",
                 "staker_APY": "apy",
+                "staker_accrued_fees_usd": "accrued_fees",
             },
         )
 
     def step(self):
-        self.schedule.step()
+        if self.price_path is not None and self.schedule.steps < len(self.price_path):
+            Oracle.set_price(Decimal(str(self.price_path[self.schedule.steps])))
+        GasMeter.step = self.schedule.steps
+        if isinstance(self.schedule, abm.SampledActivation):
+            for denom in self.va_denoms:
+                self.schedule.wake(("price", denom), Oracle.get_price_of(denom), leq)
+            if self.router.is_accepting_liquidity:
+                self.schedule.wake("liquidity", 0)
+        try:
+            self.schedule.step()
+            if isinstance(self.router, BlockRouter):
+                self.router.produce_blocks()
+            elif self.net_liquidations:
+                self.router.settle_liquidations()
+                self.router.rebalance()
+        except CannotLiquidateEnoughError:
+            # VA Pool is depleted; nothing after this point is meaningful
+            # the aborted step still counts, so collected records stay aligned with steps
+            self.schedule.steps += 1
+            self.schedule.time += 1
+            self.stop("VA Pool Depleted")
+        for rule in self.stopping_rules:
+            if self.stop_reason:
+                break
+            reason = rule.check(self)
+            if reason:
+                self.stop(reason)
+        self.quote_redemptions()
         self.datacollector.collect(self)
 
+    def quote_redemptions(self):
+        """What redeeming every buyer's vouchers would pay at the current price, quoted for all buyers at once"""
+        _, _, per_buyer = self.router.quote_redeem_all(self.buyers)
+        for buyer, usd in zip(self.buyers, per_buyer):
+            buyer.redeemable_usd = usd
+        self.redeemable_usd = sum(per_buyer, Decimal(0))
+
+    def stop(self, reason):
+        self.running = False
+        self.stop_reason = reason
+
 
 if __name__ == "__main__":
+    from simulation.result_cache import ResultCache
+    from simulation.result_store import ResultStore
+    from simulation.sweep import run_sweep
+
     getcontext().prec = 18
-    results = mesa.batch_run(
-        LifelyPayModel,
+    store = run_sweep(
         parameters={"n": 50},
         iterations=1,
         max_steps=300,
-        number_processes=1,
-        data_collection_period=1,
-        display_progress=False,
+        processes=1,
+        cache=ResultCache(),
+        store=ResultStore("sweep_results"),
     )
     Params.hard_reset()
-    rdf = pd.DataFrame(results)
-    one_iteration = rdf[(rdf.iteration == 0)]
+    one_iteration = store.load(iteration=0)
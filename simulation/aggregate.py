@@ -0,0 +1,400 @@
+"""
+Aggregate-flow engine for fast parameter screening.
+
+Instead of individual agents, every step draws the total buyer and provider flows from a FlowProfile calibrated on
+ABM runs (see simulation.aggregate_validation), and applies them to the pools with the same rules as the Router:
+tiered SA withdrawals (BalanceTracker.get_withdraw_amount_per_range), the voucher premium schedule,
+the max redeem rate (InflationTracker.calculate_max_redeem_rate) and the three rebalance cases.
+
+State is float64 arrays of shape (parameter sets, price paths), so thousands of combinations advance in one
+vectorized step. Vouchers are kept as one cohort per mint step, which is exact: every voucher minted in a step
+shares that step's price.
+
+Approximations, compared to the ABM:
+    - each step runs its flows as four batches (redeem, buy, LP redeem, stake), each followed by one rebalance,
+      instead of interleaving individual requests; the max redeem rate is computed once per step
+    - the emergency countdown is decremented by the expected number of requests, instead of once per request
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from states.params import Params
+
+# the literals BalanceTracker.rebalance uses
+THRESHOLD = 1.1111111
+EMERGENCY_COUNT = 200
+INITIAL_PRICE = 1337.0
+
+SCREENED = (
+    "tolerance",
+    "content",
+    "tx_fee_rate",
+    "op_premium",
+    "n_floors",
+    "safety_premium",
+    "redeem_cap",
+    "liquidation_spread",
+    "buy_cap",
+    "stake_cap",
+)
+
+VOLUMES = ("buy_va", "stake_usd", "requests")
+RATES = ("redeem_rate", "lp_redeem_rate", "fee_harvest_rate")
+FLOWS = VOLUMES + RATES
+
+OUTPUTS = (
+    "ETH Prices",
+    "USDC Pool Balance USD",
+    "ETH Pool Balance USD",
+    "Fee Pool Balance USDC",
+    "Total Asset Value USD",
+    "# Emergency Triggers",
+    "# Pool Rebalancing",
+    "Remaining Vouchers",
+    "Buyer Redeemed USD",
+    "Staker Redeemed USD",
+)
+
+
+def leq(a, b):
+    """safe_decimals.leq for arrays: less than, or within math.isclose's default tolerance"""
+    return (a < b) | np.isclose(a, b, rtol=1e-9, atol=0)
+
+
+def lt(a, b):
+    return ~leq(b, a)
+
+
+@dataclass
+class FlowProfile:
+    """
+    Per-step distribution of each flow: mean and standard deviation over calibration runs.
+
+    Volumes are per agent (ETH bought per buyer, USDC staked per provider, requests per buyer-provider pair);
+    rates are the fraction of what is outstanding at the start of the step (in-the-money vouchers,
+    providers' LP tokens, fees accrued to providers) that is redeemed. Steps past the calibrated horizon reuse
+    the last step.
+    """
+
+    mean: Dict[str, np.ndarray]
+    std: Dict[str, np.ndarray]
+    # population and caps the profile was calibrated with; volumes scale linearly with the caps
+    n: int
+    buy_cap: float
+    stake_cap: float
+
+    @property
+    def steps(self) -> int:
+        return len(self.mean["buy_va"])
+
+    def sample(
+        self, flow: str, t: int, n: int, shape: Tuple[int, ...], rng: np.random.Generator
+    ) -> np.ndarray:
+        """
+        Totals over n agents for volumes, population-wide fractions for rates.
+        The calibrated spread is that of a population of self.n, rescaled to n.
+        """
+        t = min(t, self.steps - 1)
+        mean, std = self.mean[flow][t], self.std[flow][t]
+        if flow in RATES:
+            return np.clip(rng.normal(mean, std * np.sqrt(self.n / n), shape), 0, 1)
+        return np.maximum(rng.normal(n * mean, std * np.sqrt(n * self.n), shape), 0)
+
+    def save(self, path: str) -> None:
+        arrays = {"mean_" + f: self.mean[f] for f in FLOWS}
+        arrays.update({"std_" + f: self.std[f] for f in FLOWS})
+        np.savez(
+            path,
+            meta=np.array([self.n, self.buy_cap, self.stake_cap], dtype=float),
+            **arrays
+        )
+
+    @staticmethod
+    def load(path: str) -> "FlowProfile":
+        with np.load(path) as data:
+            n, buy_cap, stake_cap = data["meta"]
+            return FlowProfile(
+                {f: data["mean_" + f] for f in FLOWS},
+                {f: data["std_" + f] for f in FLOWS},
+                int(n),
+                float(buy_cap),
+                float(stake_cap),
+            )
+
+
+@dataclass
+class AggregateResult:
+    # output name -> (steps, parameter sets, price paths)
+    series: Dict[str, np.ndarray]
+    # step at which the VA pool could not cover a liquidation, -1 if it never happened
+    depleted_at: np.ndarray
+
+    def final(self, name: str) -> np.ndarray:
+        """(parameter sets, price paths); depleted combinations keep their values from the step they stopped"""
+        return self.series[name][-1]
+
+
+class AggregateEngine:
+    def __init__(
+        self,
+        profile: FlowProfile,
+        params: Optional[Dict[str, Sequence[float]]] = None,
+        n: int = 50,
+        initial_liquidity: float = 1000000.0,
+    ):
+        """
+        :param profile: calibrated flows
+        :param params: parameter name -> one value per parameter set; unlisted parameters keep their current value
+        :param n: buyers (and providers) the flows are scaled to
+        """
+        params = params or {}
+        unknown = set(params) - set(SCREENED)
+        if unknown:
+            raise ValueError(
+                "Cannot screen {}, expected a subset of {}".format(sorted(unknown), SCREENED)
+            )
+        lengths = {len(v) for v in params.values()}
+        if len(lengths) > 1:
+            raise ValueError("Every parameter needs the same number of values")
+        self.num_sets = lengths.pop() if lengths else 1
+
+        snapshot = Params.snapshot()
+        # (parameter sets, 1): broadcasts against (parameter sets, price paths) state
+        self._p = {
+            name: np.asarray(
+                params.get(name, [float(getattr(snapshot, name))] * self.num_sets),
+                dtype=float,
+            ).reshape(-1, 1)
+            for name in SCREENED
+        }
+        self._profile = profile
+        self._n = n
+        self._initial_liquidity = float(initial_liquidity)
+
+    def run(
+        self,
+        price_paths: Optional[Sequence] = None,
+        steps: int = 300,
+        seed: Optional[int] = None,
+    ) -> AggregateResult:
+        """
+        :param price_paths: ETH price per step, one row per path (a single path may be 1-D);
+            the price stays put once a path is exhausted, as in LifelyPayModel. None keeps the initial price.
+        """
+        if price_paths is None:
+            price_paths = [[INITIAL_PRICE]]
+        paths = np.atleast_2d(np.asarray(price_paths, dtype=float))
+        prices = paths[:, np.minimum(np.arange(steps), paths.shape[1] - 1)]
+
+        state = _State(self.num_sets, len(paths), steps, self._initial_liquidity)
+        rng = np.random.default_rng(seed)
+        series = {name: np.empty((steps,) + state.shape) for name in OUTPUTS}
+        for t in range(steps):
+            self._step(state, t, prices[:, t], prices, rng)
+            for name, value in state.outputs(prices[:, t]).items():
+                series[name][t] = value
+        return AggregateResult(series, state.depleted_at)
+
+    def _step(self, s: "_State", t: int, price: np.ndarray, prices: np.ndarray, rng):
+        p, n = self._p, self._n
+        requests = self._profile.sample("requests", t, n, s.shape, rng)
+        # one rebalance per batch, each standing in for a quarter of the step's requests
+        ticks = requests / 4
+
+        self._redeem(s, t, price, prices[:, : t + 1], rng)
+        self._rebalance(s, price, ticks)
+
+        buy_va = self._profile.sample("buy_va", t, n, s.shape, rng)
+        self._buy(s, t, price, buy_va * p["buy_cap"] / self._profile.buy_cap)
+        self._rebalance(s, price, ticks)
+
+        self._redeem_lp(
+            s,
+            t,
+            price,
+            self._profile.sample("lp_redeem_rate", t, n, s.shape, rng),
+            self._profile.sample("fee_harvest_rate", t, n, s.shape, rng),
+        )
+        self._rebalance(s, price, ticks)
+
+        stake = self._profile.sample("stake_usd", t, n, s.shape, rng)
+        self._stake(s, stake * p["stake_cap"] / self._profile.stake_cap)
+        self._rebalance(s, price, ticks)
+
+    def _buy(self, s: "_State", t: int, price: np.ndarray, buy_va: np.ndarray):
+        p = self._p
+        buy_va = np.where(s.alive, buy_va, 0)
+        s.va += buy_va
+        cost = buy_va * price
+
+        # tiered withdrawal from the SA pool, top tier first; vouchers get each tier's premium
+        n_floors = p["n_floors"]
+        remaining = cost.copy()
+        ceiling = s.sa.copy()
+        withdrawn = np.zeros(s.shape)
+        vouchers = np.zeros(s.shape)
+        open_ = ~s.warning
+        for k in range(int(n_floors.max()) - 1):
+            floor = s.principal * (n_floors - 1 - k) / n_floors
+            active = (
+                open_ & (k < n_floors - 1) & ~leq(remaining, 0) & ~leq(s.sa, floor)
+            )
+            take = np.where(active, np.minimum(ceiling - floor, remaining), 0)
+            vouchers += take / price * (p["safety_premium"] - k / n_floors)
+            remaining -= take
+            withdrawn += take
+            ceiling = np.where(active, floor, ceiling)
+        s.sa -= withdrawn
+
+        # automated conversion of whatever the tiers did not cover (everything in warning state)
+        convert_va = np.where(open_, remaining, cost) / price
+        s.deplete(lt(s.va, convert_va), t)
+        s.va -= np.where(s.alive, convert_va, 0)
+        s.collect_fee(np.where(s.alive, cost * p["tx_fee_rate"], 0))
+        s.vouchers[..., t] += np.where(s.alive & open_, vouchers, 0)
+
+    def _redeem(self, s: "_State", t: int, price: np.ndarray, og: np.ndarray, rng):
+        """
+        :param og: (price paths, cohorts so far) original price of every voucher cohort
+        """
+        p = self._p
+        price_c = price[:, None]
+        og = og[None]
+        outstanding = s.vouchers[..., : t + 1]
+        inflation = np.maximum(price_c / og - 1, 0)
+        returns = (inflation * og * outstanding).sum(-1)
+
+        target = np.maximum(s.principal - s.sa - s.fee, 0)
+        surplus = np.maximum(s.va * price - target, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            max_rate = np.where(
+                leq(surplus, 0) | leq(returns, 0),
+                0,
+                np.minimum(surplus / returns, p["redeem_cap"]),
+            )
+
+        rate = self._profile.sample("redeem_rate", t, self._n, s.shape, rng)
+        in_the_money = leq(og, price_c)
+        sent = np.where(s.alive, rate, 0)[..., None] * outstanding * in_the_money
+        redeem_usd = (og * sent * inflation).sum(-1) * max_rate
+        # lots with nothing to redeem are minted back
+        burned = sent * ((inflation * max_rate[..., None]) > 0)
+        s.vouchers[..., : t + 1] -= burned
+
+        s.va -= redeem_usd / price
+        s.collect_fee(redeem_usd * p["op_premium"])
+        s.buyer_redeemed += redeem_usd * (1 - p["op_premium"])
+
+    def _stake(self, s: "_State", stake: np.ndarray):
+        accepting = s.principal <= self._p["stake_cap"] * 2
+        stake = np.where(s.alive & accepting, stake, 0)
+        s.sa += stake
+        s.principal += stake
+        s.lp += stake / self._initial_liquidity
+
+    def _redeem_lp(
+        self, s: "_State", t: int, price: np.ndarray, rate: np.ndarray, harvest: np.ndarray
+    ):
+        # the protocol holds the first LP token, providers hold the rest
+        sent = np.where(s.alive, rate, 0) * (s.lp - 1)
+        portion = sent / s.lp
+        redeem_sa = (s.principal + self._initial_liquidity) * portion
+        # redeeming providers harvest everything their LP tokens accrued (see FeeAccumulator),
+        # so fees are paid at their own rate rather than pro rata to the LP tokens sent
+        redeem_fee = np.where(s.alive, harvest, 0) * s.provider_fees
+
+        # SA shortfall is covered by liquidating exactly that much VA
+        shortfall = np.where(lt(s.sa, redeem_sa), redeem_sa - s.sa, 0)
+        s.deplete(lt(s.va, shortfall / price), t)
+        ok = s.alive
+        s.va -= np.where(ok, shortfall / price, 0)
+        s.sa += np.where(ok, shortfall - redeem_sa, 0)
+        s.principal -= np.where(ok, redeem_sa, 0)
+        s.fee -= np.where(ok, redeem_fee, 0)
+        s.provider_fees -= np.where(ok, redeem_fee, 0)
+        s.lp -= np.where(ok, sent, 0)
+        s.staker_redeemed += np.where(ok, redeem_sa + redeem_fee, 0)
+
+    def _rebalance(self, s: "_State", price: np.ndarray, ticks: np.ndarray):
+        p = self._p
+        va_usd = s.va * price
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target_price = np.where(
+                s.va > 0, np.maximum(s.principal - s.sa - s.fee, 0) / s.va, 0
+            )
+        below = leq(price, target_price * THRESHOLD)
+
+        # Case 1 (EMERGENCY): liquidate all VA at the liquidation spread
+        trigger = s.alive & ~s.warning & below
+        s.num_triggered += trigger
+        s.warning |= trigger
+        s.count = np.where(trigger, EMERGENCY_COUNT, s.count)
+        s.sa += np.where(trigger, va_usd * (1 - p["liquidation_spread"]), 0)
+        s.va = np.where(trigger, 0, s.va)
+
+        # Case 2: refill the SA pool up to content level
+        refill = s.alive & ~trigger & leq(s.sa, s.principal * p["tolerance"])
+        s.num_rebalanced += refill
+        to_refill = np.where(
+            refill, np.minimum(va_usd, s.principal * p["content"] - s.sa), 0
+        )
+        s.va -= to_refill / price
+        s.sa += to_refill
+
+        # Case 3: stable again, warning is lifted once the countdown has run out
+        rest = s.alive & ~trigger & ~refill
+        s.warning = np.where(rest & s.warning & ~below, s.count > 0, s.warning)
+        s.count = np.where(rest, s.count - ticks, s.count)
+
+
+class _State:
+    def __init__(self, num_sets: int, num_paths: int, steps: int, initial_liquidity: float):
+        self.shape = (num_sets, num_paths)
+        zeros = lambda: np.zeros(self.shape)
+        self.va = zeros()
+        self.sa = np.full(self.shape, initial_liquidity)
+        self.fee = zeros()
+        # fees accrued to providers' LP tokens; the rest of the Fee pool is the protocol's share
+        self.provider_fees = zeros()
+        self.principal = zeros()
+        # LP supply; the protocol's initial liquidity is worth exactly 1 LP
+        self.lp = np.ones(self.shape)
+        # outstanding vouchers, one cohort per mint step
+        self.vouchers = np.zeros(self.shape + (steps,))
+
+        self.warning = np.zeros(self.shape, dtype=bool)
+        self.count = np.full(self.shape, float(EMERGENCY_COUNT))
+        self.num_triggered = np.zeros(self.shape, dtype=int)
+        self.num_rebalanced = np.zeros(self.shape, dtype=int)
+        self.buyer_redeemed = zeros()
+        self.staker_redeemed = zeros()
+
+        self.alive = np.ones(self.shape, dtype=bool)
+        self.depleted_at = np.full(self.shape, -1)
+
+    def collect_fee(self, amount: np.ndarray) -> None:
+        self.fee += amount
+        self.provider_fees += amount * (self.lp - 1) / self.lp
+
+    def deplete(self, cannot_liquidate: np.ndarray, t: int) -> None:
+        """The ABM stops when the VA pool cannot cover a liquidation; those combinations stop changing"""
+        newly = self.alive & cannot_liquidate
+        self.depleted_at = np.where(newly, t, self.depleted_at)
+        self.alive &= ~newly
+
+    def outputs(self, price: np.ndarray) -> Dict[str, np.ndarray]:
+        va_usd = self.va * price
+        return {
+            "ETH Prices": np.broadcast_to(price, self.shape),
+            "USDC Pool Balance USD": self.sa,
+            "ETH Pool Balance USD": va_usd,
+            "Fee Pool Balance USDC": self.fee,
+            "Total Asset Value USD": va_usd + self.sa + self.fee,
+            "# Emergency Triggers": self.num_triggered,
+            "# Pool Rebalancing": self.num_rebalanced,
+            "Remaining Vouchers": self.vouchers.sum(-1),
+            "Buyer Redeemed USD": self.buyer_redeemed,
+            "Staker Redeemed USD": self.staker_redeemed,
+        }
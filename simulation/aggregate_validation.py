@@ -0,0 +1,236 @@
+"""
+Calibration of the aggregate-flow engine on ABM runs, and a harness comparing the two on shared scenarios.
+"""
+import sys
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from agents.oracle import Oracle
+from model import LifelyPayModel
+from simulation.aggregate import (
+    FLOWS,
+    INITIAL_PRICE,
+    OUTPUTS,
+    AggregateEngine,
+    FlowProfile,
+)
+from states.params import Params
+
+
+class FlowRecorder:
+    """
+    Totals of the requests agents send to a model's router during one step.
+    Installed by wrapping the router's request methods on the instance, so the agents' references see it.
+    """
+
+    def __init__(self, model: LifelyPayModel):
+        self._model = model
+        self.reset()
+        router = model.router
+        for method, flow in (
+            ("process_buyer_buy_request", "buy_va"),
+            ("process_buyer_redeem_request", "redeem"),
+            ("process_lp_provider_request", "stake_usd"),
+            ("process_lp_provider_redeem_request", "lp_redeem"),
+        ):
+            setattr(router, method, self._wrap(getattr(router, method), flow))
+
+    def _wrap(self, process, flow: str):
+        def recorded(agent, tokens):
+            self.totals[flow] += float(tokens.amount)
+            self.totals["requests"] += 1
+            return process(agent, tokens)
+
+        return recorded
+
+    def reset(self) -> None:
+        self.totals = dict.fromkeys(("buy_va", "redeem", "stake_usd", "lp_redeem", "requests"), 0.0)
+
+    def in_the_money_vouchers(self, price: Decimal) -> float:
+        """Vouchers held by buyers that could be redeemed at this price"""
+        wallets = self._model.wallets
+        tokens = wallets.tokens
+        return float(
+            sum(
+                amount
+                for row in range(len(wallets))
+                for token_id, amount in wallets.lots(row)
+                if tokens.voucher_price(token_id) <= price
+            )
+        )
+
+    def provider_lp(self) -> float:
+        return float(sum(p.wallet.balance_of("LP") for p in self._model.providers))
+
+    def provider_fees(self) -> float:
+        return float(sum(p.accrued_fees for p in self._model.providers))
+
+    def fees_paid(self) -> float:
+        """Fees paid to providers so far"""
+        router = self._model.router
+        return float(
+            sum(paid for p in self._model.providers for _, paid in router.fee_history(p))
+        )
+
+
+def record_run(n: int, steps: int, seed: int, price_path=None) -> Dict[str, np.ndarray]:
+    """
+    Per-step flows of one ABM run, as FlowProfile defines them.
+    Rates are NaN on steps with nothing outstanding. Stakes are NaN on steps nobody staked: providers only stake
+    while the router accepts liquidity, which the engine checks itself, so the profile holds the volume of a step
+    in which staking was open.
+    """
+    model = LifelyPayModel(n, seed=seed, price_path=price_path, stopping_rules=[])
+    recorder = FlowRecorder(model)
+    flows = {flow: np.full(steps, np.nan) for flow in FLOWS}
+    for t in range(steps):
+        if not model.running:
+            break
+        # the price the model is about to set for this step
+        if price_path is not None and t < len(price_path):
+            price = Decimal(str(price_path[t]))
+        else:
+            price = Oracle.get_price_of("ETH")
+        in_the_money = recorder.in_the_money_vouchers(price)
+        provider_lp = recorder.provider_lp()
+        provider_fees = recorder.provider_fees()
+        fees_paid = recorder.fees_paid()
+
+        recorder.reset()
+        model.step()
+        totals = recorder.totals
+        flows["buy_va"][t] = totals["buy_va"] / n
+        flows["requests"][t] = totals["requests"] / n
+        if totals["stake_usd"] > 0:
+            flows["stake_usd"][t] = totals["stake_usd"] / n
+        if in_the_money > 0:
+            flows["redeem_rate"][t] = totals["redeem"] / in_the_money
+        if provider_lp > 0:
+            flows["lp_redeem_rate"][t] = totals["lp_redeem"] / provider_lp
+        if provider_fees > 0:
+            flows["fee_harvest_rate"][t] = min(
+                (recorder.fees_paid() - fees_paid) / provider_fees, 1.0
+            )
+    return flows
+
+
+def calibrate(
+    n: int = 50,
+    steps: int = 300,
+    seeds: Sequence[int] = range(5),
+    price_paths: Optional[List[Sequence]] = None,
+) -> FlowProfile:
+    """
+    Fit per-step flow distributions on ABM runs: every seed on every price path.
+    Run under the parameters the profile is meant for; volumes are rescaled to other caps by the engine.
+    """
+    runs = [
+        record_run(n, steps, seed, path)
+        for path in (price_paths or [None])
+        for seed in seeds
+    ]
+    mean, std = {}, {}
+    for flow in FLOWS:
+        observed = np.vstack([run[flow] for run in runs])
+        seen = ~np.isnan(observed)
+        counted = np.maximum(seen.sum(0), 1)
+        # steps nobody observed get 0
+        mean[flow] = np.where(seen, observed, 0).sum(0) / counted
+        std[flow] = np.sqrt(
+            (np.where(seen, observed - mean[flow], 0) ** 2).sum(0) / counted
+        )
+    snapshot = Params.snapshot()
+    return FlowProfile(
+        mean, std, n, float(snapshot.buy_cap), float(snapshot.stake_cap)
+    )
+
+
+def abm_outputs(model: LifelyPayModel) -> Dict[str, float]:
+    """Latest values of the outputs both engines report"""
+    reported = {
+        name: float(values[-1])
+        for name, values in model.datacollector.model_vars.items()
+        if name in OUTPUTS and values
+    }
+    reported["Remaining Vouchers"] = float(sum(b.remaining_vouchers for b in model.buyers))
+    reported["Buyer Redeemed USD"] = float(sum(b.redeemed_eth_usd for b in model.buyers))
+    reported["Staker Redeemed USD"] = float(sum(p.redeemed_usd for p in model.providers))
+    return reported
+
+
+def validate(
+    profile: FlowProfile,
+    scenarios: Dict[str, Optional[Sequence]],
+    n: int = 50,
+    steps: int = 300,
+    seeds: Sequence[int] = range(5),
+    draws: int = 200,
+    z_threshold: float = 2.0,
+) -> pd.DataFrame:
+    """
+    Run both engines on every scenario (a price path, None for a constant price), under the current parameters.
+    ABM runs that stop early (VA pool depleted) are compared with the aggregate engine at the step they stopped,
+    so that the scores measure the engines and not the length of the runs.
+
+    :param draws: aggregate-engine samples per scenario
+    :param z_threshold: largest difference of means, in ABM standard deviations, an output may show and still pass;
+        means that agree to within rounding (e.g. both about zero) always pass
+    :return: one row per scenario and output: ABM and aggregate mean / std of the final value,
+        the difference of means in units of the ABM's standard deviation, the number of ABM runs that stopped
+        before `steps`, and whether the output failed
+    """
+    rows = []
+    for scenario, path in scenarios.items():
+        abm, ended = [], []
+        for seed in seeds:
+            model = LifelyPayModel(n, seed=seed, price_path=path, stopping_rules=[])
+            while model.running and model.schedule.steps < steps:
+                model.step()
+            abm.append(abm_outputs(model))
+            ended.append(model.schedule.steps)
+        abm = pd.DataFrame(abm)
+
+        paths = [[INITIAL_PRICE] if path is None else list(path)] * draws
+        result = AggregateEngine(profile, n=n).run(paths, steps, seed=0)
+        for output in OUTPUTS:
+            if output not in abm.columns:
+                continue
+            # the aggregate draws at the step each ABM run ended, pooled
+            aggregate = np.concatenate(
+                [result.series[output][step - 1][0] for step in ended]
+            )
+            abm_mean, abm_std = abm[output].mean(), abm[output].std()
+            z = (aggregate.mean() - abm_mean) / abm_std if abm_std > 0 else np.nan
+            rows.append(
+                {
+                    "Scenario": scenario,
+                    "Output": output,
+                    "ABM Mean": abm_mean,
+                    "ABM Std": abm_std,
+                    "Aggregate Mean": aggregate.mean(),
+                    "Aggregate Std": aggregate.std(),
+                    "Z": z,
+                    "Truncated": sum(step < steps for step in ended),
+                    "Failed": bool(
+                        abs(z) > z_threshold and not np.isclose(aggregate.mean(), abm_mean)
+                    ),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 10)
+    up_down = [1337 * (1 + 0.01 * i) for i in range(100)] + [
+        2660 * (1 - 0.008 * i) for i in range(100)
+    ]
+    scenarios = {"flat": None, "up-down": up_down}
+    profile = calibrate(n=20, steps=200, seeds=range(3), price_paths=list(scenarios.values()))
+    report = validate(profile, scenarios, n=20, steps=200, seeds=range(3, 6))
+    print(report)
+    if report["Failed"].any():
+        sys.exit("{} outputs differ by more than the threshold".format(report["Failed"].sum()))
@@ -0,0 +1,79 @@
+"""
+Compressed columnar storage for collector DataFrames.
+Uses Parquet when pyarrow is installed, and a compressed .npz of one array per column otherwise.
+"""
+import os
+from decimal import Decimal
+from numbers import Number
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+EXTENSIONS = (".parquet", ".npz")
+
+
+def _column_array(values: pd.Series) -> np.ndarray:
+    """Decimals become float64 (collector values are Decimal); anything non-numeric is stored as text"""
+    if values.dtype != object:
+        return values.to_numpy()
+    if all(isinstance(v, (Decimal, Number)) or v is None for v in values):
+        return np.array([np.nan if v is None else float(v) for v in values])
+    return np.array(["" if v is None else str(v) for v in values])
+
+
+def to_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Flatten the index into columns and convert every column to a storable dtype"""
+    flat = df.reset_index() if any(df.index.names) else df.reset_index(drop=True)
+    return pd.DataFrame({str(c): _column_array(flat[c]) for c in flat.columns})
+
+
+def write_frame(df: pd.DataFrame, path: str) -> str:
+    """
+    :param df: frame to store; named index levels are kept as columns
+    :param path: destination without extension
+    :return: path written to, with extension
+    """
+    flat = to_columns(df)
+    if HAS_PARQUET:
+        dest = path + ".parquet"
+        flat.to_parquet(dest, compression="zstd", index=False)
+    else:
+        dest = path + ".npz"
+        np.savez_compressed(
+            dest,
+            __columns__=np.array(flat.columns, dtype=str),
+            **{"c{}".format(i): flat[c].to_numpy() for i, c in enumerate(flat.columns)}
+        )
+    return dest
+
+
+def read_frame(path: str, columns=None) -> pd.DataFrame:
+    """
+    :param path: path with or without extension
+    :param columns: subset of columns to load; only those are decompressed
+    """
+    if not path.endswith(EXTENSIONS):
+        path = path + (".parquet" if os.path.exists(path + ".parquet") else ".npz")
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    with np.load(path, allow_pickle=False) as data:
+        names = [str(c) for c in data["__columns__"]]
+        wanted = names if columns is None else [c for c in names if c in columns]
+        return pd.DataFrame(
+            {c: data["c{}".format(names.index(c))] for c in wanted}, columns=wanted
+        )
+
+
+def frame_path(path: str) -> str:
+    """Existing file for a destination written by write_frame, or None"""
+    for ext in EXTENSIONS:
+        if os.path.exists(path + ext):
+            return path + ext
+    return
@@ -0,0 +1,234 @@
+"""
+Continuous-time discrete-event engine: an alternative to stepping LifelyPayModel tick by tick.
+
+Every agent has one Poisson arrival process per request it can make (buyers buy and redeem, providers provide and
+redeem). Arrivals sit in a priority queue with Oracle price updates, rebalance polls and observations, and are
+handed to the agents, which send them to the model's router as in a step. Nothing happens between events, so
+quiet periods cost nothing, and months of activity can be simulated at any time resolution.
+Demand can vary over time (bursts, daily cycles) through a multiplier on every arrival rate.
+
+Time is in days. The default rates, one request of each kind every other day, match the tick model's 50% coins.
+
+    python -m simulation.event_engine
+"""
+import heapq
+import itertools
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from agents.oracle import Oracle
+from contracts.mempool import BlockRouter
+from model import LifelyPayModel
+from states.errors import (
+    BurnWrongTokenError,
+    CannotLiquidateEnoughError,
+    NegativeCirculatingSupplyError,
+)
+from utils import processlogger
+from utils.gas_meter import GasMeter
+
+logger = processlogger.ProcessLogger()
+
+BUY, REDEEM, PROVIDE, LP_REDEEM = "buy", "redeem", "provide", "lp_redeem"
+PRICE, POLL, OBSERVE = "price", "poll", "observe"
+
+
+@dataclass(frozen=True)
+class ArrivalRates:
+    """Requests per agent per day"""
+
+    buy: float = 0.5
+    redeem: float = 0.5
+    provide: float = 0.5
+    lp_redeem: float = 0.5
+
+
+def price_updates(
+    path: Sequence, interval: float = 1.0, denom: str = "ETH"
+) -> List[Tuple[float, str, Decimal]]:
+    """(time, denom, price) updates for a price path sampled every interval days, starting at time 0"""
+    return [(i * interval, denom, Decimal(str(price))) for i, price in enumerate(path)]
+
+
+class EventEngine:
+    def __init__(
+        self,
+        model: LifelyPayModel,
+        rates: ArrivalRates = ArrivalRates(),
+        demand: Optional[Callable[[float], float]] = None,
+        demand_max: float = 1.0,
+        prices: Iterable[Tuple[float, str, Decimal]] = (),
+        poll_interval: Optional[float] = None,
+        observe_interval: float = 1.0,
+    ):
+        """
+        :param model: supplies the router, agents, data collector and stopping rules; its step() is not used,
+            and its price_path is ignored in favour of prices
+        :param demand: multiplier on every arrival rate at time t, at most demand_max;
+            arrivals are thinned from rate * demand_max, so a tight bound keeps rejected arrivals cheap
+        :param prices: (time, denom, price) Oracle updates
+        :param poll_interval: days between rebalance polls (which also settle netted liquidations and produce
+            blocks); None keeps the router rebalancing after every request, as in the tick model.
+            Required when the model batches requests into blocks or nets liquidations; a model that only nets
+            liquidations keeps rebalancing after every request too, as in the tick model.
+        :param observe_interval: days between data collections and stopping rule checks
+        """
+        if poll_interval is None and (
+            isinstance(model.router, BlockRouter) or model.net_liquidations
+        ):
+            raise ValueError("poll_interval is required for routers that batch requests")
+        if demand is not None and demand_max <= 0:
+            raise ValueError("demand_max must be positive")
+        self._model = model
+        self._rng = model.random
+        self._demand = demand
+        self._demand_max = demand_max if demand is not None else 1.0
+        self._poll_interval = poll_interval
+        self._observe_interval = observe_interval
+        if poll_interval is not None and not model.net_liquidations:
+            model.router.auto_rebalance = False
+
+        self.time = 0.0
+        self.num_events: Dict[str, int] = dict.fromkeys(
+            (BUY, REDEEM, PROVIDE, LP_REDEEM, PRICE, POLL, OBSERVE), 0
+        )
+        self.num_reverted = 0
+
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._rates: Dict[str, float] = {}
+        for kind, agents, rate in (
+            (BUY, model.buyers, rates.buy),
+            (REDEEM, model.buyers, rates.redeem),
+            (PROVIDE, model.providers, rates.provide),
+            (LP_REDEEM, model.providers, rates.lp_redeem),
+        ):
+            self._rates[kind] = rate * self._demand_max
+            for agent in agents:
+                self._schedule_arrival(kind, agent, 0.0)
+        for t, denom, price in prices:
+            self._push(t, PRICE, (denom, price))
+        if poll_interval is not None:
+            self._push(poll_interval, POLL, None)
+        self._push(observe_interval, OBSERVE, None)
+
+    def _push(self, t: float, kind: str, payload) -> None:
+        heapq.heappush(self._queue, (t, next(self._seq), kind, payload))
+
+    def _schedule_arrival(self, kind: str, agent, after: float) -> None:
+        rate = self._rates[kind]
+        if rate > 0:
+            self._push(after + self._rng.expovariate(rate), kind, agent)
+
+    def run(self, horizon: float) -> int:
+        """
+        Process events up to horizon days, or until the model stops.
+
+        :return: events processed
+        """
+        processed = 0
+        while self._queue and self._queue[0][0] <= horizon and self._model.running:
+            t, _, kind, payload = heapq.heappop(self._queue)
+            self.time = t
+            processed += 1
+            if kind == PRICE:
+                Oracle.set_price(payload[1], payload[0])
+            elif kind == POLL:
+                self._poll()
+                self._push(t + self._poll_interval, POLL, None)
+            elif kind == OBSERVE:
+                self._observe()
+                self._push(t + self._observe_interval, OBSERVE, None)
+            else:
+                self._schedule_arrival(kind, payload, t)
+                # thinning: an arrival of the bounding process is kept with probability demand(t) / demand_max
+                if self._demand is not None and (
+                    self._rng.random() * self._demand_max >= self._demand(t)
+                ):
+                    continue
+                self._request(kind, payload)
+            self.num_events[kind] += 1
+        return processed
+
+    def _request(self, kind: str, agent) -> None:
+        try:
+            if kind == BUY:
+                agent.buy()
+            elif kind == REDEEM:
+                agent.redeem()
+            elif kind == PROVIDE:
+                agent.provide()
+            else:
+                agent.redeem()
+        except (NegativeCirculatingSupplyError, BurnWrongTokenError):
+            # rejected before the router changed any state, like a reverted transaction (see BlockRouter);
+            # the buyer already took its vouchers back
+            self.num_reverted += 1
+        except CannotLiquidateEnoughError:
+            # VA Pool is depleted; nothing after this point is meaningful
+            self._model.stop("VA Pool Depleted")
+
+    def _poll(self) -> None:
+        router = self._model.router
+        try:
+            if isinstance(router, BlockRouter):
+                router.produce_blocks()
+            else:
+                router.settle_liquidations()
+                router.rebalance()
+        except CannotLiquidateEnoughError:
+            self._model.stop("VA Pool Depleted")
+
+    def _observe(self) -> None:
+        """Collect, as the model does at the end of a step; observations are numbered like steps"""
+        model = self._model
+        model.schedule.steps += 1
+        model.schedule.time = self.time
+        for rule in model.stopping_rules:
+            if model.stop_reason:
+                break
+            reason = rule.check(model)
+            if reason:
+                model.stop(reason)
+        model.datacollector.collect(model)
+        # gas is metered per observation period
+        GasMeter.step = model.schedule.steps
+
+
+if __name__ == "__main__":
+    import math
+    import time
+
+    import numpy as np
+    import pandas as pd
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 10)
+    rng = np.random.default_rng(0)
+    days = 180
+    # hourly prices
+    walk = 1337 * np.exp(np.cumsum(rng.normal(0, 0.004, days * 24)))
+
+    def weekday_bursts(t: float) -> float:
+        # busy afternoons, quiet weekends
+        hour = (t % 1) * 24
+        daily = 1 + 0.8 * math.sin((hour - 9) / 24 * 2 * math.pi)
+        return daily * (0.3 if t % 7 >= 5 else 1.0)
+
+    model = LifelyPayModel(50, seed=0, stopping_rules=[])
+    engine = EventEngine(
+        model,
+        demand=weekday_bursts,
+        demand_max=1.8,
+        prices=price_updates(walk, 1 / 24),
+        poll_interval=1 / 24,
+    )
+    start = time.perf_counter()
+    engine.run(days)
+    print(
+        "{} days in {:.1f}s: {}, {} reverted".format(
+            days, time.perf_counter() - start, engine.num_events, engine.num_reverted
+        )
+    )
+    print(model.datacollector.get_model_vars_dataframe().iloc[:: days // 10])
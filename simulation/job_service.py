@@ -0,0 +1,404 @@
+"""
+Local simulation job service, so notebooks can submit scenarios without blocking their kernel.
+
+The server listens on a Unix socket and speaks newline-delimited JSON, one request per connection:
+    {"op": "submit", "spec": {...}}                   -> {"job_id": 3}
+    {"op": "status", "job_id": 3}                     -> {"job_id": 3, "status": "running", "step": 120, ...}
+    {"op": "jobs"}                                    -> {"jobs": [status, ...]}
+    {"op": "watch", "job_id": 3}                      -> one line per step ({"event": "step", "step", "vars"}) until the job ends
+    {"op": "cancel", "job_id": 3}                     -> {"job_id": 3, "status": "cancelling"}
+    {"op": "results", "job_id": 3, "table": "model"}  -> {"rows": [...]} chunks read from the result store, then {"end": true}
+Errors come back as {"error": "..."}.
+
+A scenario spec holds:
+    n, steps, seed            agents per side, step limit, random seed
+    params                    Params fields to override, e.g. {"tolerance": "0.2"}
+    price_source              list of ETH prices per step, or a path to a .csv (price column) / .json file
+    initial_liquidity         optional
+Jobs run on a process pool; finished runs are written to a ResultStore under the service root,
+whose index still answers status and results for them after the service restarts.
+"""
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from numbers import Number
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from simulation import columnar
+from simulation.result_store import ResultStore
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+QUEUED, RUNNING, DONE = "queued", "running", "done"
+CANCELLED, FAILED = "cancelled", "failed"
+FINISHED = (DONE, CANCELLED, FAILED)
+RESULT_CHUNK = 1000
+
+
+def load_price_source(source) -> Optional[List[Decimal]]:
+    """
+    :param source: None, a list of prices, or a path to
+        a .csv file (column "price", else the last column) or
+        a .json file (a list of prices, or CoinGecko market_chart output with [timestamp, price] pairs)
+    """
+    if source is None:
+        return
+    if not isinstance(source, str):
+        return [Decimal(str(p)) for p in source]
+    if source.endswith(".csv"):
+        with open(source, newline="") as f:
+            rows = list(csv.DictReader(f))
+        column = "price" if rows and "price" in rows[0] else list(rows[0])[-1]
+        return [Decimal(row[column]) for row in rows]
+    with open(source) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [pair[1] for pair in data["prices"]]
+    return [Decimal(str(p)) for p in data]
+
+
+def _jsonable(value):
+    if isinstance(value, (Decimal, Number)) and not isinstance(value, bool):
+        return float(value)
+    return value if value is None or isinstance(value, (str, bool)) else str(value)
+
+
+def run_job(job_id: int, spec: Dict[str, Any], root: str, progress, cancel) -> Dict[str, Any]:
+    """
+    Worker side of a job: step the model, reporting every step, until it stops, reaches the step limit, or is cancelled.
+    Module-level so it can be sent to worker processes.
+
+    :param progress: queue shared with the service, receives (job_id, step, latest model vars)
+    :param cancel: event set by the service to cancel this job
+    """
+    # imported here, so the service process itself does not load the model
+    from model import LifelyPayModel
+
+    if cancel.is_set():
+        return {"status": CANCELLED}
+    Params.hard_reset()
+    Params.update(**{name: Decimal(str(v)) for name, v in spec.get("params", {}).items()})
+    kwargs = {
+        "seed": spec.get("seed"),
+        "price_path": load_price_source(spec.get("price_source")),
+    }
+    if "initial_liquidity" in spec:
+        kwargs["initial_liquidity"] = Decimal(str(spec["initial_liquidity"]))
+    model = LifelyPayModel(spec["n"], **kwargs)
+
+    status = DONE
+    while model.running and model.schedule.steps < spec["steps"]:
+        if cancel.is_set():
+            status = CANCELLED
+            break
+        model.step()
+        latest = {
+            name: _jsonable(values[-1])
+            for name, values in model.datacollector.model_vars.items()
+        }
+        progress.put((job_id, model.schedule.steps, latest))
+
+    model_df = model.datacollector.get_model_vars_dataframe()
+    model_df.index = pd.RangeIndex(1, len(model_df) + 1, name="Step")
+    model_df = columnar.to_columns(model_df)
+    rows = columnar.to_columns(model.datacollector.get_agent_vars_dataframe()).merge(
+        model_df, on="Step"
+    )
+    rows.insert(0, "RunId", job_id)
+    counts = ResultStore(root).write_run(job_id, model_df, rows)
+    Params.hard_reset()
+    return {"status": status, "stop_reason": model.stop_reason, **counts}
+
+
+class Job:
+    def __init__(self, job_id: int, spec: Dict[str, Any], cancel):
+        self.id = job_id
+        self.spec = spec
+        self.cancel = cancel
+        self.status = QUEUED
+        self.step = 0
+        self.latest: Dict[str, Any] = {}
+        self.stop_reason = None
+        self.error = None
+        self.watchers: List[asyncio.Queue] = []
+
+    @classmethod
+    def from_index(cls, entry: Dict[str, Any]) -> "Job":
+        """A finished job, as the result store index recorded it (e.g. by a service that has since restarted)"""
+
+        def value(name):
+            v = entry.get(name)
+            return None if v is None or pd.isna(v) else v
+
+        seed, steps = value("seed"), value("steps")
+        spec = {
+            "n": int(entry["n"]),
+            "steps": int(steps) if steps is not None else None,
+            "seed": int(seed) if seed is not None else None,
+        }
+        job = cls(int(entry["RunId"]), spec, cancel=None)
+        job.status = entry["status"]
+        job.step = int(entry["model_rows"])
+        job.stop_reason = value("stop_reason")
+        return job
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "step": self.step,
+            "steps": self.spec["steps"],
+            "stop_reason": self.stop_reason,
+            "error": self.error,
+        }
+
+    def notify(self, event: Dict[str, Any]) -> None:
+        for watcher in self.watchers:
+            watcher.put_nowait(event)
+
+
+class JobService:
+    def __init__(
+        self,
+        socket_path: str,
+        root: str = "job_results",
+        processes: Optional[int] = None,
+    ):
+        """
+        :param socket_path: Unix socket to listen on
+        :param root: result store directory
+        :param processes: worker processes, defaults to all CPUs
+        """
+        self._socket_path = socket_path
+        self._store = ResultStore(root)
+        self._processes = processes
+        self._jobs: Dict[int, Job] = {}
+        index = self._store.index()
+        self._next_id = int(index["RunId"].max()) + 1 if len(index) else 0
+
+    async def serve(self) -> None:
+        manager = multiprocessing.Manager()
+        self._progress = manager.Queue()
+        self._manager = manager
+        self._executor = ProcessPoolExecutor(self._processes)
+        loop = asyncio.get_running_loop()
+        pump = loop.run_in_executor(None, self._pump_progress, loop)
+        if os.path.exists(self._socket_path):
+            os.remove(self._socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self._socket_path)
+        logger.info("Job service listening on {}".format(self._socket_path))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for job in self._jobs.values():
+                job.cancel.set()
+            self._executor.shutdown(wait=True)
+            self._progress.put(None)
+            await pump
+            manager.shutdown()
+
+    def _pump_progress(self, loop) -> None:
+        """Blocking reader of the workers' progress queue, run on a thread and handed over to the event loop"""
+        while True:
+            item = self._progress.get()
+            if item is None:
+                return
+            loop.call_soon_threadsafe(self._on_progress, *item)
+
+    def _on_progress(self, job_id: int, step: int, latest: Dict[str, Any]) -> None:
+        job = self._jobs[job_id]
+        if job.status == QUEUED:
+            job.status = RUNNING
+        job.step, job.latest = step, latest
+        job.notify({"event": "step", "job_id": job_id, "step": step, "vars": latest})
+
+    def submit(self, spec: Dict[str, Any]) -> Job:
+        for key in ("n", "steps"):
+            if key not in spec:
+                raise ValueError("Scenario spec is missing {}".format(key))
+        job = Job(self._next_id, spec, self._manager.Event())
+        self._next_id += 1
+        self._jobs[job.id] = job
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, run_job, job.id, spec, self._store.root, self._progress, job.cancel
+        )
+        asyncio.ensure_future(self._finish(job, future))
+        return job
+
+    async def _finish(self, job: Job, future) -> None:
+        try:
+            result = await future
+        except Exception as e:
+            job.status, job.error = FAILED, repr(e)
+            logger.warning("Job {} failed: {}".format(job.id, job.error))
+        else:
+            job.status, job.stop_reason = result["status"], result.get("stop_reason")
+            if "model_rows" in result:
+                self._store.add_to_index(
+                    {
+                        "RunId": job.id,
+                        "iteration": 0,
+                        "n": job.spec["n"],
+                        "seed": job.spec.get("seed"),
+                        "steps": job.spec["steps"],
+                        "status": job.status,
+                        "stop_reason": job.stop_reason,
+                        "model_rows": result["model_rows"],
+                        "agent_rows": result["agent_rows"],
+                    }
+                )
+        job.notify({"event": "status", **job.describe()})
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        async def send(message):
+            writer.write((json.dumps(message, default=str) + "\n").encode("utf-8"))
+            await writer.drain()
+
+        try:
+            request = json.loads(await reader.readline())
+            op = request.get("op")
+            if op == "submit":
+                await send({"job_id": self.submit(request["spec"]).id})
+            elif op == "jobs":
+                await send({"jobs": [job.describe() for job in self._jobs.values()]})
+            elif op in ("status", "watch", "cancel", "results"):
+                job = self._find(request.get("job_id"))
+                if job is None:
+                    await send({"error": "Unknown job {}".format(request.get("job_id"))})
+                elif op == "status":
+                    await send(job.describe())
+                elif op == "cancel":
+                    status = job.status
+                    if status not in FINISHED:
+                        job.cancel.set()
+                        status = "cancelling"
+                    await send({"job_id": job.id, "status": status})
+                elif op == "watch":
+                    await self._watch(job, send)
+                else:
+                    await self._results(job, request, send)
+            else:
+                await send({"error": "Unknown op {}".format(op)})
+        except (ValueError, KeyError) as e:
+            await send({"error": repr(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _find(self, job_id) -> Optional[Job]:
+        """A job submitted to this service, else a finished one from the result store index"""
+        job = self._jobs.get(job_id)
+        if job is not None or not isinstance(job_id, int):
+            return job
+        runs = self._store.select(RunId=job_id)
+        if not len(runs):
+            return None
+        return Job.from_index(runs.iloc[-1].to_dict())
+
+    async def _watch(self, job: Job, send) -> None:
+        await send({"event": "status", **job.describe()})
+        if job.status in FINISHED:
+            return
+        watcher = asyncio.Queue()
+        job.watchers.append(watcher)
+        try:
+            while True:
+                event = await watcher.get()
+                await send(event)
+                if event["event"] == "status":
+                    return
+        finally:
+            job.watchers.remove(watcher)
+
+    async def _results(self, job: Job, request: Dict[str, Any], send) -> None:
+        if job.status not in (DONE, CANCELLED):
+            await send({"error": "Job {} is {}".format(job.id, job.status)})
+            return
+        frames = self._store.iter_runs(
+            request.get("table", "model"), request.get("columns"), RunId=job.id
+        )
+        for df in frames:
+            for start in range(0, len(df), RESULT_CHUNK):
+                chunk = df.iloc[start : start + RESULT_CHUNK]
+                await send({"rows": json.loads(chunk.to_json(orient="records"))})
+        await send({"end": True})
+
+
+class JobClient:
+    """Blocking client for notebooks and scripts"""
+
+    def __init__(self, socket_path: str):
+        self._socket_path = socket_path
+
+    def _lines(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self._socket_path)
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("r", encoding="utf-8") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise RuntimeError(message["error"])
+                    yield message
+
+    def _request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return next(self._lines(request))
+
+    def submit(
+        self,
+        n: int,
+        steps: int,
+        seed: int = None,
+        params: Dict[str, Any] = None,
+        price_source=None,
+        **spec
+    ) -> int:
+        spec.update(n=n, steps=steps, seed=seed)
+        spec["params"] = {name: str(v) for name, v in (params or {}).items()}
+        if isinstance(price_source, str):
+            spec["price_source"] = price_source
+        elif price_source is not None:
+            spec["price_source"] = [str(p) for p in price_source]
+        return self._request({"op": "submit", "spec": spec})["job_id"]
+
+    def status(self, job_id: int) -> Dict[str, Any]:
+        return self._request({"op": "status", "job_id": job_id})
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        return self._request({"op": "jobs"})["jobs"]
+
+    def cancel(self, job_id: int) -> Dict[str, Any]:
+        return self._request({"op": "cancel", "job_id": job_id})
+
+    def watch(self, job_id: int) -> Iterator[Dict[str, Any]]:
+        """Progress events as they are produced; the last one is the job's final status"""
+        return self._lines({"op": "watch", "job_id": job_id})
+
+    def results(
+        self, job_id: int, table: str = "model", columns: List[str] = None
+    ) -> pd.DataFrame:
+        request = {"op": "results", "job_id": job_id, "table": table, "columns": columns}
+        rows = []
+        for message in self._lines(request):
+            rows.extend(message.get("rows", []))
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "lifelypay.sock"
+    asyncio.run(JobService(path).serve())
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from simulation.job_service import DONE, JobService, load_price_source
+from simulation.result_store import ResultStore
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestJobService(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def test_price_sources(self):
+        self.assertIsNone(load_price_source(None))
+        self.assertEqual(load_price_source([1337, 1400.5]), [Decimal(1337), Decimal("1400.5")])
+
+        with open(self.path("prices.csv"), "w") as f:
+            f.write("time,price,volume\n1,1337,10\n2,1400,12\n")
+        self.assertEqual(load_price_source(self.path("prices.csv")), [1337, 1400])
+
+        with open(self.path("chart.json"), "w") as f:
+            json.dump({"prices": [[1650982222, 1337.5], [1650985822, 1400]]}, f)
+        self.assertEqual(load_price_source(self.path("chart.json")), [Decimal("1337.5"), 1400])
+        logger.test("#test_price_sources()")
+
+    def test_finished_jobs_survive_restart(self):
+        store = ResultStore(self.path("results"))
+        store.add_to_index(
+            {
+                "RunId": 4,
+                "iteration": 0,
+                "n": 10,
+                "seed": None,
+                "steps": 100,
+                "status": DONE,
+                "stop_reason": "Steady State (10 steps)",
+                "model_rows": 57,
+                "agent_rows": 1140,
+            }
+        )
+
+        service = JobService(self.path("jobs.sock"), root=self.path("results"))
+        job = service._find(4)
+        self.assertEqual(
+            job.describe(),
+            {
+                "job_id": 4,
+                "status": DONE,
+                "step": 57,
+                "steps": 100,
+                "stop_reason": "Steady State (10 steps)",
+                "error": None,
+            },
+        )
+        self.assertIsNone(job.spec["seed"])
+        self.assertIsNone(service._find(5))
+        self.assertIsNone(service._find("4"))
+        # new jobs never reuse the id of a finished one
+        self.assertEqual(service._next_id, 5)
+        logger.test("#test_finished_jobs_survive_restart()")
+
+
+if __name__ == "__main__":
+    unittest.main()
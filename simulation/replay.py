@@ -0,0 +1,385 @@
+"""
+Record the requests agents send to the router in one LifelyPayModel run, and replay them against other parameters.
+
+Agents' decisions (coin flips and random draws) hardly depend on the protocol parameters, so one trace can be
+evaluated against many configurations, without agents, scheduler or data collector.
+A trace holds, per step, the Oracle prices and the ordered requests: type, agent and the agent's random draw as a
+fraction (of the buy / stake cap, or of the voucher lot / LP tokens held). On replay, amounts are rebuilt from those
+fractions under the replayed parameters, and the agents' guards (buying cap, a voucher lot in the money, whether
+liquidity is accepted) are checked against the replayed state, so a request the agent could not have made is
+skipped, and a redemption picks its lot among the vouchers the replayed router issued.
+
+File layout (little-endian): header, string table (length-prefixed prices and denoms), VA denoms, agent table, then
+fixed-size records. Strings are referred to by index.
+
+    python -m simulation.replay
+"""
+import struct
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from agents.oracle import Oracle
+from contracts import router_factory
+from contracts.types import BuyerWallet, DummyProtocolAgent, Tokens, Wallet
+from contracts.wallet_store import WalletStore
+from model import LifelyPayModel
+from states.errors import (
+    BurnWrongTokenError,
+    CannotLiquidateEnoughError,
+    NegativeCirculatingSupplyError,
+)
+from states.interfaces import AgentI, TokenI
+from states.params import Params
+
+MAGIC = b"LPRT"
+VERSION = 1
+HEADER = struct.Struct("<4sHIIIII")  # magic, version, strings, VA denoms, agents, records, initial liquidity
+AGENT = struct.Struct("<BI")  # role, denom string
+NO_DENOM = 0xFFFFFFFF
+
+BUYER, PROVIDER = 0, 1
+# record kinds; PRICE records carry the denom and price as string table indices, in denom and value
+PRICE, STEP, BUY, REDEEM, PROVIDE, LP_REDEEM = range(6)
+RECORD = np.dtype([("kind", "u1"), ("agent", "<u4"), ("denom", "<u4"), ("value", "<f8")])
+
+# buyers stop buying once they have spent this much (see BuyerAgent.reached_buying_cap)
+BUYING_CAP_USD = 1000
+
+
+class RequestRecorder:
+    """
+    Captures requests at the router boundary of a model, by wrapping the router's request methods on the instance.
+    Call end_step() after every model step; requests of a step that is not ended are dropped.
+    """
+
+    def __init__(self, model: LifelyPayModel, initial_liquidity: Decimal):
+        self._model = model
+        self._strings: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._records: List[tuple] = []
+        self._step: List[tuple] = []
+        # as the model assigns them: buyers pay with the VA denoms in turn
+        denoms = model.va_denoms
+        self._agents = [
+            (BUYER, self._intern(denoms[i % len(denoms)])) for i in range(len(model.buyers))
+        ] + [(PROVIDER, self._intern("USDC")) for _ in model.providers]
+        self._initial_liquidity = self._intern(str(initial_liquidity))
+        self._va_denoms = [self._intern(d) for d in model.va_denoms]
+
+        router = model.router
+        for method, record in (
+            ("process_buyer_buy_request", self._buy),
+            ("process_buyer_redeem_request", self._redeem),
+            ("process_lp_provider_request", self._provide),
+            ("process_lp_provider_redeem_request", self._lp_redeem),
+        ):
+            setattr(router, method, self._wrap(getattr(router, method), record))
+
+    def _intern(self, string: str) -> int:
+        if string not in self._index:
+            self._index[string] = len(self._strings)
+            self._strings.append(string)
+        return self._index[string]
+
+    @staticmethod
+    def _wrap(process, record):
+        def recorded(agent, tokens):
+            record(agent, tokens)
+            return process(agent, tokens)
+
+        return recorded
+
+    # the agent has already sent the tokens, so what it held is its balance plus the amount
+
+    def _buy(self, agent: AgentI, tokens: TokenI):
+        amount_eth = Oracle.exchange(tokens, "ETH").amount
+        self._step.append((BUY, agent.unique_id, NO_DENOM, float(amount_eth / Params.buy_cap())))
+
+    def _redeem(self, agent: AgentI, tokens: TokenI):
+        held = agent.wallet.balance_of(tokens.denom) + tokens.amount
+        self._step.append((REDEEM, agent.unique_id, NO_DENOM, float(tokens.amount / held)))
+
+    def _provide(self, agent: AgentI, tokens: TokenI):
+        self._step.append((PROVIDE, agent.unique_id, NO_DENOM, float(tokens.amount / Params.stake_cap())))
+
+    def _lp_redeem(self, agent: AgentI, tokens: TokenI):
+        held = agent.wallet.balance_of("LP") + tokens.amount
+        self._step.append((LP_REDEEM, agent.unique_id, NO_DENOM, float(tokens.amount / held)))
+
+    def end_step(self) -> None:
+        for denom in self._model.va_denoms:
+            price = self._intern(str(Oracle.get_price_of(denom)))
+            self._records.append((PRICE, 0, self._intern(denom), float(price)))
+        self._records.extend(self._step)
+        self._records.append((STEP, 0, NO_DENOM, 0.0))
+        self._step = []
+
+    def save(self, path: str) -> None:
+        records = np.array(self._records, dtype=RECORD)
+        with open(path, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    len(self._strings),
+                    len(self._va_denoms),
+                    len(self._agents),
+                    len(records),
+                    self._initial_liquidity,
+                )
+            )
+            for string in self._strings:
+                encoded = string.encode()
+                f.write(struct.pack("<H", len(encoded)))
+                f.write(encoded)
+            f.write(struct.pack("<{}I".format(len(self._va_denoms)), *self._va_denoms))
+            for role, denom in self._agents:
+                f.write(AGENT.pack(role, denom))
+            f.write(records.tobytes())
+
+
+def record_run(
+    path: str,
+    n: int,
+    steps: int,
+    seed: Optional[int] = None,
+    price_path: Optional[Sequence] = None,
+    initial_liquidity: Decimal = Decimal(1000000),
+    va_denoms: Sequence[str] = ("ETH",),
+) -> int:
+    """
+    Run the model under the current parameters and save its request trace.
+
+    :return: steps recorded
+    """
+    model = LifelyPayModel(
+        n,
+        seed=seed,
+        price_path=price_path,
+        stopping_rules=[],
+        initial_liquidity=initial_liquidity,
+        va_denoms=va_denoms,
+    )
+    recorder = RequestRecorder(model, initial_liquidity)
+    while model.running and model.schedule.steps < steps:
+        model.step()
+        recorder.end_step()
+    recorder.save(path)
+    return model.schedule.steps
+
+
+class ReplayAgent(AgentI):
+    """Wallet and the totals a replay reports; decisions come from the trace"""
+
+    def __init__(self, name: str, role: int, denom: str, store: WalletStore):
+        self._name = name
+        self._type = "Buyer" if role == BUYER else "Provider"
+        self.denom = denom
+        self._wallet = BuyerWallet(name, store) if role == BUYER else Wallet(name, store)
+        self._wallet.initiate_with(denom)
+        self.spent_usd = Decimal(0)
+        self.redeemed_usd = Decimal(0)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def type(self):
+        return self._type
+
+    @property
+    def wallet(self):
+        return self._wallet
+
+    def receives(self, tokens: TokenI):
+        if tokens.denom[0] != "<" and tokens.denom != "LP":
+            self.redeemed_usd += Oracle.exchange(tokens, "USDC").amount
+        self._wallet.receives(tokens)
+
+    def sends(self, tokens: TokenI):
+        if tokens.denom == self.denom:
+            self.spent_usd += Oracle.exchange(tokens, "USDC").amount
+        self._wallet.sends(tokens)
+
+    def step(self):
+        pass
+
+
+class Replayer:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, n_strings, n_va, n_agents, n_records, liquidity = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} request trace".format(path, VERSION))
+        offset = HEADER.size
+        self.strings: List[str] = []
+        for _ in range(n_strings):
+            (length,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            self.strings.append(data[offset : offset + length].decode())
+            offset += length
+        self.initial_liquidity = Decimal(self.strings[liquidity])
+        self.va_denoms = [
+            self.strings[d] for d in struct.unpack_from("<{}I".format(n_va), data, offset)
+        ]
+        offset += 4 * n_va
+        self.agents = []
+        for _ in range(n_agents):
+            role, denom = AGENT.unpack_from(data, offset)
+            self.agents.append((role, self.strings[denom]))
+            offset += AGENT.size
+        self.records = np.frombuffer(data, dtype=RECORD, count=n_records, offset=offset)
+        # decimals are parsed once per trace, not once per replay
+        self._decimals = [
+            Decimal(s) if s[0].isdigit() else None for s in self.strings
+        ]
+
+    @property
+    def steps(self) -> int:
+        return int((self.records["kind"] == STEP).sum())
+
+    def replay(self, params: Dict[str, Decimal] = None, voucher_bucketing=None) -> Dict:
+        """
+        Push the trace through a fresh router under params (changes from the default parameters).
+
+        :return: final protocol state and the agents' totals; "steps" is short of the trace if the VA pool ran out
+        """
+        Params.hard_reset()
+        Params.update(**(params or {}))
+        try:
+            return self._replay(voucher_bucketing)
+        finally:
+            Params.hard_reset()
+
+    def replay_all(self, param_sets: Iterable[Dict[str, Decimal]], **kwargs) -> List[Dict]:
+        return [self.replay(params, **kwargs) for params in param_sets]
+
+    def _replay(self, voucher_bucketing) -> Dict:
+        Oracle.reset()
+        if len(self.va_denoms) > 1:
+            router = router_factory.MultiAssetRouter(self.va_denoms, "USDC", voucher_bucketing)
+        else:
+            router = router_factory.Router(
+                self.va_denoms[0], "USDC", voucher_bucketing=voucher_bucketing
+            )
+        router.process_lp_provider_request(
+            DummyProtocolAgent(), Tokens(self.initial_liquidity, "USDC")
+        )
+        store = WalletStore()
+        agents = [
+            ReplayAgent(str(i), role, denom, store) for i, (role, denom) in enumerate(self.agents)
+        ]
+        buy_cap, stake_cap = Params.buy_cap(), Params.stake_cap()
+        strings, decimals = self.strings, self._decimals
+
+        steps = reverted = skipped = 0
+        stop_reason = None
+        for kind, agent_id, denom, value in self.records.tolist():
+            if kind == STEP:
+                steps += 1
+                continue
+            if kind == PRICE:
+                Oracle.set_price(decimals[int(value)], strings[denom])
+                continue
+            agent = agents[agent_id]
+            wallet = agent.wallet
+            fraction = Decimal(value)
+            try:
+                if kind == BUY:
+                    if agent.spent_usd > BUYING_CAP_USD:
+                        skipped += 1
+                        continue
+                    tokens = Oracle.exchange(Tokens(fraction * buy_cap, "ETH"), agent.denom)
+                    agent.sends(tokens)
+                    router.process_buyer_buy_request(agent, tokens)
+                elif kind == REDEEM:
+                    redeemable = wallet.redeemable_balance(Oracle.get_price_of(agent.denom))
+                    if not redeemable:
+                        skipped += 1
+                        continue
+                    tokens = redeemable.times(fraction)
+                    agent.sends(tokens)
+                    try:
+                        router.process_buyer_redeem_request(agent, tokens)
+                    except (NegativeCirculatingSupplyError, BurnWrongTokenError):
+                        agent.receives(tokens)
+                        reverted += 1
+                elif kind == PROVIDE:
+                    if not router.is_accepting_liquidity:
+                        skipped += 1
+                        continue
+                    tokens = Tokens(fraction * stake_cap, "USDC")
+                    agent.sends(tokens)
+                    router.process_lp_provider_request(agent, tokens)
+                else:
+                    held = wallet.balance_of("LP")
+                    if held.is_zero():
+                        skipped += 1
+                        continue
+                    tokens = Tokens(held * fraction, "LP")
+                    agent.sends(tokens)
+                    router.process_lp_provider_redeem_request(agent, tokens)
+            except CannotLiquidateEnoughError:
+                stop_reason = "VA Pool Depleted"
+                break
+
+        buyers = [a for a in agents if a.type == "Buyer"]
+        providers = [a for a in agents if a.type == "Provider"]
+        va, sa, fee = router.pool_balances()
+        return {
+            "steps": steps,
+            "stop_reason": stop_reason,
+            "sa_balance": sa,
+            "fee_balance": fee,
+            "va_value_usd": router.va_pool_value_usd(),
+            "total_asset_value_usd": router.total_asset_value_usd(),
+            "num_triggered": router.num_triggered,
+            "num_rebalanced": router.num_rebalanced,
+            "buyer_spent_usd": sum(a.spent_usd for a in buyers),
+            "buyer_redeemed_usd": sum(a.redeemed_usd for a in buyers),
+            "staker_staked_usd": sum(a.spent_usd for a in providers),
+            "staker_redeemed_usd": sum(a.redeemed_usd for a in providers),
+            "requests_skipped": skipped,
+            "requests_reverted": reverted,
+        }
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    import pandas as pd
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 12)
+    up_down = [1337 * (1 + 0.01 * i) for i in range(100)] + [
+        2660 * (1 - 0.008 * i) for i in range(100)
+    ]
+    path = os.path.join(tempfile.gettempdir(), "lifelypay_trace.bin")
+    start = time.perf_counter()
+    steps = record_run(path, 50, 200, seed=0, price_path=up_down)
+    recorded = time.perf_counter() - start
+    replayer = Replayer(path)
+    print(
+        "{} steps, {} records, {} bytes, recorded in {:.2f}s".format(
+            steps, len(replayer.records), os.path.getsize(path), recorded
+        )
+    )
+
+    grid = [
+        {"tolerance": Decimal(t), "content": Decimal(c)}
+        for t in ("0.1", "0.2", "0.3")
+        for c in ("0.5", "0.6", "0.7")
+    ]
+    start = time.perf_counter()
+    results = replayer.replay_all(grid)
+    print("{} replays in {:.2f}s".format(len(grid), time.perf_counter() - start))
+    frame = pd.DataFrame(results)
+    frame.insert(0, "content", [p["content"] for p in grid])
+    frame.insert(0, "tolerance", [p["tolerance"] for p in grid])
+    print(frame.drop(columns=["stop_reason", "va_value_usd"]).astype(float).round(2))
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import shutil
+from decimal import getcontext
+from typing import Optional, Sequence, Tuple
+
+import pandas as pd
+
+from model import LifelyPayModel
+from simulation import columnar
+from states.params import Params, ParamsSnapshot
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# any change to these invalidates every cached result
+SOURCE_PATHS = [
+    "model.py",
+    "agents",
+    "contracts",
+    "states",
+    "utils",
+    "simulation/stopping_rules.py",
+]
+
+_source_version = None
+
+
+def source_version() -> str:
+    """Digest of the simulation core's source files, computed once per process"""
+    global _source_version
+    if _source_version is None:
+        digest = hashlib.sha256()
+        for rel in SOURCE_PATHS:
+            path = os.path.join(ROOT, rel)
+            files = [path] if os.path.isfile(path) else [
+                os.path.join(d, f)
+                for d, _, fs in sorted(os.walk(path))
+                for f in sorted(fs)
+                if f.endswith(".py") and not f.endswith("_test.py")
+            ]
+            for file in files:
+                digest.update(os.path.relpath(file, ROOT).encode("utf-8"))
+                with open(file, "rb") as f:
+                    digest.update(f.read())
+        _source_version = digest.hexdigest()
+    return _source_version
+
+
+def price_path_digest(price_path: Optional[Sequence]) -> str:
+    if price_path is None:
+        return ""
+    return hashlib.sha256(
+        "\n".join(str(p) for p in price_path).encode("utf-8")
+    ).hexdigest()
+
+
+def run_key(
+    params: ParamsSnapshot, seed, price_path, max_steps: int, **model_kwargs
+) -> str:
+    """
+    Content address of a run: parameter set, seed, price path, code version,
+    plus anything else that changes the outcome (model arguments, step limit, decimal precision).
+    Model arguments are keyed by their str, which must not depend on the process (no default object reprs).
+    """
+    model = {k: str(v) for k, v in sorted(model_kwargs.items())}
+    for name, val in model.items():
+        if " at 0x" in val:
+            raise ValueError(
+                "Model argument {}={} has no stable repr, cannot be part of a run key".format(
+                    name, val
+                )
+            )
+    payload = {
+        "params": {
+            name: str(val) for name, val in vars(params).items() if name != "version"
+        },
+        "seed": seed,
+        "price_path": price_path_digest(price_path),
+        "source": source_version(),
+        "max_steps": max_steps,
+        "prec": getcontext().prec,
+        "model": model,
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+class ResultCache:
+    """
+    Model and agent collector frames per run, stored as compressed columnar files under <root>/<key>/.
+    Bounded by total size on disk; least recently used entries are evicted first.
+    """
+
+    def __init__(self, root: str = "result_cache", max_bytes: int = 2 * 1024 ** 3):
+        self._root = root
+        self._max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+        entry = os.path.join(self._root, key)
+        model_path = columnar.frame_path(os.path.join(entry, "model"))
+        agent_path = columnar.frame_path(os.path.join(entry, "agents"))
+        if model_path is None or agent_path is None:
+            return
+        # directory mtime is the LRU clock
+        os.utime(entry)
+        model_df = columnar.read_frame(model_path).set_index("Step")
+        agent_df = columnar.read_frame(agent_path).set_index(["Step", "AgentID"])
+        return model_df, agent_df
+
+    def put(self, key: str, model_df: pd.DataFrame, agent_df: pd.DataFrame) -> None:
+        entry = os.path.join(self._root, key)
+        tmp = entry + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columnar.write_frame(model_df, os.path.join(tmp, "model"))
+        columnar.write_frame(agent_df, os.path.join(tmp, "agents"))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self._root):
+            entry = os.path.join(self._root, name)
+            if name.endswith(".tmp") or not os.path.isdir(entry):
+                continue
+            size = sum(e.stat().st_size for e in os.scandir(entry))
+            entries.append((os.stat(entry).st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logger.info("Evicted cached run {}".format(os.path.basename(entry)))
+
+
+def run_cached(
+    n: int,
+    max_steps: int,
+    seed=None,
+    price_path=None,
+    cache: Optional[ResultCache] = None,
+    **model_kwargs
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run LifelyPayModel with the current Params, unless an identical run is already cached.
+    Runs without a seed are never cached, since they are not reproducible.
+    Frames come back in their stored form (Decimals as floats) whether or not they were cached.
+
+    :return: (model vars indexed by Step, agent vars indexed by (Step, AgentID))
+    """
+    key = None
+    if cache is not None and seed is not None:
+        key = run_key(Params.snapshot(), seed, price_path, max_steps, n=n, **model_kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    model = LifelyPayModel(n, seed=seed, price_path=price_path, **model_kwargs)
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+    model_df = model.datacollector.get_model_vars_dataframe()
+    # agent records are keyed by the step count after stepping; align model vars with them
+    model_df.index = pd.RangeIndex(1, len(model_df) + 1, name="Step")
+    model_df = columnar.to_columns(model_df).set_index("Step")
+    agent_df = columnar.to_columns(
+        model.datacollector.get_agent_vars_dataframe()
+    ).set_index(["Step", "AgentID"])
+
+    if key is not None:
+        cache.put(key, model_df, agent_df)
+    return model_df, agent_df
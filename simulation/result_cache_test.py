@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+
+import pandas as pd
+
+from simulation.result_cache import ROOT, ResultCache, run_key
+from simulation.stopping_rules import default_stopping_rules
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+KEY_SCRIPT = """
+from decimal import Decimal
+from simulation.result_cache import run_key
+from simulation.stopping_rules import default_stopping_rules
+from states.params import Params
+print(run_key(Params.snapshot(), 3, [Decimal(1000), Decimal(1200)], 100,
+              n=10, stopping_rules=default_stopping_rules(), block_size=5))
+"""
+
+
+class TestRunKey(unittest.TestCase):
+    def setUp(self):
+        Params.hard_reset()
+
+    def tearDown(self) -> None:
+        Params.hard_reset()
+
+    def key_in_new_process(self) -> str:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        out = subprocess.run(
+            [sys.executable, "-c", KEY_SCRIPT],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        return out.decode("utf-8").strip().splitlines()[-1]
+
+    def test_key_is_identical_across_processes(self):
+        key = run_key(
+            Params.snapshot(),
+            3,
+            [Decimal(1000), Decimal(1200)],
+            100,
+            n=10,
+            stopping_rules=default_stopping_rules(),
+            block_size=5,
+        )
+        self.assertEqual(self.key_in_new_process(), key)
+        self.assertEqual(self.key_in_new_process(), key)
+        logger.test("#test_key_is_identical_across_processes()")
+
+    def test_key_depends_on_rule_configuration(self):
+        snapshot = Params.snapshot()
+        default = run_key(snapshot, 0, None, 100, stopping_rules=default_stopping_rules())
+        self.assertEqual(
+            run_key(snapshot, 0, None, 100, stopping_rules=default_stopping_rules()), default
+        )
+        self.assertNotEqual(run_key(snapshot, 0, None, 100, stopping_rules=[]), default)
+        logger.test("#test_key_depends_on_rule_configuration()")
+
+    def test_arguments_without_stable_repr_are_refused(self):
+        with self.assertRaises(ValueError):
+            run_key(Params.snapshot(), 0, None, 100, stopping_rules=[object()])
+        logger.test("#test_arguments_without_stable_repr_are_refused()")
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    @staticmethod
+    def frames():
+        model_df = pd.DataFrame({"Step": [1, 2], "Total": [1.0, 2.0]}).set_index("Step")
+        agent_df = pd.DataFrame(
+            {"Step": [1, 1, 2, 2], "AgentID": [0, 1, 0, 1], "Spent": [0.0, 1.0, 2.0, 3.0]}
+        ).set_index(["Step", "AgentID"])
+        return model_df, agent_df
+
+    def test_round_trip(self):
+        cache = ResultCache(self.root)
+        self.assertIsNone(cache.get("a"))
+        model_df, agent_df = self.frames()
+        cache.put("a", model_df, agent_df)
+        cached_model, cached_agents = cache.get("a")
+        pd.testing.assert_frame_equal(cached_model, model_df)
+        pd.testing.assert_frame_equal(cached_agents, agent_df)
+        logger.test("#test_round_trip()")
+
+    def test_least_recently_used_is_evicted(self):
+        ResultCache(self.root).put("a", *self.frames())
+        entry_bytes = sum(e.stat().st_size for e in os.scandir(os.path.join(self.root, "a")))
+        cache = ResultCache(self.root, max_bytes=int(2.5 * entry_bytes))
+        cache.put("b", *self.frames())
+        os.utime(os.path.join(self.root, "a"), (1000, 1000))
+        os.utime(os.path.join(self.root, "b"), (2000, 2000))
+
+        # reading a makes b the least recently used
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", *self.frames())
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        logger.test("#test_least_recently_used_is_evicted()")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Partitioned on-disk store for sweep results, written one run at a time.
+
+Layout:
+    <root>/index.jsonl            one line per finished run: id, iteration, scalar arguments, row count
+    <root>/run=<id>/model.*       model vars of that run
+    <root>/run=<id>/agents.*      agent vars merged with model vars (batch_run style rows)
+Partitions are columnar files written by simulation.columnar, so only the requested columns are read back.
+"""
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from simulation import columnar
+
+INDEX = "index.jsonl"
+TABLES = ("model", "agents")
+
+
+class ResultStore:
+    def __init__(self, root: str):
+        self._root = root
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def partition(self, run_id: int) -> str:
+        return os.path.join(self._root, "run={}".format(run_id))
+
+    def write_run(
+        self, run_id: int, model_df: pd.DataFrame, rows: pd.DataFrame
+    ) -> Dict[str, Any]:
+        """
+        Write the partition of a single run. Safe to call from worker processes, since every run owns its directory;
+        the run only becomes visible to readers once it is added to the index.
+
+        :return: row counts to record in the index
+        """
+        partition = self.partition(run_id)
+        os.makedirs(partition, exist_ok=True)
+        columnar.write_frame(model_df, os.path.join(partition, "model"))
+        columnar.write_frame(rows, os.path.join(partition, "agents"))
+        return {"model_rows": len(model_df), "agent_rows": len(rows)}
+
+    def add_to_index(self, entry: Dict[str, Any]) -> None:
+        """Append one run's metadata. Only the coordinating process writes the index."""
+        with open(os.path.join(self._root, INDEX), "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def index(self) -> pd.DataFrame:
+        """Metadata of every finished run, one row per run"""
+        path = os.path.join(self._root, INDEX)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=["RunId", "iteration"])
+        with open(path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        # a run written twice (e.g. a resumed sweep) keeps its latest entry
+        return (
+            pd.DataFrame(entries)
+            .drop_duplicates("RunId", keep="last")
+            .sort_values("RunId")
+            .reset_index(drop=True)
+        )
+
+    def select(self, **filters) -> pd.DataFrame:
+        """
+        Runs whose metadata matches every filter; a filter value may be a single value or a list of accepted values.
+        e.g. store.select(iteration=[0, 1], n=50)
+        """
+        runs = self.index()
+        for name, accepted in filters.items():
+            if name not in runs.columns:
+                return runs.iloc[0:0]
+            if isinstance(accepted, str) or not isinstance(accepted, Sequence):
+                accepted = [accepted]
+            runs = runs[runs[name].isin(accepted)]
+        return runs
+
+    def iter_runs(
+        self, table: str = "agents", columns: Optional[List[str]] = None, **filters
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Lazily load the matching runs one partition at a time.
+
+        :param table: "agents" (batch_run style rows) or "model"
+        :param columns: subset of columns to read; None reads all
+        """
+        if table not in TABLES:
+            raise ValueError("Unknown table {}, expected one of {}".format(table, TABLES))
+        for run_id in self.select(**filters)["RunId"]:
+            path = columnar.frame_path(os.path.join(self.partition(run_id), table))
+            if path is None:
+                continue
+            df = columnar.read_frame(path, columns=columns)
+            if "RunId" not in df.columns:
+                df.insert(0, "RunId", run_id)
+            yield df
+
+    def load(
+        self, table: str = "agents", columns: Optional[List[str]] = None, **filters
+    ) -> pd.DataFrame:
+        """Concatenation of iter_runs; filter first, so only what is needed is held in memory"""
+        frames = list(self.iter_runs(table, columns, **filters))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
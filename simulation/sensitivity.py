@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from model import LifelyPayModel, total
+from simulation.result_cache import source_version
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+OUTPUTS = ["# Emergency Triggers", "Total Asset Value USD", "Staker APY"]
+
+
+@dataclass(frozen=True)
+class ParameterRange:
+    name: str  # attribute name on ParamsSnapshot
+    low: float
+    high: float
+    integer: bool = False
+
+    def scale(self, u: np.ndarray) -> np.ndarray:
+        """Map unit-interval samples onto [low, high] (rounded for integer parameters)"""
+        if self.integer:
+            return np.floor(self.low + u * (self.high - self.low + 1)).clip(
+                self.low, self.high
+            )
+        return self.low + u * (self.high - self.low)
+
+
+# only parameters the model reads: danger_threshold is not one, the emergency trigger is fixed by the liquidation spread
+DEFAULT_RANGES = [
+    ParameterRange("tolerance", 0.05, 0.4),
+    ParameterRange("content", 0.45, 0.9),
+    ParameterRange("liquidation_spread", 0.0, 0.2),
+    ParameterRange("n_floors", 2, 8, integer=True),
+    ParameterRange("tx_fee_rate", 0.0, 0.05),
+]
+
+
+def latin_hypercube(n: int, d: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    One sample in every 1/n stratum of every dimension, with strata paired at random.
+    The strata depend on n, so the design is redrawn whenever n changes.
+    """
+    strata = np.argsort(rng.random((n, d)), axis=0)
+    return (strata + rng.random((n, d))) / n
+
+
+def primes(d: int) -> List[int]:
+    """The first d primes"""
+    found = []
+    candidate = 2
+    while len(found) < d:
+        if all(candidate % p for p in found):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+
+def halton(n: int, d: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Halton sequence with randomly permuted digits, one permutation per base.
+    Row i depends only on i, so the first n rows are the same for any larger n.
+    """
+    out = np.empty((n, d))
+    for j, base in enumerate(primes(d)):
+        # 0 stays 0, so the trailing zeros of every index contribute nothing
+        perm = np.concatenate([[0], 1 + rng.permutation(base - 1)])
+        k = np.arange(1, n + 1)  # skip index 0, the origin
+        scale = 1.0
+        x = np.zeros(n)
+        while k.any():
+            scale /= base
+            x += scale * perm[k % base]
+            k //= base
+        out[:, j] = x
+    return out
+
+
+def sobol(n: int, d: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Scrambled Sobol sequence when scipy is available, otherwise a scrambled Halton sequence.
+    Both are prefix-stable: the first n rows are the same for any larger n.
+    """
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        logger.warning("scipy not installed, using a Halton sequence instead of Sobol")
+        return halton(n, d, rng)
+    seed = int(rng.integers(2**32))
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+
+SAMPLERS = {"sobol": sobol, "halton": halton, "lhs": latin_hypercube}
+
+
+def saltelli_matrices(
+    n_base: int, ranges: List[ParameterRange], method: str, seed: int
+) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    """
+    Base matrices A and B, and for each parameter i the matrix AB_i (A with column i taken from B).
+    Evaluating all of them costs n_base * (d + 2) model runs.
+    """
+    d = len(ranges)
+    u = SAMPLERS[method](n_base, 2 * d, np.random.default_rng(seed))
+    scaled = np.column_stack([r.scale(u[:, i]) for i, r in enumerate(ranges * 2)])
+    a, b = scaled[:, :d], scaled[:, d:]
+    ab = []
+    for i in range(d):
+        ab_i = a.copy()
+        ab_i[:, i] = b[:, i]
+        ab.append(ab_i)
+    return a, b, ab
+
+
+def sobol_indices(
+    f_a: np.ndarray, f_b: np.ndarray, f_ab: List[np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    First-order (Saltelli 2010) and total-order (Jansen) indices for a single output.
+
+    :return: (S1, ST), one entry per parameter
+    """
+    var = np.var(np.concatenate([f_a, f_b]))
+    if var == 0:
+        return np.zeros(len(f_ab)), np.zeros(len(f_ab))
+    s1 = np.array([np.mean(f_b * (f_ab_i - f_a)) / var for f_ab_i in f_ab])
+    st = np.array([0.5 * np.mean((f_a - f_ab_i) ** 2) / var for f_ab_i in f_ab])
+    return s1, st
+
+
+def summarize(model) -> Dict[str, float]:
+    """Scalar outputs of a finished run, matching the model reporters where one exists"""
+    staked = [p for p in model.providers if not p.staked_usd.is_zero()]
+    apy = sum(p.apy for p in staked) / len(staked) if staked else Decimal(0)
+    return {
+        "# Emergency Triggers": float(model.router.num_triggered),
+        "Total Asset Value USD": float(total(model)),
+        "Staker APY": float(apy),
+    }
+
+
+def evaluate(task: Tuple[Dict[str, float], int, int, int]) -> Dict[str, float]:
+    """
+    Run a single model configuration. Module-level so it can be sent to worker processes.
+    A run that raises yields NaN outputs and the error, instead of aborting the whole design.
+
+    :param task: (parameter values, n, max_steps, seed)
+    """
+    values, n, max_steps, seed = task
+    Params.hard_reset()
+    try:
+        Params.update(**{name: Decimal(str(val)) for name, val in values.items()})
+        model = LifelyPayModel(n, seed=seed)
+        while model.running and model.schedule.steps < max_steps:
+            model.step()
+        result = summarize(model)
+    except Exception as e:
+        logger.warning("Sensitivity sample {} failed: {!r}".format(values, e))
+        result = {output: float("nan") for output in OUTPUTS}
+        result["error"] = repr(e)
+    finally:
+        Params.hard_reset()
+    return result
+
+
+class SampleCache:
+    """
+    One small JSON file per evaluated sample, keyed by everything that determines the run,
+    including the version of the simulation source
+    """
+
+    def __init__(self, root: str):
+        self._root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(task) -> str:
+        return hashlib.sha1(
+            json.dumps([source_version(), task], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, task) -> Optional[Dict[str, float]]:
+        path = os.path.join(self._root, self.key(task) + ".json")
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            return json.load(f)
+
+    def put(self, task, result: Dict[str, float]) -> None:
+        path = os.path.join(self._root, self.key(task) + ".json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+
+class SensitivityAnalysis:
+    def __init__(
+        self,
+        ranges: List[ParameterRange] = None,
+        n: int = 50,
+        max_steps: int = 300,
+        seed: int = 0,
+        cache_dir: str = "sensitivity_cache",
+        processes: Optional[int] = None,
+    ):
+        """
+        :param ranges: parameters to vary; every other parameter stays at its default
+        :param n: agents per side for every model run
+        :param max_steps: step limit for every model run
+        :param seed: seeds the sampler, and every model run (common random numbers across samples)
+        :param cache_dir: where sample-level results are cached
+        :param processes: worker processes, defaults to all CPUs
+        """
+        self._ranges = ranges or DEFAULT_RANGES
+        self._n = n
+        self._max_steps = max_steps
+        self._seed = seed
+        self._cache = SampleCache(cache_dir)
+        self._processes = processes
+
+    def run(
+        self, n_base: int, method: str = "sobol"
+    ) -> Dict[str, Dict[str, Tuple[float, float]]]:
+        """
+        Evaluate the Saltelli design and compute sensitivity indices.
+        Samples already in the cache are not re-run. The sequence designs ("sobol", "halton") are prefix-stable,
+        so increasing n_base only pays for the new rows; a Latin hypercube is redrawn for every n_base.
+
+        :param n_base: rows per base matrix
+        :param method: "sobol", "halton" or "lhs"
+        :return: output name -> parameter name -> (first-order, total-order)
+        """
+        a, b, ab = saltelli_matrices(n_base, self._ranges, method, self._seed)
+        matrices = [a, b] + ab
+        rows = np.concatenate(matrices)
+        results = self.evaluate_all(rows)
+
+        indices = {}
+        for output in OUTPUTS:
+            f = np.array([r[output] for r in results]).reshape(len(matrices), n_base)
+            s1, st = sobol_indices(f[0], f[1], list(f[2:]))
+            indices[output] = {
+                r.name: (float(s1[i]), float(st[i])) for i, r in enumerate(self._ranges)
+            }
+        return indices
+
+    def evaluate_all(self, rows: np.ndarray) -> List[Dict[str, float]]:
+        tasks = [
+            (
+                {
+                    r.name: int(v) if r.integer else float(v)
+                    for r, v in zip(self._ranges, row)
+                },
+                self._n,
+                self._max_steps,
+                self._seed,
+            )
+            for row in rows
+        ]
+        results = [self._cache.get(t) for t in tasks]
+        missing = [i for i, r in enumerate(results) if r is None]
+        logger.info(
+            "Sensitivity: {} samples, {} cached, {} to run".format(
+                len(tasks), len(tasks) - len(missing), len(missing)
+            )
+        )
+        if not missing:
+            return results
+        with ProcessPoolExecutor(self._processes) as executor:
+            computed = executor.map(evaluate, [tasks[i] for i in missing])
+            for i, result in zip(missing, computed):
+                # failures are not cached, so they are retried on the next run
+                if "error" not in result:
+                    self._cache.put(tasks[i], result)
+                results[i] = result
+        failed = sum("error" in r for r in results)
+        if failed:
+            logger.warning("Sensitivity: {} of {} samples failed".format(failed, len(tasks)))
+        return results
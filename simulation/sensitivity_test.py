@@ -0,0 +1,64 @@
+import math
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from simulation import sensitivity
+from simulation.sensitivity import ParameterRange, SampleCache
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class TestSensitivity(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+        Params.hard_reset()
+
+    def test_sequences_are_prefix_stable(self):
+        for method in ("sobol", "halton"):
+            short = sensitivity.SAMPLERS[method](8, 4, np.random.default_rng(3))
+            long = sensitivity.SAMPLERS[method](32, 4, np.random.default_rng(3))
+            np.testing.assert_array_equal(long[:8], short)
+            self.assertTrue(((long > 0) & (long < 1)).all())
+        logger.test("#test_sequences_are_prefix_stable()")
+
+    def test_integer_range_covers_both_ends(self):
+        scaled = ParameterRange("n_floors", 2, 8, integer=True).scale(np.linspace(0, 1, 100))
+        self.assertEqual(set(scaled), set(range(2, 9)))
+        logger.test("#test_integer_range_covers_both_ends()")
+
+    def test_indices_of_additive_function(self):
+        ranges = [ParameterRange("x1", 0.0, 1.0), ParameterRange("x2", 0.0, 1.0)]
+        a, b, ab = sensitivity.saltelli_matrices(4096, ranges, "halton", seed=0)
+        f = lambda x: 4 * x[:, 0] + x[:, 1]
+        s1, st = sensitivity.sobol_indices(f(a), f(b), [f(ab_i) for ab_i in ab])
+        # variances 16/12 and 1/12
+        np.testing.assert_allclose(s1, [16 / 17, 1 / 17], atol=0.03)
+        np.testing.assert_allclose(st, [16 / 17, 1 / 17], atol=0.03)
+        logger.test("#test_indices_of_additive_function()")
+
+    def test_failed_sample_yields_nan(self):
+        result = sensitivity.evaluate(({"no_such_parameter": 1.0}, 2, 1, 0))
+        self.assertTrue(all(math.isnan(result[output]) for output in sensitivity.OUTPUTS))
+        self.assertIn("no_such_parameter", result["error"])
+        logger.test("#test_failed_sample_yields_nan()")
+
+    def test_sample_cache_round_trip(self):
+        cache = SampleCache(self.root)
+        task = ({"tolerance": 0.2}, 2, 10, 0)
+        self.assertIsNone(cache.get(task))
+        cache.put(task, {"Staker APY": 0.1})
+        self.assertEqual(cache.get(task), {"Staker APY": 0.1})
+        self.assertIsNone(cache.get(({"tolerance": 0.3}, 2, 10, 0)))
+        logger.test("#test_sample_cache_round_trip()")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import multiprocessing
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from agents.oracle import Oracle
+from model import LifelyPayModel
+from simulation import columnar
+from states.params import Params, ParamsSnapshot
+
+
+def shard_state(model: LifelyPayModel) -> Dict[str, Any]:
+    """Aggregate state a shard exposes to the coordinator at every step barrier"""
+    _, sa, fee = model.router.pool_balances()
+    return {
+        "sa": sa,
+        "fee": fee,
+        "va_usd": model.router.va_pool_value_usd(),
+        "principal": model.router.principal,
+        "warning": model.router.warning,
+        "triggered": model.router.num_triggered,
+        "running": model.running,
+    }
+
+
+def _shard_worker(conn, model_kwargs: Dict[str, Any], params: ParamsSnapshot):
+    """
+    Owns one deployment (Router + agent population) for the whole simulation.
+    Commands arrive over the pipe:
+        ("step", price, transfer_sa) -> set the oracle price, apply the bridge transfer, step, reply with shard_state
+        ("collect",)                 -> reply with (model vars, agent vars) as storable frames
+        ("close",)                   -> exit
+    """
+    Params.update(**{k: v for k, v in vars(params).items() if k != "version"})
+    model = LifelyPayModel(**model_kwargs)
+    conn.send(shard_state(model))
+    while True:
+        command = conn.recv()
+        if command[0] == "step":
+            _, price, transfer_sa = command
+            if price is not None:
+                Oracle.set_price(price)
+            if transfer_sa:
+                model.router.bridge_liquidity(transfer_sa)
+            if model.running:
+                model.step()
+            conn.send(shard_state(model))
+        elif command[0] == "collect":
+            model_df = model.datacollector.get_model_vars_dataframe()
+            model_df.index = pd.RangeIndex(1, len(model_df) + 1, name="Step")
+            conn.send(
+                (
+                    columnar.to_columns(model_df),
+                    columnar.to_columns(model.datacollector.get_agent_vars_dataframe()),
+                )
+            )
+        else:
+            conn.close()
+            return
+
+
+class LiquidityBridge:
+    """
+    Default cross-shard policy: shards whose SA pool fell below tolerance * principal
+    are refilled up to content * principal, from shards holding more than content * principal.
+    Transfers always sum to zero.
+    """
+
+    def __init__(self, tolerance: Decimal = None, content: Decimal = None):
+        self._tolerance = tolerance
+        self._content = content
+
+    def __call__(self, states: List[Dict[str, Any]]) -> List[Decimal]:
+        params = Params.snapshot()
+        tolerance = self._tolerance or params.tolerance
+        content = self._content or params.content
+
+        needs = [
+            content * s["principal"] - s["sa"]
+            if s["sa"] < tolerance * s["principal"]
+            else Decimal(0)
+            for s in states
+        ]
+        excess = [max(s["sa"] - content * s["principal"], Decimal(0)) for s in states]
+        total_need, total_excess = sum(needs), sum(excess)
+        if total_need.is_zero() or total_excess.is_zero():
+            return [Decimal(0)] * len(states)
+
+        moved = min(total_need, total_excess)
+        return [
+            moved * need / total_need - moved * exc / total_excess
+            for need, exc in zip(needs, excess)
+        ]
+
+
+class ShardedSimulation:
+    """
+    K independent deployments, each a LifelyPayModel in its own worker process.
+    Shards only meet at step barriers, where the coordinator broadcasts the price and the bridge transfers
+    computed from every shard's aggregate state; everything else is stepped in parallel.
+    """
+
+    def __init__(
+        self,
+        shards: Sequence[Dict[str, Any]],
+        price_path: Optional[Sequence] = None,
+        bridge=None,
+    ):
+        """
+        :param shards: LifelyPayModel arguments per shard (give each its own seed)
+        :param price_path: ETH price per step, shared by every shard
+        :param bridge: callable mapping the list of shard states to SA transfers per shard; None disables transfers
+        """
+        self._price_path = price_path
+        self._bridge = bridge
+        self._conns = []
+        self._processes = []
+        self.states: List[Dict[str, Any]] = []
+        self.transfers: List[List[Decimal]] = []
+
+        params = Params.snapshot()
+        for kwargs in shards:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_shard_worker, args=(child, kwargs, params), daemon=True
+            )
+            process.start()
+            self._conns.append(parent)
+            self._processes.append(process)
+        self.states = [conn.recv() for conn in self._conns]
+
+    def step(self) -> List[Dict[str, Any]]:
+        t = len(self.transfers)
+        price = None
+        if self._price_path is not None and t < len(self._price_path):
+            price = Decimal(str(self._price_path[t]))
+        transfers = (
+            self._bridge(self.states) if self._bridge else [Decimal(0)] * len(self._conns)
+        )
+        for conn, transfer in zip(self._conns, transfers):
+            conn.send(("step", price, transfer))
+        # barrier: every shard must finish the step before the next one starts
+        self.states = [conn.recv() for conn in self._conns]
+        self.transfers.append(transfers)
+        return self.states
+
+    def run(self, steps: int) -> None:
+        for _ in range(steps):
+            self.step()
+            if not any(s["running"] for s in self.states):
+                break
+
+    def collect(self) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        :return: (model vars with a Shard column, agent vars with a Shard column,
+            protocol-wide totals per Step summed over shards)
+        """
+        for conn in self._conns:
+            conn.send(("collect",))
+        model_frames, agent_frames = [], []
+        for shard, conn in enumerate(self._conns):
+            model_df, agent_df = conn.recv()
+            model_frames.append(model_df.assign(Shard=shard))
+            agent_frames.append(agent_df.assign(Shard=shard))
+        model_df = pd.concat(model_frames, ignore_index=True)
+        agent_df = pd.concat(agent_frames, ignore_index=True)
+
+        summed = [
+            "USDC Pool Balance USD",
+            "ETH Pool Balance USD",
+            "Fee Pool Balance USDC",
+            "Total Asset Value USD",
+            "# Emergency Triggers",
+            "# Pool Rebalancing",
+        ]
+        totals = model_df.groupby("Step")[summed].sum()
+        totals["Bridged USD"] = pd.Series(
+            [float(sum(t for t in transfers if t > 0)) for transfers in self.transfers],
+            index=range(1, len(self.transfers) + 1),
+        )
+        return model_df, agent_df, totals
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.send(("close",))
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
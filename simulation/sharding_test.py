@@ -0,0 +1,54 @@
+import unittest
+from decimal import Decimal
+
+from simulation.sharding import LiquidityBridge, ShardedSimulation
+from states.params import Params
+from utils import processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+def state(sa, principal=1000):
+    return {"sa": Decimal(sa), "principal": Decimal(principal)}
+
+
+class TestLiquidityBridge(unittest.TestCase):
+    def setUp(self):
+        Params.hard_reset()
+        self.bridge = LiquidityBridge(tolerance=Decimal("0.2"), content=Decimal("0.5"))
+
+    def test_short_shard_is_refilled_to_content(self):
+        transfers = self.bridge([state(100), state(900)])
+        self.assertEqual(transfers, [400, -400])
+        logger.test("#test_short_shard_is_refilled_to_content()")
+
+    def test_transfers_are_limited_by_excess(self):
+        transfers = self.bridge([state(100), state(150), state(600)])
+        self.assertEqual(transfers[2], -100)
+        # the 100 in excess is shared by need: 400 and 350
+        self.assertEqual(transfers[0], Decimal(100) * 400 / 750)
+        self.assertEqual(transfers[1], Decimal(100) * 350 / 750)
+        logger.test("#test_transfers_are_limited_by_excess()")
+
+    def test_no_transfer_above_tolerance(self):
+        self.assertEqual(self.bridge([state(300), state(900)]), [0, 0])
+        self.assertEqual(self.bridge([state(100), state(400)]), [0, 0])
+        logger.test("#test_no_transfer_above_tolerance()")
+
+
+class TestShardedSimulation(unittest.TestCase):
+    def test_shards_step_in_lockstep(self):
+        shards = [{"n": 2, "seed": seed, "stopping_rules": []} for seed in range(2)]
+        with ShardedSimulation(shards, price_path=[1337, 1400, 1300], bridge=LiquidityBridge()) as sim:
+            sim.run(3)
+            model_df, agent_df, totals = sim.collect()
+        self.assertEqual(len(sim.transfers), 3)
+        self.assertTrue(all(sum(t) == 0 for t in sim.transfers))
+        self.assertEqual(sorted(model_df["Shard"].unique()), [0, 1])
+        self.assertEqual(list(totals.index), [1, 2, 3])
+        self.assertEqual(list(model_df[model_df["Step"] == 2]["ETH Prices"]), [1400, 1400])
+        logger.test("#test_shards_step_in_lockstep()")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+from abc import ABCMeta, abstractmethod
+from typing import List, Optional, Tuple
+from decimal import Decimal
+
+
+class StoppingRule(metaclass=ABCMeta):
+    """
+    Evaluated by the model at the end of every step.
+    Rules are stateful (consecutive step counters), so each model run must own its own instances.
+    Rules are part of a run's cache key, so their repr must only show their configuration.
+    """
+
+    @abstractmethod
+    def check(self, model) -> Optional[str]:
+        """
+        :param model: model after the step has been collected
+        :return: reason for stopping, or None to keep running
+        """
+        pass
+
+
+class PersistentWarning(StoppingRule):
+    """
+    Stop once the balance tracker has stayed in WARNING state for `patience` consecutive steps.
+    Warning state turns off only after the mandatory count, so a long streak means the protocol cannot recover.
+    """
+
+    def __init__(self, patience: int = 50):
+        self._patience = patience
+        self._streak = 0
+
+    def __repr__(self):
+        return "PersistentWarning(patience={})".format(self._patience)
+
+    def check(self, model):
+        self._streak = self._streak + 1 if model.router.warning else 0
+        if self._streak >= self._patience:
+            return "Persistent Warning ({} steps)".format(self._streak)
+        return
+
+
+class SteadyState(StoppingRule):
+    """
+    Stop once every buyer reached its buying cap and pool balances have not changed for `patience` steps.
+    Buyers are only scanned until the first one below cap is found, and are not scanned again once all are capped.
+    """
+
+    def __init__(self, patience: int = 10):
+        self._patience = patience
+        self._all_capped = False
+        self._last_balances: Optional[Tuple[Decimal, ...]] = None
+        self._streak = 0
+
+    def __repr__(self):
+        return "SteadyState(patience={})".format(self._patience)
+
+    def check(self, model):
+        if not self._all_capped:
+            self._all_capped = all(b.reached_buying_cap() for b in model.buyers)
+            if not self._all_capped:
+                return
+
+        balances = model.router.pool_balances()
+        self._streak = self._streak + 1 if balances == self._last_balances else 0
+        self._last_balances = balances
+        if self._streak >= self._patience:
+            return "Steady State ({} steps)".format(self._streak)
+        return
+
+
+def default_stopping_rules() -> List[StoppingRule]:
+    return [PersistentWarning(), SteadyState()]
@@ -0,0 +1,183 @@
+import itertools
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import pandas as pd
+
+from simulation.result_cache import ResultCache, run_cached, run_key
+from simulation.result_store import ResultStore
+from states.params import Params, ParamsSnapshot
+
+
+def make_runs(
+    parameters: Mapping[str, Union[Any, Iterable[Any]]], iterations: int
+) -> List[Tuple[int, int, Dict[str, Any]]]:
+    """
+    Same expansion as mesa.batch_run: every combination of the given values, once per iteration.
+    Unless the parameters fix a seed, each iteration is seeded with its own index, so sweeps are reproducible.
+    """
+    values = []
+    for name, vals in parameters.items():
+        if isinstance(vals, str) or not isinstance(vals, Iterable):
+            vals = [vals]
+        values.append([(name, v) for v in vals])
+
+    runs = []
+    for iteration in range(iterations):
+        for combination in itertools.product(*values):
+            kwargs = dict(combination)
+            kwargs.setdefault("seed", iteration)
+            runs.append((len(runs), iteration, kwargs))
+    return runs
+
+
+def scalar_arguments(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Arguments recorded alongside results; long ones such as price paths are left out"""
+    return {
+        name: val
+        for name, val in kwargs.items()
+        if isinstance(val, (int, float, str)) or val is None
+    }
+
+
+def sweep_run_key(
+    run: Tuple[int, int, Dict[str, Any]], max_steps: int, params: ParamsSnapshot
+) -> str:
+    """The run's result cache key: arguments, Params, step limit and source version"""
+    _, _, kwargs = run
+    model_kwargs = {k: v for k, v in kwargs.items() if k not in ("seed", "price_path")}
+    return run_key(params, kwargs.get("seed"), kwargs.get("price_path"), max_steps, **model_kwargs)
+
+
+def _simulate(
+    run: Tuple[int, int, Dict[str, Any]],
+    max_steps: int,
+    params: ParamsSnapshot,
+    cache: Optional[ResultCache],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    run_id, iteration, kwargs = run
+    # workers do not share the parent's Params
+    Params.update(
+        **{name: val for name, val in vars(params).items() if name != "version"}
+    )
+    model_df, agent_df = run_cached(max_steps=max_steps, cache=cache, **kwargs)
+
+    rows = agent_df.reset_index().merge(model_df.reset_index(), on="Step")
+    rows.insert(0, "RunId", run_id)
+    rows.insert(1, "iteration", iteration)
+    for i, (name, val) in enumerate(scalar_arguments(kwargs).items()):
+        rows.insert(2 + i, name, val)
+    return model_df, rows
+
+
+def run_one(
+    run: Tuple[int, int, Dict[str, Any]],
+    max_steps: int,
+    params: ParamsSnapshot,
+    cache: Optional[ResultCache],
+) -> pd.DataFrame:
+    """
+    Run (or load) a single configuration and flatten it into batch_run style rows:
+    one row per agent per step, with the run's identifiers, scalar arguments and model vars.
+    """
+    return _simulate(run, max_steps, params, cache)[1]
+
+
+def stream_one(
+    run: Tuple[int, int, Dict[str, Any]],
+    max_steps: int,
+    params: ParamsSnapshot,
+    cache: Optional[ResultCache],
+    store: ResultStore,
+) -> Dict[str, Any]:
+    """
+    Like run_one, but the rows go straight to the run's partition in the store instead of back to the caller.
+
+    :return: the run's index entry, with its key, so a resumed sweep can tell whether the run is the same
+    """
+    run_id, iteration, kwargs = run
+    model_df, rows = _simulate(run, max_steps, params, cache)
+    counts = store.write_run(run_id, model_df, rows)
+    return {
+        "RunId": run_id,
+        "RunKey": sweep_run_key(run, max_steps, params),
+        "iteration": iteration,
+        **scalar_arguments(kwargs),
+        **counts,
+    }
+
+
+def _run_star(args):
+    return run_one(*args)
+
+
+def _stream_star(args):
+    return stream_one(*args)
+
+
+def run_sweep(
+    parameters: Mapping[str, Union[Any, Iterable[Any]]],
+    iterations: int = 1,
+    max_steps: int = 300,
+    processes: Optional[int] = 1,
+    cache: Optional[ResultCache] = None,
+    store: Optional[ResultStore] = None,
+) -> Union[pd.DataFrame, ResultStore]:
+    """
+    Drop-in for mesa.batch_run (with data_collection_period=1) that checks the result cache before simulating.
+
+    :param parameters: LifelyPayModel arguments; iterables are swept (wrap iterable arguments such as price_path in a list)
+    :param processes: worker processes; None uses all CPUs
+    :param cache: result cache, or None to always simulate
+    :param store: stream every run to this store as soon as it finishes, instead of returning one DataFrame;
+        the store is returned, read it back with store.load / store.iter_runs
+    """
+    runs = make_runs(parameters, iterations)
+    if store is not None:
+        return stream_sweep(runs, max_steps, processes, cache, store)
+    tasks = [(run, max_steps, Params.snapshot(), cache) for run in runs]
+    if processes == 1:
+        frames = [_run_star(t) for t in tasks]
+    else:
+        with Pool(processes) as pool:
+            frames = pool.map(_run_star, tasks)
+    return pd.concat(frames, ignore_index=True)
+
+
+def stream_sweep(
+    runs: List[Tuple[int, int, Dict[str, Any]]],
+    max_steps: int,
+    processes: Optional[int],
+    cache: Optional[ResultCache],
+    store: ResultStore,
+) -> ResultStore:
+    """
+    Workers write their own partitions and only send back the index entry,
+    so neither the workers nor the parent ever hold more than one run's rows.
+    Runs already in the store's index are skipped, so an interrupted sweep can be resumed.
+    A store holding any run this sweep would not reproduce exactly (other arguments, Params or source) is refused,
+    rather than mixing or returning results of another sweep.
+    """
+    params = Params.snapshot()
+    keys = {run[0]: sweep_run_key(run, max_steps, params) for run in runs}
+    index = store.index()
+    stored = index["RunKey"] if "RunKey" in index.columns else [None] * len(index)
+    foreign = [
+        int(run_id) for run_id, key in zip(index["RunId"], stored) if keys.get(run_id) != key
+    ]
+    if foreign:
+        raise ValueError(
+            "{} holds runs of a different sweep (RunId {}); stream this sweep to a new store".format(
+                store.root, ", ".join(str(run_id) for run_id in foreign[:10])
+            )
+        )
+    done = set(index["RunId"])
+    tasks = [(run, max_steps, params, cache, store) for run in runs if run[0] not in done]
+    if processes == 1:
+        for task in tasks:
+            store.add_to_index(_stream_star(task))
+    else:
+        with Pool(processes) as pool:
+            for entry in pool.imap_unordered(_stream_star, tasks):
+                store.add_to_index(entry)
+    return store
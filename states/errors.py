@@ -45,3 +45,10 @@ class PoolNotInitializedError(Exception):
         message = 'NOT INITIALIZED: {} Pool Not Initialized. Protocol must inject liquidity first'.format(pool_type)
         logger.critical(message)
         super().__init__(message)
+
+
+class IncrementalStateMismatchError(Exception):
+    def __init__(self, name, incremental, recomputed):
+        message = 'STATE MISMATCH: Incremental {} is {}, but recomputing gives {}'.format(name, incremental, recomputed)
+        logger.critical(message)
+        super().__init__(message)
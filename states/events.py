@@ -163,6 +163,18 @@ class Events:
                     cause, *tokens.decompose()
                 )
 
+        class NettedLiquidations(EventBusI):
+            @staticmethod
+            def fmt(gross: int, net: int):
+                return "Netted {} Liquidations into {}".format(gross, net)
+
+        class BlockProduced(EventBusI):
+            @staticmethod
+            def fmt(number: int, included: int, pending: int):
+                return "Block #{}: {} Requests Included, {} Pending".format(
+                    number, included, pending
+                )
+
     class Balancer:
         class TriggerEmergencyProtocol(EventBusI):
             @staticmethod
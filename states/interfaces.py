@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Tuple, Dict, Set, Optional
+from typing import Tuple, Dict, List, Sequence, Set, Optional
 from decimal import Decimal
 
 
@@ -37,6 +37,17 @@ class WalletI(metaclass=ABCMeta):
     def owner(self) -> str:
         pass
 
+    @property
+    @abstractmethod
+    def store(self):
+        """WalletStore the wallet is a row of"""
+        pass
+
+    @property
+    @abstractmethod
+    def row(self) -> int:
+        pass
+
     @property
     @abstractmethod
     def funds(self) -> Dict[str, Decimal]:
@@ -50,6 +61,10 @@ class WalletI(metaclass=ABCMeta):
     def sends(self, tokens: TokenI) -> None:
         pass
 
+    @abstractmethod
+    def refund(self, tokens: TokenI) -> None:
+        pass
+
     @abstractmethod
     def balance_of(self, denom: str) -> Decimal:
         pass
@@ -60,6 +75,10 @@ class BuyerWalletI(WalletI):
     def redeemable_balance(self, cur_price: Decimal) -> Optional[TokenI]:
         pass
 
+    @abstractmethod
+    def cheapest_voucher_price(self) -> Optional[Decimal]:
+        pass
+
 
 class EventBusI(metaclass=ABCMeta):
     @abstractmethod
@@ -96,6 +115,14 @@ class AgentI(metaclass=ABCMeta):
         pass
 
 
+class PoolObserverI(metaclass=ABCMeta):
+    @abstractmethod
+    def on_balance_change(
+        self, pool: "PoolI", delta_balance: Decimal, delta_principal: Decimal
+    ) -> None:
+        pass
+
+
 class PoolI(metaclass=ABCMeta):
     @property
     @abstractmethod
@@ -116,16 +143,28 @@ class PoolI(metaclass=ABCMeta):
     def deposit(self, tokens: TokenI, protocol_injected=False) -> TokenI:
         pass
 
+    @abstractmethod
+    def try_withdraw(self, tokens: TokenI) -> Decimal:
+        pass
+
     @abstractmethod
     def withdraw(self, tokens: TokenI) -> Tuple[TokenI, Optional[Exception]]:
         pass
 
+    @abstractmethod
+    def try_redeem_to(self, recipient: AgentI, tokens: TokenI) -> Decimal:
+        pass
+
     @abstractmethod
     def redeem_to(
         self, recipient: AgentI, tokens: TokenI
     ) -> Tuple[TokenI, Optional[Exception]]:
         pass
 
+    @abstractmethod
+    def add_observer(self, observer: PoolObserverI) -> None:
+        pass
+
 
 class StablePoolI(PoolI):
     @property
@@ -160,10 +199,19 @@ class TokenContractI(metaclass=ABCMeta):
     def denoms(self) -> Set[str]:
         pass
 
+    @property
+    @abstractmethod
+    def version(self) -> int:
+        pass
+
     @abstractmethod
     def get_token_issued(self, denom: str) -> Decimal:
         pass
 
+    @abstractmethod
+    def changed_since(self, version: int) -> Optional[Set[str]]:
+        pass
+
     @abstractmethod
     def burn(self, tokens: TokenI) -> TokenI:
         pass
@@ -173,10 +221,16 @@ class TokenContractI(metaclass=ABCMeta):
         pass
 
 
+class VoucherBucketingI(metaclass=ABCMeta):
+    @abstractmethod
+    def bucket(self, price: Decimal) -> Decimal:
+        """Label of the bucket a purchase price falls in, used in place of the price in voucher denoms"""
+        pass
+
+
 class ERCTokenContractI(TokenContractI):
-    @staticmethod
     @abstractmethod
-    def serialize_vouchers(price: Decimal) -> str:
+    def serialize_vouchers(self, price: Decimal) -> str:
         pass
 
     @staticmethod
@@ -184,6 +238,10 @@ class ERCTokenContractI(TokenContractI):
     def deserialize_vouchers(denom: str) -> Decimal:
         pass
 
+    @abstractmethod
+    def original_price(self, denom: str) -> Decimal:
+        pass
+
 
 class RouterI(metaclass=ABCMeta):
     @property
@@ -201,6 +259,16 @@ class RouterI(metaclass=ABCMeta):
     def is_accepting_liquidity(self) -> bool:
         pass
 
+    @property
+    @abstractmethod
+    def warning(self) -> bool:
+        pass
+
+    @property
+    @abstractmethod
+    def principal(self) -> Decimal:
+        pass
+
     @property
     @abstractmethod
     def va_denom(self) -> str:
@@ -230,7 +298,49 @@ class RouterI(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def dry_run_redeem_lp(self, tokens_lp: TokenI) -> Decimal:
+    def dry_run_redeem_lp(self, tokens_lp: TokenI, provider: AgentI = None) -> Decimal:
+        pass
+
+    @abstractmethod
+    def accrued_fees(self, provider: AgentI) -> Decimal:
+        pass
+
+    @abstractmethod
+    def fee_history(self, provider: AgentI) -> List[Tuple[Decimal, Decimal]]:
+        pass
+
+    @abstractmethod
+    def va_pool_value_usd(self) -> Decimal:
+        pass
+
+    @abstractmethod
+    def total_asset_value_usd(self) -> Decimal:
+        pass
+
+    @abstractmethod
+    def bridge_liquidity(self, amount_sa: Decimal) -> None:
+        pass
+
+    @abstractmethod
+    def rebalance(self) -> None:
+        pass
+
+    @abstractmethod
+    def settle_liquidations(self) -> None:
+        pass
+
+    @abstractmethod
+    def pool_balances(self) -> Tuple[Decimal, Decimal, Decimal]:
+        pass
+
+    @abstractmethod
+    def quote_redeem_all(
+        self, buyers: Sequence[AgentI] = ()
+    ) -> Tuple[List[str], Sequence[Decimal], Sequence[Decimal]]:
+        pass
+
+    @abstractmethod
+    def original_price(self, vc_denom: str) -> Decimal:
         pass
 
 
@@ -251,3 +361,11 @@ class BalanceTrackerI(metaclass=ABCMeta):
     @abstractmethod
     def target_va_pool_value_usd(self) -> Decimal:
         pass
+
+    @abstractmethod
+    def total_asset_value_usd(self) -> Decimal:
+        pass
+
+    @abstractmethod
+    def for_asset(self, denom: str) -> "BalanceTrackerI":
+        pass
@@ -1,3 +1,5 @@
+import weakref
+from dataclasses import dataclass
 from decimal import Decimal
 
 from utils import processlogger
@@ -6,6 +8,28 @@ from states import events
 logger = processlogger.ProcessLogger()
 
 
+@dataclass(frozen=True)
+class ParamsSnapshot:
+    """
+    Immutable view of every parameter at a given version.
+    Hot paths bind a snapshot and read plain attributes, instead of going through the Params getters.
+    """
+
+    tolerance: Decimal
+    content: Decimal
+    tx_fee_rate: Decimal
+    op_premium: Decimal
+    danger_threshold: Decimal
+    safety_floor: Decimal
+    n_floors: Decimal
+    safety_premium: Decimal
+    redeem_cap: Decimal
+    liquidation_spread: Decimal
+    buy_cap: Decimal
+    stake_cap: Decimal
+    version: int
+
+
 class Params:
     _tolerance = Decimal("0.2")
     _content = Decimal("0.6")
@@ -30,130 +54,169 @@ class Params:
     _buy_cap = Decimal(50)  # ETH
     _stake_cap = Decimal(1000000)  # USDC
 
+    _labels = {
+        "tolerance": "Tolerance",
+        "content": "Content",
+        "tx_fee_rate": "Transaction Fee",
+        "op_premium": "Refund Fee",
+        "danger_threshold": "Danger Threshold",
+        "safety_floor": "Safety Floor",
+        "n_floors": "Floor Step",
+        "safety_premium": "Safety Premium",
+        "redeem_cap": "Redeem Cap",
+        "liquidation_spread": "Liquidation Spread",
+        "buy_cap": "Buy Cap",
+        "stake_cap": "Stake Cap",
+    }
+
+    # bumped once per update, so dependents only drop their caches when something actually changed
+    _version = 0
+    _snapshot = None
+    _subscribers = []
+
+    @staticmethod
+    def version() -> int:
+        return Params._version
+
+    @staticmethod
+    def snapshot() -> ParamsSnapshot:
+        if Params._snapshot is None:
+            Params._snapshot = ParamsSnapshot(
+                **{name: getattr(Params, "_" + name) for name in Params._labels},
+                version=Params._version,
+            )
+        return Params._snapshot
+
+    @staticmethod
+    def subscribe(callback) -> None:
+        """
+        Register a bound method to be called with the new snapshot on every version bump.
+        Only a weak reference is kept, so subscribing does not keep short-lived contracts alive.
+        """
+        Params._subscribers.append(weakref.WeakMethod(callback))
+
+    @staticmethod
+    def update(**changes) -> ParamsSnapshot:
+        """
+        Explicitly change one or more parameters at once.
+        Bumps the version (and notifies subscribers) once, and only if some value actually changed.
+
+        :param changes: parameter name to new value, e.g. update(tolerance=Decimal("0.3"))
+        :return: snapshot of the resulting parameters
+        """
+        changed = False
+        for name, val in changes.items():
+            if name not in Params._labels:
+                raise AttributeError("Unknown parameter {}".format(name))
+            og_val = getattr(Params, "_" + name)
+            if og_val == val:
+                continue
+            logger.info(events.ParamChangeEvent(Params._labels[name], og_val, val))
+            setattr(Params, "_" + name, val)
+            if name == "n_floors":
+                Params._n_premiums = val
+            changed = True
+
+        if changed:
+            Params._version += 1
+            Params._snapshot = None
+            snapshot = Params.snapshot()
+            alive = []
+            for ref in Params._subscribers:
+                callback = ref()
+                if callback is not None:
+                    callback(snapshot)
+                    alive.append(ref)
+            Params._subscribers = alive
+        return Params.snapshot()
+
     @staticmethod
     def hard_reset():
-        Params.tolerance(Decimal("0.2"))
-        Params.content(Decimal("0.6"))
-        Params.tx_fee_rate(Decimal("0.02"))
-        Params.op_premium(Decimal("0.01"))
-        Params.danger_threshold(Decimal("1.15"))
-        Params.safety_floor(Decimal(3 / 4))
-        Params.n_floors(Decimal(4))
-        Params.safety_premium(Decimal(1))
-        Params.redeem_cap(Decimal(1))
-        Params.liquidation_spread(Decimal("0.10"))
-        Params.buy_cap(Decimal(50))
-        Params.stake_cap(Decimal(1000000))
+        Params.update(
+            tolerance=Decimal("0.2"),
+            content=Decimal("0.6"),
+            tx_fee_rate=Decimal("0.02"),
+            op_premium=Decimal("0.01"),
+            danger_threshold=Decimal("1.15"),
+            safety_floor=Decimal(3 / 4),
+            n_floors=Decimal(4),
+            safety_premium=Decimal(1),
+            redeem_cap=Decimal(1),
+            liquidation_spread=Decimal("0.10"),
+            buy_cap=Decimal(50),
+            stake_cap=Decimal(1000000),
+        )
 
     @staticmethod
     def buy_cap(set_val=None):
         if set_val:
-            logger.info(events.ParamChangeEvent("Buy Cap", Params._buy_cap, set_val))
-            Params._buy_cap = set_val
+            Params.update(buy_cap=set_val)
         return Params._buy_cap
 
     @staticmethod
     def stake_cap(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Stake Cap", Params._stake_cap, set_val)
-            )
-            Params._stake_cap = set_val
+            Params.update(stake_cap=set_val)
         return Params._stake_cap
 
     @staticmethod
     def content(set_val=None):
         if set_val:
-            logger.info(events.ParamChangeEvent("Content", Params._content, set_val))
-            Params._content = set_val
+            Params.update(content=set_val)
         return Params._content
 
     @staticmethod
     def tolerance(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Tolerance", Params._tolerance, set_val)
-            )
-            Params._tolerance = set_val
+            Params.update(tolerance=set_val)
         return Params._tolerance
 
     @staticmethod
     def tx_fee_rate(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Transaction Fee", Params._tx_fee_rate, set_val)
-            )
-            Params._tx_fee_rate = set_val
+            Params.update(tx_fee_rate=set_val)
         return Params._tx_fee_rate
 
     @staticmethod
     def danger_threshold(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent(
-                    "Danger Threshold", Params._danger_threshold, set_val
-                )
-            )
-            Params._danger_threshold = set_val
+            Params.update(danger_threshold=set_val)
         return Params._danger_threshold
 
     @staticmethod
     def op_premium(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Refund Fee", Params._op_premium, set_val)
-            )
-            Params._op_premium = set_val
+            Params.update(op_premium=set_val)
         return Params._op_premium
 
     @staticmethod
     def safety_floor(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Safety Floor", Params._safety_floor, set_val)
-            )
-            Params._safety_floor = set_val
+            Params.update(safety_floor=set_val)
         return Params._safety_floor
 
     @staticmethod
     def n_floors(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Floor Step", Params._n_floors, set_val)
-            )
-            Params._n_floors = set_val
-            Params._n_premiums = set_val
+            Params.update(n_floors=set_val)
         return Params._n_floors
 
     @staticmethod
     def safety_premium(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent(
-                    "Safety Premium", Params._safety_premium, set_val
-                )
-            )
-            Params._safety_premium = set_val
+            Params.update(safety_premium=set_val)
         return Params._safety_premium
 
     @staticmethod
     def redeem_cap(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent("Redeem Cap", Params._redeem_cap, set_val)
-            )
-            Params._redeem_cap = set_val
+            Params.update(redeem_cap=set_val)
         return Params._redeem_cap
 
     @staticmethod
     def liquidation_spread(set_val=None):
         if set_val:
-            logger.info(
-                events.ParamChangeEvent(
-                    "Liquidation Spread", Params._liquidation_spread, set_val
-                )
-            )
-            Params._liquidation_spread = set_val
+            Params.update(liquidation_spread=set_val)
         return Params._liquidation_spread
 
     # @staticmethod
@@ -163,3 +226,17 @@ class Params:
     #         Params._premium_step = set_val
     #         Params._floor_
     #     return Params._premium_step
+
+
+class ParamsSubscriber:
+    """
+    Binds the current snapshot as `self._params` and rebinds it on every version bump,
+    so hot paths read parameters as plain attributes.
+    """
+
+    def _bind_params(self) -> None:
+        self._params = Params.snapshot()
+        Params.subscribe(self._on_params_update)
+
+    def _on_params_update(self, snapshot: ParamsSnapshot) -> None:
+        self._params = snapshot
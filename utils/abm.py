@@ -0,0 +1,97 @@
+"""
+Schedulers extending mesa's: SampledActivation only steps the agents that act.
+"""
+import heapq
+import operator
+from typing import Any, Dict, Hashable, List, Tuple
+
+import mesa
+
+
+class SampledActivation(mesa.time.RandomActivation):
+    """
+    Steps only the agents that act, instead of every agent.
+
+    Agents decide with fair coins, e.g. a buyer redeems on heads and buys on another heads. Each step, every
+    active agent reports how many coins could lead to an action, and the scheduler draws the whole pattern of
+    heads up front: an agent with k coins acts with probability 1 - 2^-k, and only those are shuffled and stepped,
+    with their pattern. Agents that provably cannot act are parked in a dormant set keyed by a trigger (e.g. the
+    price of their asset) and a threshold, and skipped until wake() raises that trigger to the threshold.
+    Per-step cost scales with active agents, not total agents.
+
+    Agents stepped this way implement:
+        coins() -> int: coins that could lead to an action this step
+        act(heads: Tuple[bool, ...]): the step, with the outcome of those coins
+        dormant_until() -> Optional[Tuple[Hashable, value]]: trigger and threshold, if the agent cannot act before
+    """
+
+    def __init__(self, model: mesa.Model) -> None:
+        super().__init__(model)
+        self._active: Dict[int, mesa.Agent] = {}
+        # trigger -> heap of (threshold, unique_id)
+        self._dormant: Dict[Hashable, List[Tuple[Any, int]]] = {}
+
+    def add(self, agent: mesa.Agent) -> None:
+        super().add(agent)
+        self._active[agent.unique_id] = agent
+
+    def remove(self, agent: mesa.Agent) -> None:
+        super().remove(agent)
+        self._active.pop(agent.unique_id, None)
+
+    @property
+    def num_active(self) -> int:
+        return len(self._active)
+
+    def wake(self, trigger: Hashable, value: Any, reached=operator.le) -> int:
+        """
+        Wake the agents parked on trigger whose threshold has been reached.
+
+        :param reached: reached(threshold, value), by default threshold <= value
+        :return: agents woken
+        """
+        heap = self._dormant.get(trigger)
+        woken = 0
+        while heap and reached(heap[0][0], value):
+            _, unique_id = heapq.heappop(heap)
+            agent = self._agents.get(unique_id)
+            if agent is not None:
+                self._active[unique_id] = agent
+                woken += 1
+        return woken
+
+    def activate(self, agent: mesa.Agent) -> None:
+        """
+        Make a parked agent active again, for changes its trigger does not cover (e.g. it received tokens).
+        Its stale dormant entry is harmless: waking an active agent changes nothing.
+        """
+        if agent.unique_id in self._agents:
+            self._active[agent.unique_id] = agent
+
+    def _sample(self) -> List[Tuple[mesa.Agent, Tuple[bool, ...]]]:
+        rng = self.model.random
+        sampled = []
+        for unique_id in list(self._active):
+            agent = self._active[unique_id]
+            dormant = agent.dormant_until()
+            if dormant is not None:
+                trigger, threshold = dormant
+                del self._active[unique_id]
+                heapq.heappush(self._dormant.setdefault(trigger, []), (threshold, unique_id))
+                continue
+            k = agent.coins()
+            if not k:
+                continue
+            pattern = rng.getrandbits(k)
+            if pattern:
+                sampled.append((agent, tuple(bool(pattern >> i & 1) for i in range(k))))
+        return sampled
+
+    def step(self) -> None:
+        sampled = self._sample()
+        self.model.random.shuffle(sampled)
+        for agent, heads in sampled:
+            if agent.unique_id in self._agents:
+                agent.act(heads)
+        self.steps += 1
+        self.time += 1
@@ -0,0 +1,94 @@
+import unittest
+
+import mesa
+
+from utils import abm, processlogger
+
+logger = processlogger.ProcessLogger()
+
+
+class CoinAgent(mesa.Agent):
+    """Acts on every heads of its coins, and parks on ("price", threshold) while asleep is set"""
+
+    def __init__(self, unique_id, model, coins=1, asleep=None):
+        super().__init__(unique_id, model)
+        self.num_coins = coins
+        self.asleep = asleep
+        self.acted = 0
+
+    def coins(self):
+        return self.num_coins
+
+    def act(self, heads):
+        self.acted += 1
+
+    def dormant_until(self):
+        if self.asleep is None:
+            return
+        return "price", self.asleep
+
+
+class TestSampledActivation(unittest.TestCase):
+    def setUp(self):
+        self.model = mesa.Model()
+        self.model.reset_randomizer(0)
+        self.schedule = abm.SampledActivation(self.model)
+
+    def add(self, unique_id, **kwargs) -> CoinAgent:
+        agent = CoinAgent(unique_id, self.model, **kwargs)
+        self.schedule.add(agent)
+        return agent
+
+    def test_agents_act_on_heads(self):
+        agents = [self.add(i, coins=2) for i in range(200)]
+        idle = self.add(200, coins=0)
+        self.schedule.step()
+        # with two coins, an agent acts unless both are tails
+        acted = sum(a.acted for a in agents)
+        self.assertTrue(120 < acted < 180)
+        self.assertEqual(idle.acted, 0)
+        self.assertEqual(self.schedule.steps, 1)
+        logger.test("#test_agents_act_on_heads()")
+
+    def test_dormant_agents_are_parked(self):
+        sleeper = self.add(0, coins=8, asleep=1500)
+        self.add(1, coins=8)
+        self.schedule.step()
+        self.assertEqual(sleeper.acted, 0)
+        self.assertEqual(self.schedule.num_active, 1)
+        self.assertEqual(self.schedule.get_agent_count(), 2)
+        logger.test("#test_dormant_agents_are_parked()")
+
+    def test_wake_at_threshold(self):
+        low = self.add(0, coins=8, asleep=1400)
+        high = self.add(1, coins=8, asleep=1500)
+        self.schedule.step()
+        self.assertEqual(self.schedule.num_active, 0)
+
+        self.assertEqual(self.schedule.wake("price", 1399), 0)
+        self.assertEqual(self.schedule.wake("volume", 2000), 0)
+        self.assertEqual(self.schedule.wake("price", 1450), 1)
+        low.asleep = None
+        self.schedule.step()
+        self.assertEqual((low.acted, high.acted), (1, 0))
+        logger.test("#test_wake_at_threshold()")
+
+    def test_activate_and_remove(self):
+        sleeper = self.add(0, coins=8, asleep=1500)
+        self.schedule.step()
+        sleeper.asleep = None
+        self.schedule.activate(sleeper)
+        self.schedule.step()
+        self.assertEqual(sleeper.acted, 1)
+
+        # removed agents are neither stepped nor woken
+        sleeper.asleep = 1500
+        self.schedule.step()
+        self.schedule.remove(sleeper)
+        self.assertEqual(self.schedule.wake("price", 2000), 0)
+        self.assertEqual(self.schedule.num_active, 0)
+        logger.test("#test_activate_and_remove()")
+
+
+if __name__ == "__main__":
+    unittest.main()
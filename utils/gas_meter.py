@@ -0,0 +1,140 @@
+"""
+Abstract on-chain cost of router operations, for estimating what a Solidity Router would spend on gas.
+
+Contracts charge the operations a contract would perform (storage reads and writes, token transfers, mints,
+burns, loop iterations) as they execute. Charges are only counted inside a metered router operation, so reads
+made by agents or reporters are free, and nested operations (e.g. the rebalance poll at the end of a buy) are
+charged to the outermost one, which is the transaction that would pay for them.
+Counts are kept per step and per operation, and only converted to gas when reported, so the same run can be
+priced under several cost tables.
+"""
+from collections import Counter, defaultdict
+from functools import wraps
+from typing import Dict, Optional
+
+# rough mainnet figures; override per kind with GasMeter.enable(costs=...) or when reporting
+DEFAULT_COSTS: Dict[str, int] = {
+    "tx": 21000,  # base cost of the transaction carrying the operation
+    "sload": 2100,  # cold storage read, including prices read from the oracle contract
+    "sstore": 5000,  # write to an already set storage slot
+    "transfer": 30000,  # ERC-20 transfer into or out of the contract
+    "mint": 45000,  # ERC-20 / ERC-1155 mint: supply and balance written
+    "burn": 30000,
+    "loop": 50,  # per-iteration overhead; storage touched inside the loop is charged separately
+}
+
+
+class GasMeter:
+    enabled = False
+    costs: Dict[str, int] = dict(DEFAULT_COSTS)
+    step = 0
+
+    _operation: Optional[str] = None
+    # step -> operation -> kind -> count, where kind "tx" counts the calls
+    _counts: Dict[int, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+
+    @staticmethod
+    def enable(costs: Dict[str, int] = None) -> None:
+        """Start metering from scratch, with costs overriding DEFAULT_COSTS per kind"""
+        GasMeter.reset()
+        GasMeter.costs = {**DEFAULT_COSTS, **(costs or {})}
+        GasMeter.enabled = True
+
+    @staticmethod
+    def disable() -> None:
+        GasMeter.enabled = False
+        GasMeter._operation = None
+
+    @staticmethod
+    def reset() -> None:
+        GasMeter.step = 0
+        GasMeter._operation = None
+        GasMeter._counts = defaultdict(lambda: defaultdict(Counter))
+
+    @staticmethod
+    def charge(kind: str, n: int = 1) -> None:
+        if GasMeter._operation is None:
+            return
+        GasMeter._counts[GasMeter.step][GasMeter._operation][kind] += n
+
+    @staticmethod
+    def gas(counts: Counter, costs: Dict[str, int] = None) -> int:
+        table = {**GasMeter.costs, **(costs or {})}
+        return sum(table[kind] * n for kind, n in counts.items())
+
+    @staticmethod
+    def by_operation(costs: Dict[str, int] = None) -> Dict[str, Dict]:
+        """
+        :param costs: cost table to price the counts with, overriding the one the meter was enabled with
+        :return: per operation: calls, count of every kind, total gas and gas per call
+        """
+        counts = defaultdict(Counter)
+        for operations in GasMeter._counts.values():
+            for operation, kinds in operations.items():
+                counts[operation].update(kinds)
+        report = {}
+        for operation, kinds in counts.items():
+            gas = GasMeter.gas(kinds, costs)
+            report[operation] = {
+                "calls": kinds["tx"],
+                **kinds,
+                "gas": gas,
+                "gas_per_call": gas / kinds["tx"],
+            }
+        return report
+
+    @staticmethod
+    def step_gas(step: int, costs: Dict[str, int] = None) -> int:
+        return sum(
+            GasMeter.gas(kinds, costs) for kinds in GasMeter._counts[step].values()
+        )
+
+    @staticmethod
+    def by_step(costs: Dict[str, int] = None) -> Dict[int, int]:
+        """:return: total gas per step"""
+        return {step: GasMeter.step_gas(step, costs) for step in GasMeter._counts}
+
+    @staticmethod
+    def total(costs: Dict[str, int] = None) -> int:
+        return sum(GasMeter.by_step(costs).values())
+
+    @staticmethod
+    def to_frame(costs: Dict[str, int] = None):
+        """One row per step and operation, with the count of every kind (tx being the calls) and the gas"""
+        import pandas as pd
+
+        rows = []
+        for step, operations in GasMeter._counts.items():
+            for operation, kinds in operations.items():
+                rows.append(
+                    {
+                        "step": step,
+                        "operation": operation,
+                        **kinds,
+                        "gas": GasMeter.gas(kinds, costs),
+                    }
+                )
+        return pd.DataFrame(rows).fillna(0)
+
+
+def metered(operation: str):
+    """
+    Meter a router method as one operation (one transaction).
+    Calls made while another operation is metered are part of that operation.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not GasMeter.enabled or GasMeter._operation is not None:
+                return method(*args, **kwargs)
+            GasMeter._operation = operation
+            GasMeter.charge("tx")
+            try:
+                return method(*args, **kwargs)
+            finally:
+                GasMeter._operation = None
+
+        return wrapper
+
+    return decorator